@@ -0,0 +1,260 @@
+"""
+This file contains the 'analytic_layer_sim' class that estimates the compute report and the SRAM
+bandwidth report data of a single layer in closed form, without generating any operand, prefetch or
+demand matrices.
+"""
+
+import math
+
+from scalesim.scale_config import scale_config as cfg
+from scalesim.topology_utils import topologies as topo
+
+
+class analytic_layer_sim:
+    """
+    Class which estimates the report data for a single layer analytically. The estimates are exact
+    when the memory system does not stall, which is checked from the layer dimensions and the SRAM
+    sizes. Otherwise the layer needs to be simulated with 'single_layer_sim'.
+    """
+    #
+    def __init__(self):
+        """
+        __init__ method
+        """
+        self.layer_id = 0
+        self.dataflow = ''
+        self.topo = topo()
+        self.config = cfg()
+
+        self.verbose = True
+
+        # Spatio-temporal dimensions and array dimensions
+        self.Sr = 0
+        self.Sc = 0
+        self.T = 0
+        self.arr_row = 0
+        self.arr_col = 0
+        self.row_fold = 1
+        self.col_fold = 1
+
+        # Per fold metrics, in the same order as in the compute simulation
+        self.mapping_efficiency_per_fold = []
+        self.compute_utility_per_fold = []
+
+        # Report items : Compute report
+        self.total_cycles = 0
+        self.stall_cycles = 0
+        self.num_compute = 0
+        self.num_mac_unit = 0
+        self.overall_util = 0
+        self.mapping_eff = 0
+        self.compute_util = 0
+
+        # Report items : BW report
+        self.ifmap_sram_reads = 0
+        self.filter_sram_reads = 0
+        self.ofmap_sram_writes = 0
+        self.avg_ifmap_sram_bw = 0
+        self.avg_filter_sram_bw = 0
+        self.avg_ofmap_sram_bw = 0
+
+        # Number of elements written to the OFMAP SRAM by the array
+        self.ofmap_buffer_writes = 0
+
+        self.params_set_flag = False
+        self.runs_ready = False
+        self.stall_free = False
+
+    #
+    def set_params(self,
+                   layer_id=0,
+                   config_obj=cfg(), topology_obj=topo(),
+                   verbose=True):
+        """
+        Method to set the run parameters for housekeeping.
+        """
+        self.layer_id = layer_id
+        self.config = config_obj
+        self.topo = topology_obj
+        self.verbose = verbose
+
+        self.dataflow = self.config.get_dataflow()
+        self.Sr, self.Sc, self.T = \
+            self.topo.get_spatiotemporal_dims(layer_id=self.layer_id, df=self.dataflow)
+
+        self.arr_row, self.arr_col = self.config.get_array_dims()
+        self.num_mac_unit = self.arr_row * self.arr_col
+
+        self.row_fold = math.ceil(self.Sr / self.arr_row)
+        self.col_fold = math.ceil(self.Sc / self.arr_col)
+
+        self.params_set_flag = True
+
+    #
+    def run(self):
+        """
+        Method to estimate the report data of the layer. The number of demand lines per fold and the
+        SRAM accesses follow from the shapes of the demand matrices built by the compute
+        simulation of each dataflow.
+        """
+        assert self.params_set_flag, 'Parameters are not set. Run set_params()'
+
+        arr_row, arr_col, T = self.arr_row, self.arr_col, self.T
+        num_folds = self.row_fold * self.col_fold
+
+        if self.dataflow == 'os':
+            lines_per_fold = T + arr_row + arr_col - 2
+            cycles_per_fold = lines_per_fold
+            self.ifmap_sram_reads = self.col_fold * self.Sr * T
+            self.filter_sram_reads = self.row_fold * self.Sc * T
+            self.ofmap_buffer_writes = self.Sr * self.Sc
+            # The OS compute simulation counts the dimensions of every fold as writes as well
+            self.ofmap_sram_writes = self.ofmap_buffer_writes + num_folds * (arr_row + arr_col)
+        elif self.dataflow == 'ws':
+            lines_per_fold = 2 * arr_row + arr_col + T - 2
+            cycles_per_fold = lines_per_fold + arr_col - 1
+            self.ifmap_sram_reads = self.col_fold * self.Sr * T
+            self.filter_sram_reads = self.Sr * self.Sc
+            self.ofmap_buffer_writes = self.row_fold * self.Sc * T
+            self.ofmap_sram_writes = self.ofmap_buffer_writes
+        else:
+            lines_per_fold = 2 * arr_row + arr_col + T - 2
+            cycles_per_fold = lines_per_fold + arr_col - 1
+            self.ifmap_sram_reads = self.Sr * self.Sc
+            self.filter_sram_reads = self.col_fold * self.Sr * T
+            self.ofmap_buffer_writes = self.row_fold * self.Sc * T
+            self.ofmap_sram_writes = self.ofmap_buffer_writes
+
+        self.mapping_efficiency_per_fold = []
+        self.compute_utility_per_fold = []
+        for fc in range(self.col_fold):
+            col_used = min(arr_col, self.Sc - fc * arr_col)
+            for fr in range(self.row_fold):
+                row_used = min(arr_row, self.Sr - fr * arr_row)
+                mac_used = row_used * col_used
+
+                mapping_eff_this_fold = mac_used / (arr_row * arr_col)
+                compute_util_this_fold = (mac_used * T) / (arr_row * arr_col * cycles_per_fold)
+
+                self.mapping_efficiency_per_fold.append(mapping_eff_this_fold)
+                self.compute_utility_per_fold.append(compute_util_this_fold)
+
+        # The memory simulation reports the cycle of the last demand line
+        self.total_cycles = num_folds * lines_per_fold - 1
+        self.stall_cycles = 0
+
+        self.num_compute = self.topo.get_layer_num_ofmap_px(self.layer_id) \
+                           * self.topo.get_layer_window_size(self.layer_id)
+        self.overall_util = (self.num_compute * 100) / (self.total_cycles * self.num_mac_unit)
+        self.mapping_eff = \
+            sum(self.mapping_efficiency_per_fold) / len(self.mapping_efficiency_per_fold) * 100
+        self.compute_util = \
+            sum(self.compute_utility_per_fold) / len(self.compute_utility_per_fold) * 100
+
+        self.avg_ifmap_sram_bw = self.ifmap_sram_reads / self.total_cycles
+        self.avg_filter_sram_bw = self.filter_sram_reads / self.total_cycles
+        self.avg_ofmap_sram_bw = self.ofmap_sram_writes / self.total_cycles
+
+        self.stall_free = self.check_stall_free()
+        self.runs_ready = True
+
+    #
+    def check_stall_free(self):
+        """
+        Method to check if the memory system can serve all the demands of this layer without a
+        stall, which is when the estimates match the simulation. The checks are conservative.
+        """
+        if self.config.sparsity_support:
+            return False
+
+        # The buffers are set up the same way as in single_layer_sim
+        word_size = 1
+        active_buf_frac = 0.5
+
+        ifmap_buf_size_kb, filter_buf_size_kb, ofmap_buf_size_kb = self.config.get_mem_sizes()
+
+        if self.config.use_user_dram_bandwidth():
+            ofmap_backing_bw = self.config.get_bandwidths_as_list()[0]
+
+            # The read buffers only stall if the operands do not fit in their active buffers
+            window_size = self.topo.get_layer_window_size(self.layer_id)
+            num_ofmap_px = self.topo.get_layer_num_ofmap_px(self.layer_id) \
+                           / self.topo.get_layer_num_filters(self.layer_id)
+            ifmap_elems = int(num_ofmap_px * window_size)
+            filter_elems = window_size * self.topo.get_layer_num_filters(self.layer_id)
+
+            for buf_size_kb, num_elems in [(ifmap_buf_size_kb, ifmap_elems),
+                                           (filter_buf_size_kb, filter_elems)]:
+                total_size_elems = math.floor(1024 * buf_size_kb / word_size)
+                active_buf_size = int(math.ceil(total_size_elems * active_buf_frac))
+                elems_per_set = math.ceil(total_size_elems / 100)
+                num_lines = math.floor(num_elems / elems_per_set) + 1
+                if num_lines > math.ceil(active_buf_size / elems_per_set):
+                    return False
+        else:
+            # Reads never stall in the estimate bandwidth mode
+            ofmap_backing_bw = self.arr_col
+
+        # The OFMAP buffer stalls only when it fills up while draining. It never fills up if the
+        # whole OFMAP fits in it, or if it drains at least as fast as the array writes into it and
+        # the drain buffer can absorb a few lines of writes.
+        total_size_elems = math.floor(1024 * ofmap_buf_size_kb / word_size)
+        drain_buf_size = total_size_elems - int(math.ceil(total_size_elems * active_buf_frac))
+
+        if self.ofmap_buffer_writes < total_size_elems:
+            return True
+        if ofmap_backing_bw >= self.arr_col \
+                and drain_buf_size > 4 * (self.arr_col + ofmap_backing_bw):
+            return True
+
+        return False
+
+    #
+    def is_stall_free(self):
+        """
+        Method to know if the estimates of this layer are exact.
+        """
+        assert self.runs_ready, 'Runs are not done yet'
+        return self.stall_free
+
+    #
+    def get_layer_id(self):
+        """
+        Method to return layer id.
+        """
+        assert self.params_set_flag, 'Parameters are not set yet'
+        return self.layer_id
+
+    #
+    def get_compute_report_items(self):
+        """
+        Method to get the data for the compute report.
+        """
+        assert self.runs_ready, 'Runs are not done yet'
+
+        items = [self.total_cycles,
+                 self.stall_cycles,
+                 self.overall_util,
+                 self.mapping_eff,
+                 self.compute_util]
+        return items
+
+    #
+    def get_bandwidth_report_items(self):
+        """
+        Method to get the SRAM data for the bandwidth report. DRAM bandwidths are not estimated.
+        """
+        assert self.runs_ready, 'Runs are not done yet'
+
+        items = [self.avg_ifmap_sram_bw, self.avg_filter_sram_bw, self.avg_ofmap_sram_bw]
+        return items
+
+    #
+    def get_report_items(self):
+        """
+        Method to get the report data of this layer as a dictionary, in the same form as
+        'single_layer_sim'. Only the compute and the SRAM bandwidth items are available.
+        """
+        items = {'compute': self.get_compute_report_items(),
+                 'bandwidth': self.get_bandwidth_report_items()}
+        return items
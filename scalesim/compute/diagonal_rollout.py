@@ -0,0 +1,46 @@
+"""
+This file contains the functions to roll out the prefetch matrices along their anti-diagonals,
+shared by the systolic compute modules of all the dataflows.
+"""
+
+from functools import lru_cache
+import numpy as np
+
+
+#
+@lru_cache(maxsize=4)
+def get_anti_diagonal_order(num_rows, num_cols):
+    """
+    Function to get the order in which the elements of a num_rows x num_cols matrix are read when
+    it is rolled out along its anti-diagonals, as indices of the flattened matrix. The diagonals
+    are read in order from the top left corner, and each one from its bottom row to its top row.
+    The order is the flattened matrix skewed by one row per column, read row by row, so it is built
+    in one pass. The orders of the last few shapes are cached and returned as read only arrays.
+    """
+    num_elems = num_rows * num_cols
+    index_dtype = np.int32 if num_elems < np.iinfo(np.int32).max else np.int64
+    if num_elems == 0:
+        return np.zeros(0, dtype=index_dtype)
+
+    # Element (r, c) is at row r + c of the skewed matrix, which holds its anti-diagonal
+    row_ids = np.arange(num_rows, dtype=index_dtype).reshape((-1, 1))
+    col_ids = np.arange(num_cols, dtype=index_dtype).reshape((1, -1))
+    skewed_order = np.full((num_rows + num_cols - 1, num_cols), -1, dtype=index_dtype)
+    skewed_order[row_ids + col_ids, col_ids] = row_ids * num_cols + col_ids
+
+    order = skewed_order[skewed_order != -1]
+    order.flags.writeable = False
+    return order
+
+
+#
+def roll_out_anti_diagonals(matrix_np):
+    """
+    Function to roll out a matrix along its anti-diagonals into a single row, to account for the
+    temporal locality of the skewed demands when prefetching. The row keeps the dtype of the matrix.
+    """
+    num_rows, num_cols = matrix_np.shape
+    order = get_anti_diagonal_order(num_rows, num_cols)
+
+    prefetches = np.ravel(matrix_np)[order].reshape((1, num_rows * num_cols))
+    return prefetches
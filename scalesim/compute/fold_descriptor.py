@@ -0,0 +1,257 @@
+"""
+This file contains the 'fold_descriptor' and 'virtual_demand_matrix' classes, which describe the
+demand matrices of the systolic compute modules fold by fold without materializing them. The demand
+lines are generated when they are asked for.
+"""
+
+import bisect
+import numpy as np
+
+
+class fold_descriptor:
+    """
+    Class which describes the demand lines of one fold: a number of leading null lines, the lines
+    of a slice of an operand matrix, and a number of trailing null lines, over num_cols columns.
+    The columns past the ones of the slice are null requests (-1) to account for under
+    utilization. If the fold is skewed, column c is delayed by c lines to reflect the systolic
+    pipeline fill, as skew_matrix() does, which adds num_cols - 1 lines to the fold.
+    """
+    #
+    def __init__(self, source_np, num_cols, num_lead_lines=0, num_trail_lines=0, skewed=False):
+        """
+        __init__ method. The source_np slice is not copied, so views of the operand matrices can be
+        used, including flipped ones and the views of the operand matrices of a batch.
+        """
+        assert source_np.ndim == 2, 'The source of a fold must be a matrix'
+        assert source_np.shape[1] <= num_cols, 'The source of a fold is wider than the fold'
+
+        self.source_np = source_np
+        self.num_cols = num_cols
+        self.num_lead_lines = num_lead_lines
+        self.num_trail_lines = num_trail_lines
+        self.skewed = skewed
+
+        self.num_source_lines = source_np.shape[0]
+        self.num_lines = num_lead_lines + self.num_source_lines + num_trail_lines
+        if skewed:
+            self.num_lines += num_cols - 1
+
+    #
+    def get_num_lines(self):
+        """
+        Method to get the number of demand lines in the fold.
+        """
+        return self.num_lines
+
+    #
+    def fill_lines(self, start_line, end_line, out_np):
+        """
+        Method to write the demand lines [start_line, end_line) of the fold to out_np, which is
+        expected to hold null requests (-1) already.
+        """
+        source_cols = self.source_np.shape[1]
+        first_line = start_line - self.num_lead_lines
+        last_line = end_line - self.num_lead_lines
+
+        if not self.skewed:
+            src_start = max(first_line, 0)
+            src_end = min(last_line, self.num_source_lines)
+            if src_start < src_end:
+                out_np[src_start - first_line:src_end - first_line, :source_cols] = \
+                    self.source_np[src_start:src_end]
+            return
+
+        # The source lines of all the columns are read at once, as a view for a numpy source
+        block_start = min(max(first_line - source_cols + 1, 0), self.num_source_lines)
+        block_end = min(max(last_line, block_start), self.num_source_lines)
+        block_np = np.asarray(self.source_np[block_start:block_end])
+
+        # Column c of the skewed fold holds the source lines moved down by c lines
+        for c in range(source_cols):
+            src_start = max(first_line - c, block_start)
+            src_end = min(last_line - c, block_end)
+            if src_start < src_end:
+                out_start = src_start + c - first_line
+                out_np[out_start:out_start + src_end - src_start, c] = \
+                    block_np[src_start - block_start:src_end - block_start, c]
+
+    #
+    def get_lines(self, start_line, end_line, dtype=None):
+        """
+        Method to get the demand lines [start_line, end_line) of the fold as a matrix.
+        """
+        dtype = self.source_np.dtype if dtype is None else dtype
+        out_np = np.full((end_line - start_line, self.num_cols), -1, dtype=dtype)
+        self.fill_lines(start_line, end_line, out_np)
+        return out_np
+
+    #
+    def get_matrix(self):
+        """
+        Method to get all the demand lines of the fold as a matrix.
+        """
+        return self.get_lines(0, self.num_lines)
+
+
+class virtual_demand_matrix:
+    """
+    Class which stands in for a demand matrix made of the demand lines of a sequence of folds. It
+    has the shape and dtype of the matrix it describes, and slicing a range of lines generates
+    only these lines. The demand lines are generated a chunk at a time, so that reading the lines
+    in order in small blocks does not generate each of them more than once.
+    """
+    #
+    def __init__(self, num_cols, dtype=np.int32, chunk_elems=2 ** 20):
+        """
+        __init__ method.
+        """
+        self.num_cols = num_cols
+        self.dtype = np.dtype(dtype)
+        self.ndim = 2
+        self.chunk_elems = chunk_elems
+
+        self.folds = []
+        self.fold_start_lines = []
+        self.num_lines = 0
+
+        # Last chunk of demand lines generated, and its first line
+        self.chunk_np = np.full((0, num_cols), -1, dtype=self.dtype)
+        self.chunk_start_line = 0
+
+    #
+    def append_fold(self, fold):
+        """
+        Method to append the demand lines of a fold to the matrix.
+        """
+        assert fold.num_cols == self.num_cols, 'Fold width does not match the demand matrix'
+
+        self.folds.append(fold)
+        self.fold_start_lines.append(self.num_lines)
+        self.num_lines += fold.get_num_lines()
+        self.chunk_np = self.chunk_np[:0]
+
+    #
+    @property
+    def shape(self):
+        """
+        Shape of the demand matrix described.
+        """
+        return self.num_lines, self.num_cols
+
+    #
+    def __len__(self):
+        """
+        Method to get the number of demand lines in the matrix.
+        """
+        return self.num_lines
+
+    #
+    def get_num_folds(self):
+        """
+        Method to get the number of folds in the matrix.
+        """
+        return len(self.folds)
+
+    #
+    def get_fold_line_range(self, fold_id):
+        """
+        Method to get the first line of a fold in the matrix and the line after its last one.
+        """
+        start_line = self.fold_start_lines[fold_id]
+        return start_line, start_line + self.folds[fold_id].get_num_lines()
+
+    #
+    def generate_lines(self, start_line, end_line):
+        """
+        Method to generate the demand lines [start_line, end_line) of the matrix from the folds
+        they belong to, clipped to the lines of the matrix.
+        """
+        start_line = min(max(start_line, 0), self.num_lines)
+        end_line = min(max(end_line, start_line), self.num_lines)
+        out_np = np.full((end_line - start_line, self.num_cols), -1, dtype=self.dtype)
+
+        fold_id = max(bisect.bisect_right(self.fold_start_lines, start_line) - 1, 0)
+        while fold_id < len(self.folds) and self.fold_start_lines[fold_id] < end_line:
+            fold_start, fold_end = self.get_fold_line_range(fold_id)
+            lines_start = max(start_line, fold_start)
+            lines_end = min(end_line, fold_end)
+            if lines_start < lines_end:
+                self.folds[fold_id].fill_lines(lines_start - fold_start, lines_end - fold_start,
+                                               out_np[lines_start - start_line:
+                                                      lines_end - start_line])
+            fold_id += 1
+
+        return out_np
+
+    #
+    def get_lines(self, start_line, end_line):
+        """
+        Method to get the demand lines [start_line, end_line) of the matrix, clipped to its lines.
+        The lines are served from the last chunk generated when they are in it. The returned
+        matrix must not be modified.
+        """
+        start_line = min(max(start_line, 0), self.num_lines)
+        end_line = min(max(end_line, start_line), self.num_lines)
+
+        chunk_end_line = self.chunk_start_line + self.chunk_np.shape[0]
+        if not (self.chunk_start_line <= start_line and end_line <= chunk_end_line):
+            chunk_lines = max(end_line - start_line, self.chunk_elems // max(self.num_cols, 1))
+            self.chunk_start_line = start_line
+            self.chunk_np = self.generate_lines(start_line,
+                                                min(start_line + chunk_lines, self.num_lines))
+            self.chunk_np.flags.writeable = False
+
+        return self.chunk_np[start_line - self.chunk_start_line:end_line - self.chunk_start_line]
+
+    #
+    def __getitem__(self, key):
+        """
+        Method to index the matrix as a numpy array, on a range of lines or a single line first.
+        """
+        col_key = slice(None)
+        if isinstance(key, tuple):
+            key, col_key = key
+
+        if isinstance(key, slice):
+            start_line, end_line, step = key.indices(self.num_lines)
+            assert step == 1, 'Only contiguous ranges of demand lines can be generated'
+            lines_np = self.get_lines(start_line, end_line)
+        else:
+            line_id = int(key)
+            if line_id < 0:
+                line_id += self.num_lines
+            assert 0 <= line_id < self.num_lines, 'Demand line out of range'
+            lines_np = self.get_lines(line_id, line_id + 1)[0]
+
+        if isinstance(col_key, slice) and col_key == slice(None):
+            return lines_np
+        return lines_np[..., col_key]
+
+    #
+    def __array__(self, dtype=None, copy=None):
+        """
+        Method to materialize the whole demand matrix, when it is converted to a numpy array.
+        The matrix is always built, so a conversion without a copy (copy=False) is refused.
+        """
+        if copy is False:
+            raise ValueError('Cannot convert to a numpy array without a copy')
+
+        matrix_np = self.generate_lines(0, self.num_lines)
+        if dtype is not None:
+            matrix_np = matrix_np.astype(dtype, copy=False)
+        return matrix_np
+
+
+#
+def iter_demand_folds(ifmap_demand_mat, filter_demand_mat, ofmap_demand_mat):
+    """
+    Function to iterate over the folds of the ifmap, filter and ofmap virtual demand matrices,
+    yielding the demand lines of each fold of the three of them. The folds are the line ranges of
+    the ofmap folds, which the lines of the other operands are aligned to, as when the whole
+    matrices are serviced together. Only the lines of the fold yielded are generated.
+    """
+    for fold_id in range(ofmap_demand_mat.get_num_folds()):
+        start_line, end_line = ofmap_demand_mat.get_fold_line_range(fold_id)
+        yield ifmap_demand_mat.generate_lines(start_line, end_line), \
+              filter_demand_mat.generate_lines(start_line, end_line), \
+              ofmap_demand_mat.generate_lines(start_line, end_line)
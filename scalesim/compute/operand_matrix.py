@@ -1,6 +1,7 @@
 """
 This file contains the 'operand_matrix' class responsible for creating the IFMAP, Filter and OFMAP
-operand matrices.
+operand matrices, and the 'batched_operand_matrix' class which stands in for the IFMAP and OFMAP
+operand matrices of a batch.
 """
 
 import numpy as np
@@ -32,6 +33,9 @@ class operand_matrix(object):
         self.sparsity_ratio_N, self.sparsity_ratio_M = 1, 1
         self.batch_size = 1
 
+        # Number of addresses of the IFMAP and OFMAP of a sample
+        self.ifmap_sample_size, self.ofmap_sample_size = 1, 1
+
         #  Derived hyper parameters
         self.ofmap_px_per_filt, self.conv_window_size = 1, 1
         self.ofmap_rows, self.ofmap_cols = 1, 1
@@ -40,6 +44,9 @@ class operand_matrix(object):
         self.ifmap_offset, self.filter_offset, self.ofmap_offset = 0, 10000000, 20000000
         self.matrix_offset_arr = [0, 10000000, 20000000]
 
+        # Integer type of the addresses
+        self.addr_dtype = np.int32
+
         # Address matrices
         self.ifmap_addr_matrix = np.ones((self.ofmap_px_per_filt, self.conv_window_size), dtype=int)
         self.filter_addr_matrix = np.ones((self.conv_window_size, self.num_filters), dtype=int)
@@ -90,14 +97,9 @@ class operand_matrix(object):
         #if len(layer_hyper_param_arr) == 8:
         #    self.col_stride = layer_hyper_param_arr[7]
 
-        # TODO: Anand
-        # TODO: Next release
-        # TODO: Add an option for batching
-        self.batch_size = 1
-
-        # TODO: Marked for cleanup
-        #if len(layer_hyper_param_arr) == 9:
-        #    self.batch_size = layer_hyper_param_arr[8]
+        # The samples of a batch share the filters, their IFMAP and OFMAP rows are stacked
+        # Only the matrices of the first sample are built, see get_batch_matrix()
+        self.batch_size = self.topoutil.get_layer_batch_size(self.layer_id)
 
         # Assign the calculated hyper parameters
         self.ofmap_rows, self.ofmap_cols = self.topoutil.get_layer_ofmap_dims(self.layer_id)
@@ -105,16 +107,22 @@ class operand_matrix(object):
         self.ofmap_cols = int(self.ofmap_cols)
         self.ofmap_px_per_filt = int(self.ofmap_rows * self.ofmap_cols)
         self.conv_window_size = int(self.topoutil.get_layer_window_size(self.layer_id))
+        self.ifmap_sample_size = self.ifmap_rows * self.ifmap_cols * self.num_input_channels
+        self.ofmap_sample_size = self.ofmap_px_per_filt * self.num_filters
 
         # Assign the offsets
         self.ifmap_offset, self.filter_offset, self.ofmap_offset \
             = self.config.get_offsets()
 
+        self.addr_dtype = self.calc_addr_dtype()
+
         # Address matrices: This is needed to take into account the updated dimensions
         self.ifmap_addr_matrix = \
-            np.ones((self.ofmap_px_per_filt * self.batch_size, self.conv_window_size), dtype='>i4')
-        self.filter_addr_matrix = np.ones((self.conv_window_size, self.num_filters), dtype='>i4')
-        self.ofmap_addr_matrix = np.ones((self.ofmap_px_per_filt, self.num_filters), dtype='>i4')
+            np.ones((self.ofmap_px_per_filt, self.conv_window_size), dtype=self.addr_dtype)
+        self.filter_addr_matrix = \
+            np.ones((self.conv_window_size, self.num_filters), dtype=self.addr_dtype)
+        self.ofmap_addr_matrix = \
+            np.ones((self.ofmap_px_per_filt, self.num_filters), dtype=self.addr_dtype)
         self.params_set_flag = True
 
         # TODO: This should be called from top level
@@ -129,6 +137,23 @@ class operand_matrix(object):
         #    print(message)
         #    return False, None, None, None
 
+    #
+    def calc_addr_dtype(self):
+        """
+        Method to choose the integer type of the addresses from the offsets and the sizes of the
+        operands. It is int32 if the largest address fits in it, and int64 otherwise.
+        """
+        ifmap_size = self.ifmap_sample_size * self.batch_size
+        filter_size = self.conv_window_size * self.num_filters
+        ofmap_size = self.ofmap_sample_size * self.batch_size
+
+        max_addr = max(self.ifmap_offset + ifmap_size,
+                       self.filter_offset + filter_size,
+                       self.ofmap_offset + ofmap_size)
+        if max_addr < np.iinfo(np.int32).max:
+            return np.int32
+        return np.int64
+
     # top level function to create the operand matrices
     def create_operand_matrices(self):
         """
@@ -165,13 +190,15 @@ class operand_matrix(object):
             print(message)
             return -1
 
-        row_indices = np.arange(self.batch_size * self.ofmap_px_per_filt)
+        row_indices = np.arange(self.ofmap_px_per_filt)
         col_indices = np.arange(self.conv_window_size)
 
         # Create 2D index arrays using meshgrid
         i, j = np.meshgrid(row_indices, col_indices, indexing='ij')
 
         # Call calc_ifmap_elem_addr_numpy with 2D index arrays
+        # This is the matrix of the first sample, the other samples of the batch read the same
+        # pattern in their own IFMAP
         self.ifmap_addr_matrix = self.calc_ifmap_elem_addr(i, j)
         self.ifmap_addr_matrix_original = self.ifmap_addr_matrix
   
@@ -208,7 +235,7 @@ class operand_matrix(object):
         c_col, c_ch = np.divmod(k, channel)
 
         valid_indices = np.logical_and(c_row + i_row < ifmap_rows, c_col + i_col < ifmap_cols)
-        ifmap_px_addr = np.full(i.shape, -1)
+        ifmap_px_addr = np.full(i.shape, -1, dtype=self.addr_dtype)
         if valid_indices.any():
             internal_address = (c_row[valid_indices] * ifmap_cols + c_col[valid_indices]) * \
                                channel + c_ch[valid_indices]
@@ -228,6 +255,8 @@ class operand_matrix(object):
             print(message)
             return -1
 
+        # This is the matrix of the first sample, the OFMAP of the samples are stored one after
+        # the other
         row_indices = np.expand_dims(np.arange(self.ofmap_px_per_filt), axis=1)
         # if self.config.sparsity_support:
         #     _, col_indices = np.unique(np.array(self.filter_addr_matrix[0]), return_inverse=True)
@@ -247,7 +276,7 @@ class operand_matrix(object):
         num_filt = self.num_filters
         internal_address = num_filt * i + j
         ofmap_px_addr = internal_address + offset
-        return ofmap_px_addr
+        return ofmap_px_addr.astype(self.addr_dtype, copy=False)
 
     # creates the filter operand
     def create_filter_matrix(self):
@@ -360,6 +389,9 @@ class operand_matrix(object):
                 if self.config.filter_offset == 0 and first_element == 0:
                     self.filter_addr_matrix[0][0] = 0
 
+            # The compressed matrices are built with the default integer type
+            self.filter_addr_matrix = self.filter_addr_matrix.astype(self.addr_dtype, copy=False)
+
         return 0
 
     # logic to translate filter into matrix fed into systolic array MACs
@@ -373,7 +405,7 @@ class operand_matrix(object):
         channel = self.num_input_channels
         internal_address = j * filter_row * filter_col * channel + i
         filter_px_addr = internal_address + offset
-        return filter_px_addr
+        return filter_px_addr.astype(self.addr_dtype, copy=False)
 
     # function to get a part or the full ifmap operand
     def get_ifmap_matrix_part(self, start_row=0, num_rows=-1, start_col=0,
@@ -383,7 +415,7 @@ class operand_matrix(object):
         code.
         """
         if num_rows == -1:
-            num_rows = self.ofmap_px_per_filt
+            num_rows = self.ofmap_px_per_filt * self.batch_size
         if num_cols == -1:
             num_cols = self.conv_window_size
         my_name = 'operand_matrix.get_ifmap_matrix_part(): '
@@ -395,7 +427,7 @@ class operand_matrix(object):
                 message = err_prefix + ": Parameters not set yet. Run set_params(). Exiting!"
                 print(message)
                 return -1, np.zeros((1, 1))
-        if (start_row + num_rows) > self.ofmap_px_per_filt or \
+        if (start_row + num_rows) > self.ofmap_px_per_filt * self.batch_size or \
            (start_col + num_cols) > self.conv_window_size:
             message = err_prefix + ": Illegal arguments. Exiting!"
             print(message)
@@ -407,7 +439,8 @@ class operand_matrix(object):
         #ret_mat = self.ifmap_addr_matrix[start_row: end_row][start_col: end_col]
         end_row = start_row + num_rows
         end_col = start_col + num_cols
-        ret_mat = self.ifmap_addr_matrix[start_row: end_row, start_col: end_col]
+        ifmap_matrix = self.get_batch_matrix(self.ifmap_addr_matrix, self.ifmap_sample_size)
+        ret_mat = ifmap_matrix[start_row: end_row, start_col: end_col]
         return 0, ret_mat
 
     #
@@ -417,6 +450,14 @@ class operand_matrix(object):
         """
         return self.get_ifmap_matrix_part()
 
+    #
+    def get_ifmap_matrix_original(self):
+        """
+        Method to get the IFMAP operand matrix of the batch before the columns of the sparse
+        filter elements are removed.
+        """
+        return self.get_batch_matrix(self.ifmap_addr_matrix_original, self.ifmap_sample_size)
+
     # function to get a part or the full filter operand
     def get_filter_matrix_part(self, start_row=0, num_rows=-1, start_col=0,
                                num_cols=-1):
@@ -479,7 +520,7 @@ class operand_matrix(object):
         # Since we cannot pass self as an argument in the member functions
         # This is an alternate way of making the matrix dimensions as defaults
         if num_rows == -1:
-            num_rows = self.ofmap_px_per_filt
+            num_rows = self.ofmap_px_per_filt * self.batch_size
         if num_cols == -1:
             num_cols = self.num_filters
         my_name = 'operand_matrix.get_ofmap_matrix_part(): '
@@ -491,7 +532,7 @@ class operand_matrix(object):
                 message = err_prefix + ": Parameters not set yet. Run set_params(). Exiting!"
                 print(message)
                 return -1, np.zeros((1, 1))
-        if (start_row + num_rows) > self.ofmap_px_per_filt or \
+        if (start_row + num_rows) > self.ofmap_px_per_filt * self.batch_size or \
            (start_col + num_cols) > self.num_filters:
             message = err_prefix + ": Illegal arguments. Exiting!"
             print(message)
@@ -505,10 +546,11 @@ class operand_matrix(object):
         end_col = start_col + num_cols
         # Anand: ISSUE #7. Patch
         #ret_mat = self.filter_addr_matrix[start_row: end_row, start_col: end_col]
+        ofmap_matrix = self.get_batch_matrix(self.ofmap_addr_matrix, self.ofmap_sample_size)
         if self.config.sparsity_support is True:
-            ret_mat =self.ofmap_addr_matrix
+            ret_mat = ofmap_matrix
         else:
-            ret_mat = self.ofmap_addr_matrix[start_row: end_row, start_col: end_col]
+            ret_mat = ofmap_matrix[start_row: end_row, start_col: end_col]
 
         return 0, ret_mat
 
@@ -530,9 +572,151 @@ class operand_matrix(object):
             print(message)
             return
 
-        return self.ifmap_addr_matrix, \
+        return self.get_batch_matrix(self.ifmap_addr_matrix, self.ifmap_sample_size), \
                self.filter_addr_matrix, \
-               self.ofmap_addr_matrix
+               self.get_batch_matrix(self.ofmap_addr_matrix, self.ofmap_sample_size)
+
+    #
+    def get_batch_matrix(self, sample_addr_matrix, sample_size):
+        """
+        Method to get the IFMAP or OFMAP operand matrix of the batch from the one of the first
+        sample, where sample_size is the number of addresses of the operand in a sample. The
+        addresses of the other samples are computed when they are read. For a batch of one, this
+        is the matrix of the sample itself.
+        """
+        if self.batch_size == 1:
+            return sample_addr_matrix
+
+        return batched_operand_matrix(sample_addr_matrix, self.batch_size, sample_size)
+
+
+class batched_operand_matrix:
+    """
+    Class which stands in for the IFMAP or OFMAP operand matrix of a batch: the operand matrix of
+    the first sample, stacked once per sample. The addresses of a sample are the ones of the first
+    sample offset by sample_id * sample_size, and the invalid addresses (-1) stay invalid. Only the
+    matrix of the first sample is stored, and the addresses are computed for the elements read.
+    Slicing or transposing the matrix gives a view on the same sample matrix, and a view is turned
+    into a numpy array when it is converted or indexed with an integer.
+    """
+    #
+    def __init__(self, sample_np, batch_size, sample_size, row_ids=None, col_ids=None,
+                 transposed=False):
+        """
+        __init__ method. The view holds the lines row_ids and columns col_ids of the stacked
+        matrix, or of its transpose if transposed is set, as ranges.
+        """
+        self.sample_np = sample_np
+        self.batch_size = batch_size
+        self.sample_size = sample_size
+        self.transposed = transposed
+        self.dtype = sample_np.dtype
+        self.ndim = 2
+
+        num_rows = sample_np.shape[0] * batch_size
+        num_cols = sample_np.shape[1]
+        if transposed:
+            num_rows, num_cols = num_cols, num_rows
+
+        self.row_ids = range(num_rows) if row_ids is None else row_ids
+        self.col_ids = range(num_cols) if col_ids is None else col_ids
+
+    #
+    @property
+    def shape(self):
+        """
+        Shape of the view.
+        """
+        return len(self.row_ids), len(self.col_ids)
+
+    #
+    @property
+    def size(self):
+        """
+        Number of elements in the view.
+        """
+        return len(self.row_ids) * len(self.col_ids)
+
+    #
+    @property
+    def T(self):
+        """
+        Transpose of the view.
+        """
+        return self.transpose()
+
+    #
+    def __len__(self):
+        """
+        Method to get the number of lines in the view.
+        """
+        return len(self.row_ids)
+
+    #
+    def get_view(self, row_ids, col_ids, transposed=None):
+        """
+        Method to get a view on the same sample matrix with other lines and columns.
+        """
+        transposed = self.transposed if transposed is None else transposed
+        return batched_operand_matrix(self.sample_np, self.batch_size, self.sample_size,
+                                      row_ids=row_ids, col_ids=col_ids, transposed=transposed)
+
+    #
+    def transpose(self, *axes):
+        """
+        Method to get the transpose of the view, as numpy.transpose() does for a matrix.
+        """
+        assert axes in ((), (None,), ((1, 0),)), 'Only the axes of a matrix can be swapped'
+        return self.get_view(self.col_ids, self.row_ids, transposed=not self.transposed)
+
+    #
+    def __getitem__(self, key):
+        """
+        Method to index the view as a numpy matrix. Slices give a view, and an integer index
+        gives the numpy array of the addresses indexed.
+        """
+        row_key, col_key = key if isinstance(key, tuple) else (key, slice(None))
+
+        if isinstance(row_key, slice) and isinstance(col_key, slice):
+            return self.get_view(self.row_ids[row_key], self.col_ids[col_key])
+
+        # An integer index drops its axis, as for a numpy matrix
+        row_ids, row_idx = self.row_ids[row_key], slice(None)
+        if not isinstance(row_key, slice):
+            row_ids, row_idx = range(row_ids, row_ids + 1), 0
+        col_ids, col_idx = self.col_ids[col_key], slice(None)
+        if not isinstance(col_key, slice):
+            col_ids, col_idx = range(col_ids, col_ids + 1), 0
+
+        return np.asarray(self.get_view(row_ids, col_ids))[row_idx, col_idx]
+
+    #
+    def __array__(self, dtype=None, copy=None):
+        """
+        Method to compute the addresses of the view, when it is converted to a numpy array.
+        The matrix is always built, so a conversion without a copy (copy=False) is refused.
+        """
+        if copy is False:
+            raise ValueError('Cannot convert to a numpy array without a copy')
+
+        stacked_row_ids, col_ids = self.row_ids, self.col_ids
+        if self.transposed:
+            stacked_row_ids, col_ids = col_ids, stacked_row_ids
+
+        stacked_rows = np.arange(stacked_row_ids.start, stacked_row_ids.stop,
+                                 stacked_row_ids.step)
+        sample_ids, sample_rows = np.divmod(stacked_rows, self.sample_np.shape[0])
+        cols = np.arange(col_ids.start, col_ids.stop, col_ids.step)
+
+        matrix_np = self.sample_np[np.ix_(sample_rows, cols)]
+        offsets = (sample_ids * self.sample_size).astype(self.dtype).reshape((-1, 1))
+        np.add(matrix_np, offsets, out=matrix_np, where=matrix_np != -1)
+
+        if self.transposed:
+            matrix_np = matrix_np.T
+        if dtype is not None:
+            matrix_np = matrix_np.astype(dtype, copy=False)
+        return matrix_np
 
 
 if __name__ == '__main__':
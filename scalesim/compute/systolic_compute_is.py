@@ -7,8 +7,10 @@ for IFMAP, Filter, and OFMAP operations.
 
 import math
 import numpy as np
-from tqdm import tqdm
 from scalesim.scale_config import scale_config as cfg
+from scalesim.compute.diagonal_rollout import roll_out_anti_diagonals
+from scalesim.compute.fold_descriptor import fold_descriptor, virtual_demand_matrix
+from scalesim.compute.fold_descriptor import iter_demand_folds
 
 
 class systolic_compute_is:
@@ -26,6 +28,7 @@ class systolic_compute_is:
         self.ifmap_op_mat = np.zeros((1, 1))
         self.ofmap_op_mat = np.zeros((1, 1))
         self.filter_op_mat = np.zeros((1, 1))
+        self.addr_dtype = np.int32
 
         # Derived parameters
         self.Sr = 0
@@ -76,6 +79,10 @@ class systolic_compute_is:
         self.filter_op_mat = filter_op_mat
         self.ofmap_op_mat = ofmap_op_mat
 
+        # Type of the addresses in the prefetch and demand matrices, with the null requests (-1)
+        self.addr_dtype = np.result_type(self.ifmap_op_mat.dtype, self.filter_op_mat.dtype,
+                                         self.ofmap_op_mat.dtype)
+
         self.ifmap_op_mat_trans = np.transpose(self.ifmap_op_mat)
 
         ifmap_col = self.ifmap_op_mat.shape[1]
@@ -124,7 +131,7 @@ class systolic_compute_is:
 
             #If there is under utilization, fill them with null requests
             if delta > 0:
-                null_req_mat = np.ones((self.Sr, delta)) * -1
+                null_req_mat = np.full((self.Sr, delta), -1, dtype=self.addr_dtype)
                 this_fold_prefetch = np.concatenate((this_fold_prefetch, null_req_mat), axis=1)
 
             if fc == 0:
@@ -152,7 +159,7 @@ class systolic_compute_is:
             this_fold_prefetch = np.transpose(this_fold_prefetch)
 
             if delta > 0:
-                null_req_mat = np.ones((self.T, delta)) * -1
+                null_req_mat = np.full((self.T, delta), -1, dtype=self.addr_dtype)
                 this_fold_prefetch = np.concatenate((this_fold_prefetch, null_req_mat), axis=1)
 
             if fr == 0:
@@ -165,31 +172,7 @@ class systolic_compute_is:
         # Roll out the matrices along the diagonal to account for temporal locality when there is a
         # skew in demand
 
-        M, N = self.filter_prefetch_matrix.shape
-        num_elems = M * N
-        num_diags = M + N
-        prefetches = np.zeros((1, num_elems))
-        idx = 0
-
-        pbar = tqdm(total=M * N, disable=True)
-        # print('DEBUG: Total = ' + str(num_elems) + ' Diags = ' + str(num_diags))
-
-        for diag_id in range(num_diags):
-            max_row_id = min(diag_id, M - 1)
-            min_row_id = max(0, diag_id - N + 1)
-            valid_rows = max_row_id - min_row_id + 1
-
-            for offset in range(valid_rows):
-                row_id = max_row_id - offset
-                col_id = diag_id - row_id
-
-                elem = self.filter_prefetch_matrix[row_id][col_id]
-                prefetches[0, idx] = elem
-                idx += 1
-                pbar.update(1)
-
-        pbar.close()
-        self.filter_prefetch_matrix = prefetches
+        self.filter_prefetch_matrix = roll_out_anti_diagonals(self.filter_prefetch_matrix)
 
     #
     def create_demand_matrices(self):
@@ -217,12 +200,14 @@ class systolic_compute_is:
     #
     def create_ifmap_demand_mat(self):
         """
-        Method to create IFMAP demand matrix.
+        Method to create IFMAP demand matrix. The folds are described by fold descriptors on the
+        operand matrix, and their demand lines are generated when they are read.
         """
         assert self.params_set_flag, 'Parameters are not set'
 
         inter_fold_gap_suffix = self.arr_row + self.arr_col + self.T - 2
-        inter_fold_gap_suffix_mat = np.ones((inter_fold_gap_suffix, self.arr_col)) * -1
+
+        self.ifmap_demand_matrix = virtual_demand_matrix(self.arr_col, dtype=self.addr_dtype)
 
         for fc in range(self.col_fold):
             for fr in range(self.row_fold):
@@ -232,7 +217,6 @@ class systolic_compute_is:
 
                 col_start_id = fc * self.arr_col
                 col_end_idx = min(col_start_id + self.arr_col, self.Sc)
-                col_delta = self.arr_col - (col_end_idx - col_start_id)
 
                 # Indexing the cols with row start and row end idx are correct
                 # See the comment on ifmap_prefetch generation
@@ -240,22 +224,11 @@ class systolic_compute_is:
                     self.ifmap_op_mat_trans[row_start_id:row_end_idx, col_start_id: col_end_idx]
                 self.ifmap_reads += this_fold_demand.shape[0] * this_fold_demand.shape[1]
 
-                # Take into account under utilization
-                if col_delta > 0:
-                    null_req_mat = np.ones((this_fold_demand.shape[0], col_delta)) * -1
-                    this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=1)
-
-                if row_delta > 0:
-                    null_req_mat = np.ones((row_delta, self.arr_col)) * -1
-                    this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=0)
-
                 # The IFMAP elems are needed to be filled in reverse order to ensure that
                 # top element is pushed in last to maintain alignment with the input elements
-                this_fold_demand = np.flip(this_fold_demand, 0)
-
-                # Account for the cycles for partial sum generation and accumulation
-                this_fold_demand = \
-                    np.concatenate((this_fold_demand, inter_fold_gap_suffix_mat), axis=0)
+                # The null requests of the under utilized rows then come first
+                # Slicing keeps a view on the operand matrix of a batch
+                this_fold_demand = this_fold_demand[::-1]
 
                 # Calculate the mapping efficiency
                 row_used = min(self.arr_row, row_end_idx - row_start_id)
@@ -263,7 +236,7 @@ class systolic_compute_is:
                 mac_used = row_used * col_used
                 mapping_eff_this_fold = mac_used / (self.arr_row * self.arr_col)
 
-                cycles_this_fold = this_fold_demand.shape[0] + this_fold_demand.shape[1] - 1
+                cycles_this_fold = self.arr_row + inter_fold_gap_suffix + self.arr_col - 1
                 compute_cycles_this_fold = mac_used * self.T
                 compute_util_this_fold = \
                     compute_cycles_this_fold / (self.arr_row * self.arr_col * cycles_this_fold)
@@ -271,32 +244,30 @@ class systolic_compute_is:
                 self.mapping_efficiency_per_fold.append(mapping_eff_this_fold)
                 self.compute_utility_per_fold.append(compute_util_this_fold)
 
-                if fr == 0 and fc == 0:
-                    self.ifmap_demand_matrix = this_fold_demand
-                else:
-                    self.ifmap_demand_matrix = \
-                        np.concatenate((self.ifmap_demand_matrix, this_fold_demand), axis=0)
+                # Account for the cycles for partial sum generation and accumulation
+                self.ifmap_demand_matrix.append_fold(
+                    fold_descriptor(this_fold_demand, self.arr_col, num_lead_lines=row_delta,
+                                    num_trail_lines=inter_fold_gap_suffix))
 
         # Skew is not needed in IFMAP for IS
 
     #
     def create_filter_demand_mat(self):
         """
-        Method to create filter demand matrix.
+        Method to create filter demand matrix. The folds are described by fold descriptors on the
+        operand matrix, and their demand lines are generated when they are read.
         """
         assert self.params_set_flag, 'Parameters are not set'
 
         inter_fold_gap_prefix = self.arr_row
-        inter_fold_gap_prefix_mat = np.ones((inter_fold_gap_prefix, self.arr_row)) * -1
-
         inter_fold_gap_suffix = self.arr_col - 1
-        inter_fold_gap_suffix_mat = np.ones((inter_fold_gap_suffix, self.arr_row)) * -1
 
-        for fc in range(self.col_fold):
+        self.filter_demand_matrix = virtual_demand_matrix(self.arr_row, dtype=self.addr_dtype)
+
+        for _ in range(self.col_fold):
             for fr in range(self.row_fold):
                 row_start_id = fr * self.arr_row
                 row_end_idx = min(row_start_id + self.arr_row, self.Sr)
-                delta = self.arr_row - (row_end_idx - row_start_id)
 
                 # Indexing the cols with row start and row end idx are correct
                 # See the comment on ifmap_prefetch generation
@@ -304,69 +275,43 @@ class systolic_compute_is:
                 this_fold_demand = np.transpose(this_fold_demand)
                 self.filter_reads += this_fold_demand.shape[0] * this_fold_demand.shape[1]
 
-                # Take into account under utilization
-                if delta > 0:
-                    null_req_mat = np.ones((self.T, delta)) * -1
-                    this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=1)
-
-                # Account for the cycles for weights to load
-                this_fold_demand = np.concatenate((inter_fold_gap_prefix_mat, this_fold_demand),
-                                                  axis=0)
-
-                # Account for the cycles for final output to drain out
-                this_fold_demand = np.concatenate((this_fold_demand, inter_fold_gap_suffix_mat),
-                                                  axis=0)
-
+                # The under utilized cols are null requests
+                # Account for the cycles for weights to load and for final output to drain out
                 # Add skew to the IFMAP demand matrix to reflect systolic pipeline fill
-                this_fold_demand = skew_matrix(this_fold_demand)
-
-                if fr == 0 and fc == 0:
-                    self.filter_demand_matrix = this_fold_demand
-                else:
-                    self.filter_demand_matrix = \
-                        np.concatenate((self.filter_demand_matrix, this_fold_demand), axis=0)
+                self.filter_demand_matrix.append_fold(
+                    fold_descriptor(this_fold_demand, self.arr_row,
+                                    num_lead_lines=inter_fold_gap_prefix,
+                                    num_trail_lines=inter_fold_gap_suffix, skewed=True))
     # END of filter demand generation
 
     #
     def create_ofmap_demand_mat(self):
         """
-        Method to create OFMAP demand matrix.
+        Method to create OFMAP demand matrix. The folds are described by fold descriptors on the
+        operand matrix, and their demand lines are generated when they are read.
         """
         assert self.params_set_flag, 'Parameters are not set'
 
         inter_fold_gap_prefix = 2 * self.arr_row - 1
-        inter_fold_gap_prefix_mat = np.ones((inter_fold_gap_prefix, self.arr_col)) * -1
+
+        self.ofmap_demand_matrix = virtual_demand_matrix(self.arr_col, dtype=self.addr_dtype)
 
         for fc in range(self.col_fold):
-            for fr in range(self.row_fold):
+            for _ in range(self.row_fold):
                 col_start_id = fc * self.arr_col
                 col_end_idx = min(col_start_id + self.arr_col, self.Sc)
-                col_delta = self.arr_col - (col_end_idx - col_start_id)
 
                 this_fold_demand = self.ofmap_op_mat[col_start_id: col_end_idx, :]
                 this_fold_demand = np.transpose(this_fold_demand)
                 self.ofmap_writes += this_fold_demand.shape[0] * this_fold_demand.shape[1]
 
-                # Adding null requests when there is under utilization ie. no mapping along a few
-                # rows or cols
-                if col_delta > 0:
-                    null_req_mat = np.ones((self.T, col_delta)) * -1
-                    this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=1)
-
-                # Now add the prefix matrix
-                # These are the null demands to account for when the operands are streamed in
+                # The under utilized cols are null requests
+                # The prefix are the null demands to account for when the operands are streamed in
                 # and the OFMAPS are not ready
-                this_fold_demand = np.concatenate((inter_fold_gap_prefix_mat, this_fold_demand),
-                                                  axis=0)
-
                 # Add skew to the OFMAP demand matrix to reflect systolic pipeline fill
-                this_fold_demand = skew_matrix(this_fold_demand)
-
-                if fr == 0 and fc == 0:
-                    self.ofmap_demand_matrix = this_fold_demand
-                else:
-                    self.ofmap_demand_matrix = \
-                        np.concatenate((self.ofmap_demand_matrix, this_fold_demand), axis=0)
+                self.ofmap_demand_matrix.append_fold(
+                    fold_descriptor(this_fold_demand, self.arr_col,
+                                    num_lead_lines=inter_fold_gap_prefix, skewed=True))
     # END of OFMAP demand generation
 
     #
@@ -439,6 +384,18 @@ class systolic_compute_is:
 
         return self.ifmap_demand_matrix, self.filter_demand_matrix, self.ofmap_demand_matrix
 
+    #
+    def get_demand_folds(self):
+        """
+        Method to get a generator of the ifmap, filter and ofmap demand lines of each fold, which
+        generates the lines of one fold at a time.
+        """
+        if not self.demand_mat_ready_flag:
+            self.create_demand_matrices()
+
+        return iter_demand_folds(self.ifmap_demand_matrix, self.filter_demand_matrix,
+                                 self.ofmap_demand_matrix)
+
     #
     def get_avg_mapping_efficiency(self):
         """
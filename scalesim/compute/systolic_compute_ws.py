@@ -7,8 +7,10 @@ for IFMAP, Filter, and OFMAP operations.
 
 import math
 import numpy as np
-from tqdm import tqdm
 from scalesim.scale_config import scale_config as cfg
+from scalesim.compute.diagonal_rollout import roll_out_anti_diagonals
+from scalesim.compute.fold_descriptor import fold_descriptor, virtual_demand_matrix
+from scalesim.compute.fold_descriptor import iter_demand_folds
 from scalesim.compute.compression import compression as cp
 
 class systolic_compute_ws:
@@ -28,6 +30,7 @@ class systolic_compute_ws:
         self.ifmap_op_mat = np.zeros((1, 1))
         self.ofmap_op_mat = np.zeros((1, 1))
         self.filter_op_mat = np.zeros((1, 1))
+        self.addr_dtype = np.int32
 
         # Derived parameters
         self.Sr = 0
@@ -87,6 +90,10 @@ class systolic_compute_ws:
         self.ifmap_op_mat = ifmap_op_mat
         self.filter_op_mat = filter_op_mat
         self.ofmap_op_mat = ofmap_op_mat
+
+        # Type of the addresses in the prefetch and demand matrices, with the null requests (-1)
+        self.addr_dtype = np.result_type(self.ifmap_op_mat.dtype, self.filter_op_mat.dtype,
+                                         self.ofmap_op_mat.dtype)
         self.sparsity_ratio_N = sparsity_ratio_N
         self.sparsity_ratio_M = sparsity_ratio_M
 
@@ -141,7 +148,7 @@ class systolic_compute_ws:
 
             #If there is under utilization, fill them with null requests
             if delta > 0:
-                null_req_mat = np.ones((self.T, delta)) * -1
+                null_req_mat = np.full((self.T, delta), -1, dtype=self.addr_dtype)
                 this_fold_prefetch = np.concatenate((this_fold_prefetch, null_req_mat), axis=1)
 
             if fr == 0:
@@ -154,31 +161,7 @@ class systolic_compute_ws:
         # Roll out the matrices along the diagonal to account for temporal locality when there is a
         # skew in demand
 
-        M, N = self.ifmap_prefetch_matrix.shape
-        num_elems = M * N
-        num_diags = M + N
-        prefetches = np.zeros((1, num_elems))
-        idx = 0
-
-        pbar = tqdm(total=M * N, disable=True)
-        # print('DEBUG: Total = ' + str(num_elems) + ' Diags = ' + str(num_diags))
-
-        for diag_id in range(num_diags):
-            max_row_id = min(diag_id, M - 1)
-            min_row_id = max(0, diag_id - N + 1)
-            valid_rows = max_row_id - min_row_id + 1
-
-            for offset in range(valid_rows):
-                row_id = max_row_id - offset
-                col_id = diag_id - row_id
-
-                elem = self.ifmap_prefetch_matrix[row_id][col_id]
-                prefetches[0, idx] = elem
-                idx += 1
-                pbar.update(1)
-
-        pbar.close()
-        self.ifmap_prefetch_matrix = prefetches
+        self.ifmap_prefetch_matrix = roll_out_anti_diagonals(self.ifmap_prefetch_matrix)
 
     #
     def create_filter_prefetch_mat(self):
@@ -196,7 +179,8 @@ class systolic_compute_ws:
             this_fold_prefetch = self.filter_op_mat[:,col_start_id:col_end_id]
 
             if delta > 0:
-                null_req_mat = np.ones((self.filter_op_mat.shape[0], delta)) * -1 # self.Sr
+                null_req_mat = np.full((self.filter_op_mat.shape[0], delta), -1,
+                                       dtype=self.addr_dtype) # self.Sr
                 this_fold_prefetch = np.concatenate((this_fold_prefetch, null_req_mat), axis=1)
 
             if fc == 0:
@@ -240,23 +224,25 @@ class systolic_compute_ws:
         assert self.params_set_flag, 'Parameters are not set'
 
         inter_fold_gap_prefix = self.arr_row
-        inter_fold_gap_prefix_mat = np.ones((inter_fold_gap_prefix, self.arr_row)) * -1
+        inter_fold_gap_prefix_mat = \
+            np.full((inter_fold_gap_prefix, self.arr_row), -1, dtype=self.addr_dtype)
 
         inter_fold_gap_suffix = self.arr_col - 1
 
-        inter_fold_gap_suffix_mat = np.ones((inter_fold_gap_suffix, self.arr_row)) * -1
+        inter_fold_gap_suffix_mat = \
+            np.full((inter_fold_gap_suffix, self.arr_row), -1, dtype=self.addr_dtype)
 
         metadata_conversion_mat = [ [ ] ]
         if False:
             if self.config.sparsity_support is True:
                 if self.config.sparsity_representation == 'csr':
-                    metadata_conversion_mat = np.ones((1, self.arr_col)) * -1
+                    metadata_conversion_mat = np.full((1, self.arr_col), -1, dtype=self.addr_dtype)
                 elif self.config.sparsity_representation == 'csc':
-                    metadata_conversion_mat = np.ones((1, self.arr_col)) * -1
+                    metadata_conversion_mat = np.full((1, self.arr_col), -1, dtype=self.addr_dtype)
                 elif self.config.sparsity_representation == 'ellpack_block':
-                    metadata_conversion_mat = np.ones((0, self.arr_col)) * -1
+                    metadata_conversion_mat = np.full((0, self.arr_col), -1, dtype=self.addr_dtype)
 
-        ifmap_demand_matrix_list = []
+        ifmap_demand_folds = []
 
         for fc in range(self.col_fold):
             # for fr in range(self.row_fold):
@@ -264,12 +250,10 @@ class systolic_compute_ws:
                 if self.config.sparsity_support and self.config.sparsity_optimized_mapping:
                     col_start_id = fr * (self.arr_row * 2) # Since we need 2 tiles
                     col_end_idx = min(col_start_id + (self.arr_row * 2), self.Sr)
-                    delta = (self.arr_row * 2) - (col_end_idx - col_start_id)
                     this_fold_demand = self.ifmap_op_mat_original[:,col_start_id: col_end_idx]
                 else:
                     col_start_id = fr * self.arr_row
                     col_end_idx = min(col_start_id + self.arr_row, self.Sr)
-                    delta = self.arr_row - (col_end_idx - col_start_id)
 
                     # Indexing the cols with row start and row end idx are correct
                     # See the comment on ifmap_prefetch generation
@@ -291,13 +275,17 @@ class systolic_compute_ws:
                 else:
                     self.ifmap_reads += this_fold_demand.shape[0] * this_fold_demand.shape[1]
 
-                # Take into account under utilization
                 if not self.config.sparsity_optimized_mapping:
-                    if delta > 0:
-                        null_req_mat = np.ones((self.T, delta)) * -1
-                        this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=1)
-                
-                if self.config.sparsity_support and self.config.sparsity_optimized_mapping:
+                    # The under utilized cols are null requests
+                    # Account for the cycles for weights to load and for final output to drain out
+                    # Add skew to the IFMAP demand matrix to reflect systolic pipeline fill
+                    ifmap_demand_folds.append(
+                        fold_descriptor(this_fold_demand, self.arr_row,
+                                        num_lead_lines=inter_fold_gap_prefix,
+                                        num_trail_lines=inter_fold_gap_suffix, skewed=True))
+                    continue
+
+                if self.config.sparsity_support:
                     if inter_fold_gap_prefix_mat.shape[1] < this_fold_demand.shape[1]:
                         inter_fold_gap_prefix_mat = np.pad(
                             inter_fold_gap_prefix_mat,
@@ -310,7 +298,7 @@ class systolic_compute_ws:
                                                   axis=0)
 
                 # Account for the cycles for final output to drain out
-                if self.config.sparsity_support and self.config.sparsity_optimized_mapping:
+                if self.config.sparsity_support:
                     if inter_fold_gap_suffix_mat.shape[1] < this_fold_demand.shape[1]:
                         inter_fold_gap_suffix_mat = np.pad(
                             inter_fold_gap_suffix_mat,
@@ -318,15 +306,16 @@ class systolic_compute_ws:
                             constant_values=-1
                         )
                 this_fold_demand = np.concatenate((this_fold_demand, inter_fold_gap_suffix_mat),
-                                                  axis=0)                
-
-                # Add skew to the IFMAP demand matrix to reflect systolic pipeline fill
-                if not self.config.sparsity_optimized_mapping:
-                    this_fold_demand = skew_matrix(this_fold_demand)
+                                                  axis=0)
 
-                ifmap_demand_matrix_list.append(this_fold_demand)
+                # The folds skewed for row-wise sparsity are kept as they are
+                ifmap_demand_folds.append(fold_descriptor(this_fold_demand,
+                                                          this_fold_demand.shape[1]))
 
-        self.ifmap_demand_matrix = np.concatenate(ifmap_demand_matrix_list)
+        self.ifmap_demand_matrix = virtual_demand_matrix(ifmap_demand_folds[0].num_cols,
+                                                         dtype=self.addr_dtype)
+        for fold in ifmap_demand_folds:
+            self.ifmap_demand_matrix.append_fold(fold)
 
         if False:
             if self.config.sparsity_support is True:
@@ -343,19 +332,18 @@ class systolic_compute_ws:
         assert self.params_set_flag, 'Parameters are not set'
 
         inter_fold_gap_suffix = self.arr_row + self.arr_col + self.T - 2
-        inter_fold_gap_suffix_mat = np.ones((inter_fold_gap_suffix, self.arr_col)) * -1
 
         metadata_conversion_mat = [ [ ] ]
         if False:
             if self.config.sparsity_support is True:
                 if self.config.sparsity_representation == 'csr':
-                    metadata_conversion_mat = np.ones((1, self.arr_col)) * -1
+                    metadata_conversion_mat = np.full((1, self.arr_col), -1, dtype=self.addr_dtype)
                 elif self.config.sparsity_representation == 'csc':
-                    metadata_conversion_mat = np.ones((1, self.arr_col)) * -1
+                    metadata_conversion_mat = np.full((1, self.arr_col), -1, dtype=self.addr_dtype)
                 elif self.config.sparsity_representation == 'ellpack_block':
-                    metadata_conversion_mat = np.ones((0, self.arr_col)) * -1
+                    metadata_conversion_mat = np.full((0, self.arr_col), -1, dtype=self.addr_dtype)
 
-        filter_demand_matrix_list = []
+        self.filter_demand_matrix = virtual_demand_matrix(self.arr_col, dtype=self.addr_dtype)
         for fc in range(self.col_fold):
             # for fr in range(self.row_fold):
             for fr in range(self.row_fold_demand_matrices):
@@ -366,30 +354,19 @@ class systolic_compute_ws:
 
                 col_start_id = fc * self.arr_col
                 col_end_idx = min(col_start_id + self.arr_col, self.Sc)
-                col_delta = self.arr_col - (col_end_idx - col_start_id)
 
                 this_fold_demand = \
                     self.filter_op_mat[row_start_id:row_end_idx, col_start_id: col_end_idx]
                 self.filter_reads += this_fold_demand.shape[0] * this_fold_demand.shape[1]
 
-                # Take into account under utilization
-                if col_delta > 0:
-                    null_req_mat = np.ones((this_fold_demand.shape[0], col_delta)) * -1
-                    this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=1)
-
-                if row_delta > 0:
-                    null_req_mat = np.ones((row_delta, self.arr_col)) * -1
-                    this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=0)
-
                 # The filters are needed to be filled in reverse order to ensure that
                 # top element is pushed in last to maintain alignment with the input elements
+                # The null requests of the under utilized rows then come first
                 this_fold_demand = np.flip(this_fold_demand, 0)
 
-                sum_sparse = sum(list(row).count(-1) for row in this_fold_demand)
-
-                # Time for inputs to stream and the partial sums to drain out
-                this_fold_demand = np.concatenate((this_fold_demand, inter_fold_gap_suffix_mat),
-                                                  axis=0)
+                # The under utilized rows and cols are null requests as well
+                sum_sparse = int(np.count_nonzero(this_fold_demand == -1)) \
+                             + self.arr_row * self.arr_col - this_fold_demand.size
 
                 # Calculate the mapping efficiency
                 row_used = min(self.arr_row, row_end_idx - row_start_id)
@@ -400,7 +377,7 @@ class systolic_compute_ws:
                 mapping_eff_this_fold = \
                     ((self.arr_row * self.arr_col) - sum_sparse) / (self.arr_row * self.arr_col)
 
-                cycles_this_fold = this_fold_demand.shape[0] + this_fold_demand.shape[1] - 1
+                cycles_this_fold = self.arr_row + inter_fold_gap_suffix + self.arr_col - 1
                 compute_cycles_this_fold = mac_used * self.T
                 compute_util_this_fold = \
                     compute_cycles_this_fold / (self.arr_row * self.arr_col * cycles_this_fold)
@@ -408,14 +385,15 @@ class systolic_compute_ws:
                 self.mapping_efficiency_per_fold.append(mapping_eff_this_fold)
                 self.compute_utility_per_fold.append(compute_util_this_fold)
 
-                filter_demand_matrix_list.append(this_fold_demand)
+                # Time for inputs to stream and the partial sums to drain out
+                self.filter_demand_matrix.append_fold(
+                    fold_descriptor(this_fold_demand, self.arr_col, num_lead_lines=row_delta,
+                                    num_trail_lines=inter_fold_gap_suffix))
                 #if fr == 0 and fc == 0:
                 #    self.filter_demand_matrix = this_fold_demand
                 #else:
                 #    self.filter_demand_matrix = \
                 #       np.concatenate((self.filter_demand_matrix, this_fold_demand), axis=0)
-        
-        self.filter_demand_matrix = np.concatenate(filter_demand_matrix_list)
 
         if False:
             if self.config.sparsity_support is True:
@@ -432,54 +410,41 @@ class systolic_compute_ws:
         assert self.params_set_flag, 'Parameters are not set'
 
         inter_fold_gap_prefix = 2 * self.arr_row - 1
-        inter_fold_gap_prefix_mat = np.ones((inter_fold_gap_prefix, self.arr_col)) * -1
 
         metadata_conversion_mat = [ [ ] ]
         if False:
             if self.config.sparsity_support is True:
                 if self.config.sparsity_representation == 'csr':
-                    metadata_conversion_mat = np.ones((1, self.arr_col)) * -1
+                    metadata_conversion_mat = np.full((1, self.arr_col), -1, dtype=self.addr_dtype)
                 elif self.config.sparsity_representation == 'csc':
-                    metadata_conversion_mat = np.ones((1, self.arr_col)) * -1
+                    metadata_conversion_mat = np.full((1, self.arr_col), -1, dtype=self.addr_dtype)
                 elif self.config.sparsity_representation == 'ellpack_block':
-                    metadata_conversion_mat = np.ones((0, self.arr_col)) * -1
+                    metadata_conversion_mat = np.full((0, self.arr_col), -1, dtype=self.addr_dtype)
 
-        ofmap_demand_matrix_list = []
+        self.ofmap_demand_matrix = virtual_demand_matrix(self.arr_col, dtype=self.addr_dtype)
 
         for fc in range(self.col_fold):
             # for fr in range(self.row_fold):
             for fr in range(self.row_fold_demand_matrices):
                 col_start_id = fc * self.arr_col
                 col_end_idx = min(col_start_id + self.arr_col, self.Sc) # self.Sc
-                col_delta = self.arr_col - (col_end_idx - col_start_id)
 
                 this_fold_demand = self.ofmap_op_mat[:, col_start_id: col_end_idx]
                 self.ofmap_writes += this_fold_demand.shape[0] * this_fold_demand.shape[1]
 
-                # Adding null requests when there is under utilization ie. no mapping along a few
-                # rows or cols
-                if col_delta > 0:
-                    null_req_mat = np.ones((this_fold_demand.shape[0], col_delta)) * -1
-                    this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=1)
-
-                # Now add the prefix matrix
-                # These are the null demands to account for when the operands are streamed in
+                # The under utilized cols are null requests
+                # The prefix are the null demands to account for when the operands are streamed in
                 # and the OFMAPS are not ready
-                this_fold_demand = np.concatenate((inter_fold_gap_prefix_mat, this_fold_demand),
-                                                  axis=0)
-
                 # Add skew to the OFMAP demand matrix to reflect systolic pipeline fill
-                this_fold_demand = skew_matrix(this_fold_demand)
-
-                ofmap_demand_matrix_list.append(this_fold_demand)
+                self.ofmap_demand_matrix.append_fold(
+                    fold_descriptor(this_fold_demand, self.arr_col,
+                                    num_lead_lines=inter_fold_gap_prefix, skewed=True))
                 #if fr == 0 and fc == 0:
                 #    self.ofmap_demand_matrix = this_fold_demand
                 #else:
                 #    self.ofmap_demand_matrix = \
                 #       np.concatenate((self.ofmap_demand_matrix, this_fold_demand), axis=0)
 
-        self.ofmap_demand_matrix = np.concatenate(ofmap_demand_matrix_list)
-
         if False:
             if self.config.sparsity_support is True:
                 self.ofmap_demand_matrix = \
@@ -557,6 +522,18 @@ class systolic_compute_ws:
 
         return self.ifmap_demand_matrix, self.filter_demand_matrix, self.ofmap_demand_matrix
 
+    #
+    def get_demand_folds(self):
+        """
+        Method to get a generator of the ifmap, filter and ofmap demand lines of each fold, which
+        generates the lines of one fold at a time.
+        """
+        if not self.demand_mat_ready_flag:
+            self.create_demand_matrices()
+
+        return iter_demand_folds(self.ifmap_demand_matrix, self.filter_demand_matrix,
+                                 self.ofmap_demand_matrix)
+
     #
     def get_avg_mapping_efficiency(self):
         """
@@ -0,0 +1,435 @@
+"""
+This file contains the 'design_sweep' class that runs a topology over a grid of architecture design
+points, built in memory from a base config, and collects the results in one consolidated report.
+"""
+
+import copy
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from scalesim.result_cache import result_cache
+from scalesim.scale_config import scale_config as cfg
+from scalesim.topology_utils import topologies as topo
+from scalesim.single_layer_sim import single_layer_sim as layer_sim
+from scalesim.compute.operand_matrix import operand_matrix as opmat
+from scalesim.simulator import estimate_layer, get_layer_fingerprint
+
+
+# Topology and design point configs shared by the jobs run in a worker process. These are set once
+# per worker by init_sweep_worker() so that they are not sent again with every job.
+worker_topo = topo()
+worker_configs = []
+
+# The operand matrices of the last layer run in this worker. The jobs are ordered by layer, so the
+# consecutive jobs of a worker mostly run the same layer on different design points.
+worker_op_mat_layer_id = -1
+worker_op_mat = opmat()
+
+
+#
+def init_sweep_worker(topo_obj, config_list):
+    """
+    Function to install the topology and the design point configs in a worker process of the sweep.
+    """
+    global worker_topo, worker_configs      # pylint: disable=global-statement
+    global worker_op_mat_layer_id           # pylint: disable=global-statement
+    worker_topo = topo_obj
+    worker_configs = config_list
+    worker_op_mat_layer_id = -1
+
+
+#
+def get_worker_operand_matrix(layer_id, config_obj):
+    """
+    Function to get the operand matrices of a layer, reusing the ones of the previous job of this
+    worker if it ran the same layer. The swept knobs do not change the operand matrices.
+    """
+    global worker_op_mat_layer_id, worker_op_mat    # pylint: disable=global-statement
+
+    if not worker_op_mat_layer_id == layer_id:
+        worker_op_mat = opmat()
+        worker_op_mat.set_params(config_obj=config_obj,
+                                 topoutil_obj=worker_topo,
+                                 layer_id=layer_id)
+        worker_op_mat.create_operand_matrices()
+        worker_op_mat_layer_id = layer_id
+
+    return worker_op_mat
+
+
+#
+def run_sweep_job(point_id, layer_id):
+    """
+    Function to run a single layer on a single design point. Only the report items are sent back to
+    the parent process, no traces are saved.
+    """
+    config_obj = worker_configs[point_id]
+
+    if config_obj.get_run_mode() == 'analytic':
+        report_items = estimate_layer(layer_id, config_obj, worker_topo)
+        if report_items is not None:
+            return report_items
+
+    this_layer_sim = layer_sim()
+    this_layer_sim.set_params(layer_id=layer_id,
+                              config_obj=config_obj,
+                              topology_obj=worker_topo,
+                              verbose=False)
+    this_layer_sim.set_operand_matrix(get_worker_operand_matrix(layer_id, config_obj))
+    this_layer_sim.run()
+
+    return this_layer_sim.get_report_items()
+
+
+#
+def parse_sweep_values(values_string, value_type=int):
+    """
+    Function to parse the values of a swept knob. Either a comma separated list like '8,16,32' or
+    an inclusive range 'start:stop:step' like '8:64:8' is accepted.
+    """
+    values_string = values_string.strip()
+    if ':' in values_string:
+        range_items = [int(x.strip()) for x in values_string.split(':')]
+        assert len(range_items) == 3, 'A range should be given as start:stop:step'
+        start, stop, step = range_items
+        assert step > 0, 'The step of a range should be positive'
+        return list(range(start, stop + 1, step))
+
+    return [value_type(x.strip()) for x in values_string.split(',') if not x.strip() == '']
+
+
+class design_sweep:
+    """
+    Class which runs the layers of a topology on every design point of a sweep. The design points
+    are the cartesian product of the values given for the array dimensions, the SRAM sizes, the
+    dataflow and the bandwidth. The other parameters are taken from the base config.
+    """
+    #
+    def __init__(self):
+        """
+        __init__ method
+        """
+        self.base_config = cfg()
+        self.topo = topo()
+
+        self.top_path = "./"
+        self.verbose = True
+        self.num_workers = 1
+
+        # Values of each swept knob, in the order of the columns of the report
+        self.knob_names = ['ArrayHeight', 'ArrayWidth',
+                           'IfmapSramSzkB', 'FilterSramSzkB', 'OfmapSramSzkB',
+                           'Dataflow', 'Bandwidth']
+        self.knob_values = {}
+
+        # For each design point, the values of the knobs and the config object
+        self.design_points = []
+        self.config_list = []
+
+        self.num_layers = 0
+
+        # On-disk cache of layer results, used when a cache directory is set in the base config
+        self.cache = result_cache()
+        self.use_cache = False
+
+        # Report items for each design point, in layer order
+        self.point_report_items_list = []
+
+        self.params_set_flag = False
+        self.all_runs_done = False
+
+    #
+    def set_params(self,
+                   config_obj=cfg(),
+                   topo_obj=topo(),
+                   array_heights=None,
+                   array_widths=None,
+                   ifmap_sram_sizes_kb=None,
+                   filter_sram_sizes_kb=None,
+                   ofmap_sram_sizes_kb=None,
+                   dataflows=None,
+                   bandwidths=None,
+                   top_path="./",
+                   verbosity=True,
+                   num_workers=None
+                   ):
+        """
+        Method to set the base config, the topology and the values of the swept knobs. A knob which
+        is not provided keeps its value from the base config. When bandwidths are provided, the
+        design points run in USER bandwidth mode. If the number of workers is not provided, the
+        value from the base config is used.
+        """
+        self.base_config = config_obj
+        self.topo = topo_obj
+
+        self.top_path = top_path
+        self.verbose = verbosity
+
+        if num_workers is None:
+            num_workers = self.base_config.get_num_workers()
+        self.num_workers = num_workers
+
+        arr_h, arr_w = self.base_config.get_array_dims()
+        ifmap_kb, filter_kb, ofmap_kb = self.base_config.get_mem_sizes()
+        if bandwidths is None:
+            if self.base_config.use_user_dram_bandwidth():
+                bandwidths = [self.base_config.get_bandwidths_as_list()[0]]
+            else:
+                bandwidths = ['CALC']
+
+        knob_value_lists = [array_heights, array_widths,
+                            ifmap_sram_sizes_kb, filter_sram_sizes_kb, ofmap_sram_sizes_kb,
+                            dataflows, bandwidths]
+        base_values = [arr_h, arr_w, ifmap_kb, filter_kb, ofmap_kb,
+                       self.base_config.get_dataflow(), 'CALC']
+
+        self.knob_values = {}
+        for name, values, base_value in zip(self.knob_names, knob_value_lists, base_values):
+            if values is None or len(values) == 0:
+                values = [base_value]
+            self.knob_values[name] = list(values)
+
+        for dataflow in self.knob_values['Dataflow']:
+            assert dataflow in self.base_config.valid_df_list, 'Invalid dataflow: ' + str(dataflow)
+
+        self.num_layers = self.topo.get_num_layers()
+
+        self.create_design_points()
+
+        self.params_set_flag = True
+
+    #
+    def create_design_points(self):
+        """
+        Method to create the config object of every design point from a copy of the base config.
+        """
+        self.design_points = []
+        self.config_list = []
+
+        value_lists = [self.knob_values[name] for name in self.knob_names]
+        for point in itertools.product(*value_lists):
+            arr_h, arr_w, ifmap_kb, filter_kb, ofmap_kb, dataflow, bandwidth = point
+
+            config_obj = copy.deepcopy(self.base_config)
+            config_obj.set_arr_dims(rows=arr_h, cols=arr_w)
+            config_obj.set_buffer_sizes_kb(ifmap_size_kb=ifmap_kb,
+                                           filter_size_kb=filter_kb,
+                                           ofmap_size_kb=ofmap_kb)
+            config_obj.set_dataflow(dataflow)
+            if bandwidth == 'CALC':
+                config_obj.set_bw_mode_to_calc()
+            else:
+                config_obj.set_bw_mode_to_user([bandwidth])
+
+            self.design_points.append(point)
+            self.config_list.append(config_obj)
+
+    #
+    def get_num_design_points(self):
+        """
+        Method to get the number of design points in the sweep.
+        """
+        assert self.params_set_flag, 'Sweep parameters are not set'
+        return len(self.design_points)
+
+    #
+    def run(self):
+        """
+        Method to run every layer on every design point and generate the sweep report. The jobs
+        with identical layer and design point parameters are run only once. The distinct jobs are
+        run in a pool of worker processes when more than one worker is requested.
+        """
+        assert self.params_set_flag, 'Sweep parameters are not set'
+
+        if not os.path.isdir(self.top_path):
+            os.mkdir(self.top_path)
+
+        report_path = self.top_path + '/' + self.base_config.get_run_name()
+        if not os.path.isdir(report_path):
+            os.mkdir(report_path)
+
+        self.use_cache = not self.base_config.get_result_cache_dir() == ''
+        if self.use_cache:
+            self.cache.set_params(cache_dir=self.base_config.get_result_cache_dir(),
+                                  max_size_mb=self.base_config.get_result_cache_size_mb())
+
+        num_points = len(self.design_points)
+
+        # The jobs are ordered by layer so that a worker can reuse the operand matrices
+        source_job = {}
+        job_fingerprints = {}
+        results_per_fingerprint = {}
+        job_point_ids = []
+        job_layer_ids = []
+        for layer_id in range(self.num_layers):
+            for point_id in range(num_points):
+                fingerprint = get_layer_fingerprint(layer_id, self.config_list[point_id], self.topo)
+                job_fingerprints[(point_id, layer_id)] = fingerprint
+                if fingerprint in source_job or fingerprint in results_per_fingerprint:
+                    continue
+                source_job[fingerprint] = (point_id, layer_id)
+
+                cached_results = self.get_cached_job(point_id, layer_id)
+                if cached_results is not None:
+                    results_per_fingerprint[fingerprint] = cached_results
+                    continue
+
+                job_point_ids.append(point_id)
+                job_layer_ids.append(layer_id)
+
+        num_workers = self.num_workers
+        if num_workers < 1:
+            num_workers = os.cpu_count()
+        num_jobs = len(job_point_ids)
+
+        if self.verbose:
+            print('Sweeping ' + str(num_points) + ' design points over '
+                  + str(self.num_layers) + ' layers')
+            print('Running ' + str(num_jobs) + ' distinct jobs out of '
+                  + str(num_points * self.num_layers) + ' on ' + str(num_workers) + ' workers')
+
+        if num_workers == 1:
+            init_sweep_worker(self.topo, self.config_list)
+            results = map(run_sweep_job, job_point_ids, job_layer_ids)
+            self.collect_results(results, job_point_ids, job_layer_ids,
+                                 job_fingerprints, results_per_fingerprint)
+        else:
+            chunk_size = max(1, math.ceil(num_points / num_workers))
+            with ProcessPoolExecutor(max_workers=num_workers,
+                                     initializer=init_sweep_worker,
+                                     initargs=(self.topo, self.config_list)) as executor:
+                results = executor.map(run_sweep_job, job_point_ids, job_layer_ids,
+                                       chunksize=chunk_size)
+                self.collect_results(results, job_point_ids, job_layer_ids,
+                                     job_fingerprints, results_per_fingerprint)
+
+        self.point_report_items_list = []
+        for point_id in range(num_points):
+            report_items_this_point = []
+            for layer_id in range(self.num_layers):
+                fingerprint = job_fingerprints[(point_id, layer_id)]
+                report_items_this_point.append(results_per_fingerprint[fingerprint])
+            self.point_report_items_list.append(report_items_this_point)
+
+        self.all_runs_done = True
+
+        self.generate_report(report_path)
+
+    #
+    def collect_results(self, results, job_point_ids, job_layer_ids,
+                        job_fingerprints, results_per_fingerprint):
+        """
+        Method to gather the report items of the jobs as they finish and store them in the result
+        cache.
+        """
+        num_jobs = len(job_point_ids)
+        for job_id, report_items in enumerate(results):
+            point_id = job_point_ids[job_id]
+            layer_id = job_layer_ids[job_id]
+            results_per_fingerprint[job_fingerprints[(point_id, layer_id)]] = report_items
+            self.cache_job(point_id, layer_id, report_items)
+
+            if self.verbose:
+                print('Job ' + str(job_id + 1) + '/' + str(num_jobs) + ' done: '
+                      + 'point ' + str(point_id) + ', layer ' + str(layer_id))
+
+    #
+    def get_cached_job(self, point_id, layer_id):
+        """
+        Method to get the report items of a job from the result cache. Returns None on a miss.
+        """
+        if not self.use_cache:
+            return None
+
+        key = self.cache.get_key(self.topo.get_layer_params(layer_id),
+                                 self.config_list[point_id].get_timing_conf_as_list())
+        cached_results = self.cache.lookup(key)
+        if cached_results is None:
+            return None
+
+        report_items, _ = cached_results
+        return report_items
+
+    #
+    def cache_job(self, point_id, layer_id, report_items):
+        """
+        Method to store the report items of a job in the result cache.
+        """
+        if not self.use_cache:
+            return
+
+        key = self.cache.get_key(self.topo.get_layer_params(layer_id),
+                                 self.config_list[point_id].get_timing_conf_as_list())
+        self.cache.store(key, report_items)
+
+    #
+    def generate_report(self, report_path):
+        """
+        Method to write SWEEP_REPORT.csv, with one row per design point and layer holding the values
+        of the swept knobs followed by the compute and bandwidth report items. In the analytic run
+        mode only the SRAM bandwidths are written.
+        """
+        assert self.all_runs_done, 'Sweep runs are not done yet'
+
+        sweep_report_name = report_path + '/SWEEP_REPORT.csv'
+        sweep_report = open(sweep_report_name, 'w')
+
+        header = 'PointID, ' + ', '.join(self.knob_names) + ', LayerID, '
+        header += ('Total Cycles, Stall Cycles, Overall Util %, Mapping Efficiency %,'
+                   ' Compute Util %, ')
+        if self.base_config.sparsity_support is True:
+            header += ('Avg IFMAP SRAM BW, Avg FILTER SRAM BW, Avg FILTER Metadata SRAM BW,'
+                       ' Avg OFMAP SRAM BW,')
+            num_sram_items = 4
+        else:
+            header += 'Avg IFMAP SRAM BW, Avg FILTER SRAM BW, Avg OFMAP SRAM BW,'
+            num_sram_items = 3
+        analytic_mode = self.base_config.get_run_mode() == 'analytic'
+        if not analytic_mode:
+            header += ' Avg IFMAP DRAM BW, Avg FILTER DRAM BW, Avg OFMAP DRAM BW,'
+        header += '\n'
+        sweep_report.write(header)
+
+        for point_id, point in enumerate(self.design_points):
+            for layer_id in range(self.num_layers):
+                report_items = self.point_report_items_list[point_id][layer_id]
+                bandwidth_items = report_items['bandwidth']
+                if analytic_mode:
+                    bandwidth_items = bandwidth_items[:num_sram_items]
+
+                log = str(point_id) + ', '
+                log += ', '.join([str(x) for x in point]) + ', '
+                log += str(layer_id) + ', '
+                log += ', '.join([str(x) for x in report_items['compute']]) + ', '
+                log += ', '.join([str(x) for x in bandwidth_items])
+                log += ',\n'
+                sweep_report.write(log)
+
+        sweep_report.close()
+
+    #
+    def get_report_items(self, point_id):
+        """
+        Method to get the report items of every layer of a design point.
+        """
+        assert self.all_runs_done, 'Sweep runs are not done yet'
+        return self.point_report_items_list[point_id]
+
+    #
+    def get_total_cycles_per_point(self):
+        """
+        Method which aggregates the total cycles (both compute and stall) across all the layers, for
+        every design point.
+        """
+        assert self.all_runs_done, 'Sweep runs are not done yet'
+
+        total_cycles_list = []
+        for report_items_this_point in self.point_report_items_list:
+            total_cycles = 0
+            for report_items in report_items_this_point:
+                total_cycles += int(report_items['compute'][0])
+            total_cycles_list.append(total_cycles)
+
+        return total_cycles_list
@@ -3,7 +3,6 @@ This file contains the 'double_buffered_scratchpad' class that handles memory mo
 double buffered SRAMs.
 """
 
-import time
 import os
 import numpy as np
 from tqdm import tqdm
@@ -13,6 +12,7 @@ from scalesim.memory.read_buffer_estimate_bw import ReadBufferEstimateBw as rdbu
 from scalesim.memory.read_port import read_port as rdport
 from scalesim.memory.write_buffer import write_buffer as wrbuf
 from scalesim.memory.write_port import write_port as wrport
+from scalesim.memory.trace_array import trace_array
 
 
 class double_buffered_scratchpad:
@@ -36,9 +36,15 @@ class double_buffered_scratchpad:
 
         self.verbose = True
 
-        self.ifmap_trace_matrix = np.zeros((1,1), dtype=int)
-        self.filter_trace_matrix = np.zeros((1,1), dtype=int)
-        self.ofmap_trace_matrix = np.zeros((1,1), dtype=int)
+        # The SRAM traces are made of the serviced cycles and the demand lines, which are only
+        # put together when the traces are asked for
+        self.ifmap_serviced_cycles = np.zeros((1,1), dtype=int)
+        self.filter_serviced_cycles = np.zeros((1,1), dtype=int)
+        self.ofmap_serviced_cycles = np.zeros((1,1), dtype=int)
+
+        self.ifmap_demand_mat = np.zeros((1,0), dtype=int)
+        self.filter_demand_mat = np.zeros((1,0), dtype=int)
+        self.ofmap_demand_mat = np.zeros((1,0), dtype=int)
 
         # Metrics to gather for generating run reports
         self.total_cycles = 0
@@ -56,6 +62,10 @@ class double_buffered_scratchpad:
         self.ofmap_sram_start_cycle = 0
         self.ofmap_sram_stop_cycle = 0
 
+        self.ifmap_sram_active_lines = 0
+        self.filter_sram_active_lines = 0
+        self.ofmap_sram_active_lines = 0
+
         self.ifmap_dram_start_cycle = 0
         self.ifmap_dram_stop_cycle = 0
         self.ifmap_dram_reads = 0
@@ -68,6 +78,9 @@ class double_buffered_scratchpad:
 
         self.estimate_bandwidth_mode = False
         self.traces_valid = False
+
+        # Directory where the traces are spilled as they grow, if any
+        self.spill_dir = None
         self.params_valid_flag = True
 
     #
@@ -77,12 +90,16 @@ class double_buffered_scratchpad:
                    word_size=1,
                    ifmap_buf_size_bytes=2, filter_buf_size_bytes=2, ofmap_buf_size_bytes=2,
                    rd_buf_active_frac=0.5, wr_buf_active_frac=0.5,
-                   ifmap_backing_buf_bw=1, filter_backing_buf_bw=1, ofmap_backing_buf_bw=1):
+                   ifmap_backing_buf_bw=1, filter_backing_buf_bw=1, ofmap_backing_buf_bw=1,
+                   spill_dir=None):
         """
-        Method to set the double buffered memory simulation parameters for housekeeping.
+        Method to set the double buffered memory simulation parameters for housekeeping. If
+        spill_dir is provided, the DRAM traces of the buffers and the serviced cycles of the SRAM
+        traces are spilled to files in this directory as they grow, and are kept in chunks.
         """
 
         self.estimate_bandwidth_mode = estimate_bandwidth_mode
+        self.spill_dir = spill_dir
 
         if self.estimate_bandwidth_mode:
             self.ifmap_buf = rdbuf_est()
@@ -92,13 +109,15 @@ class double_buffered_scratchpad:
                                       total_size_bytes=ifmap_buf_size_bytes,
                                       word_size=word_size,
                                       active_buf_frac=rd_buf_active_frac,
-                                      backing_buf_default_bw=ifmap_backing_buf_bw)
+                                      backing_buf_default_bw=ifmap_backing_buf_bw,
+                                      spill_dir=spill_dir)
 
             self.filter_buf.set_params(backing_buf_obj=self.filter_port,
                                        total_size_bytes=filter_buf_size_bytes,
                                        word_size=word_size,
                                        active_buf_frac=rd_buf_active_frac,
-                                       backing_buf_default_bw=filter_backing_buf_bw)
+                                       backing_buf_default_bw=filter_backing_buf_bw,
+                                       spill_dir=spill_dir)
         else:
             self.ifmap_buf = rdbuf()
             self.filter_buf = rdbuf()
@@ -107,19 +126,22 @@ class double_buffered_scratchpad:
                                       total_size_bytes=ifmap_buf_size_bytes,
                                       word_size=word_size,
                                       active_buf_frac=rd_buf_active_frac,
-                                      backing_buf_bw=ifmap_backing_buf_bw)
+                                      backing_buf_bw=ifmap_backing_buf_bw,
+                                      spill_dir=spill_dir)
 
             self.filter_buf.set_params(backing_buf_obj=self.filter_port,
                                        total_size_bytes=filter_buf_size_bytes,
                                        word_size=word_size,
                                        active_buf_frac=rd_buf_active_frac,
-                                       backing_buf_bw=filter_backing_buf_bw)
+                                       backing_buf_bw=filter_backing_buf_bw,
+                                       spill_dir=spill_dir)
 
         self.ofmap_buf.set_params(backing_buf_obj=self.ofmap_port,
                                   total_size_bytes=ofmap_buf_size_bytes,
                                   word_size=word_size,
                                   active_buf_frac=wr_buf_active_frac,
-                                  backing_buf_bw=ofmap_backing_buf_bw)
+                                  backing_buf_bw=ofmap_backing_buf_bw,
+                                  spill_dir=spill_dir)
 
         self.verbose = verbose
 
@@ -188,49 +210,59 @@ class double_buffered_scratchpad:
     def service_memory_requests(self, ifmap_demand_mat, filter_demand_mat, ofmap_demand_mat):
         """
         Method to run the memory simulation of ifmap, filter and ofmap SRAMs together and generate
-        the traces.
+        the traces, servicing the whole demand matrices as a single fold.
         """
-        assert self.params_valid_flag, 'Memories not initialized yet'
+        self.service_memory_folds([(ifmap_demand_mat, filter_demand_mat, ofmap_demand_mat)],
+                                  ifmap_demand_mat, filter_demand_mat, ofmap_demand_mat)
 
-        ofmap_lines = ofmap_demand_mat.shape[0]
+    #
+    def service_memory_folds(self, demand_folds, ifmap_demand_mat, filter_demand_mat,
+                             ofmap_demand_mat, update_activity=True):
+        """
+        Method to run the memory simulation of ifmap, filter and ofmap SRAMs together and generate
+        the traces, consuming the demand lines one fold at a time. demand_folds is an iterable,
+        like a generator, of the ifmap, filter and ofmap demand lines of each fold in order. The
+        state of the buffers and the stall cycles carry over from one fold to the next, so the
+        results are the same as servicing the whole demand matrices at once. The demand matrices,
+        which can be virtual, are only kept to put the SRAM traces together. Unless update_activity
+        is unset, the SRAM traces are then scanned for their start and stop cycles, otherwise
+        update_sram_activity() has to be called before they are read.
+        """
+        assert self.params_valid_flag, 'Memories not initialized yet'
 
         self.total_cycles = 0
         self.stall_cycles = 0
 
-        ifmap_hit_latency = self.ifmap_buf.get_hit_latency()
-        filter_hit_latency = self.filter_buf.get_hit_latency()
-
-        ifmap_serviced_cycles = []
-        filter_serviced_cycles = []
-        ofmap_serviced_cycles = []
+        # Serviced cycles of the demand lines, as in the first column of the traces
+        ifmap_serviced_cycles = trace_array(spill_dir=self.spill_dir)
+        filter_serviced_cycles = trace_array(spill_dir=self.spill_dir)
+        ofmap_serviced_cycles = trace_array(spill_dir=self.spill_dir)
 
         pbar_disable = not self.verbose
-        for i in tqdm(range(ofmap_lines), disable=pbar_disable):
-
-            cycle_arr = np.zeros((1,1)) + i + self.stall_cycles
-
-            ifmap_demand_line = ifmap_demand_mat[i, :].reshape((1,ifmap_demand_mat.shape[1]))
-            ifmap_cycle_out = \
-                self.ifmap_buf.service_reads(incoming_requests_arr_np=ifmap_demand_line,
-                                             incoming_cycles_arr=cycle_arr)
-            ifmap_serviced_cycles += [ifmap_cycle_out[0]]
-            ifmap_stalls = ifmap_cycle_out[0] - cycle_arr[0] - ifmap_hit_latency
+        pbar = tqdm(total=ofmap_demand_mat.shape[0], disable=pbar_disable)
+
+        first_fold = True
+        line_id = 0
+        for ifmap_fold_demand, filter_fold_demand, ofmap_fold_demand in demand_folds:
+            if self.estimate_bandwidth_mode:
+                # The estimate bandwidth buffers track the new addresses of each fold up front
+                if first_fold:
+                    self.ifmap_buf.set_demand_matrix(ifmap_fold_demand)
+                    self.filter_buf.set_demand_matrix(filter_fold_demand)
+                else:
+                    self.ifmap_buf.add_demand_lines(ifmap_fold_demand)
+                    self.filter_buf.add_demand_lines(filter_fold_demand)
+            first_fold = False
+
+            fold_serviced_cycles = \
+                self.service_demand_lines(ifmap_fold_demand, filter_fold_demand,
+                                          ofmap_fold_demand, first_line_id=line_id, pbar=pbar)
+            ifmap_serviced_cycles.append(fold_serviced_cycles[0])
+            filter_serviced_cycles.append(fold_serviced_cycles[1])
+            ofmap_serviced_cycles.append(fold_serviced_cycles[2])
+            line_id += ofmap_fold_demand.shape[0]
 
-            filter_demand_line = filter_demand_mat[i, :].reshape((1, filter_demand_mat.shape[1]))
-            filter_cycle_out = \
-                self.filter_buf.service_reads(incoming_requests_arr_np=filter_demand_line,
-                                              incoming_cycles_arr=cycle_arr)
-            filter_serviced_cycles += [filter_cycle_out[0]]
-            filter_stalls = filter_cycle_out[0] - cycle_arr[0] - filter_hit_latency
-
-            ofmap_demand_line = ofmap_demand_mat[i, :].reshape((1, ofmap_demand_mat.shape[1]))
-            ofmap_cycle_out = \
-                self.ofmap_buf.service_writes(incoming_requests_arr_np=ofmap_demand_line,
-                                              incoming_cycles_arr_np=cycle_arr)
-            ofmap_serviced_cycles += [ofmap_cycle_out[0]]
-            ofmap_stalls = ofmap_cycle_out[0] - cycle_arr[0]
-
-            self.stall_cycles += int(max(ifmap_stalls[0], filter_stalls[0], ofmap_stalls[0]))
+        pbar.close()
 
         if self.estimate_bandwidth_mode:
             # IDE shows warning as complete_all_prefetches is not implemented in read_buffer class
@@ -238,185 +270,183 @@ class double_buffered_scratchpad:
             self.ifmap_buf.complete_all_prefetches()
             self.filter_buf.complete_all_prefetches()
 
-        self.ofmap_buf.empty_all_buffers(ofmap_serviced_cycles[-1])
-
-        # Prepare the traces
-        ifmap_services_cycles_np = \
-            np.asarray(ifmap_serviced_cycles).reshape((len(ifmap_serviced_cycles), 1))
-        self.ifmap_trace_matrix = np.concatenate((ifmap_services_cycles_np, ifmap_demand_mat),
-                                                 axis=1)
-
-        filter_services_cycles_np = \
-            np.asarray(filter_serviced_cycles).reshape((len(filter_serviced_cycles), 1))
-        self.filter_trace_matrix = np.concatenate((filter_services_cycles_np, filter_demand_mat),
-                                                  axis=1)
-
-        ofmap_services_cycles_np = \
-            np.asarray(ofmap_serviced_cycles).reshape((len(ofmap_serviced_cycles), 1))
-        self.ofmap_trace_matrix = np.concatenate((ofmap_services_cycles_np, ofmap_demand_mat),
-                                                 axis=1)
-        self.total_cycles = int(ofmap_serviced_cycles[-1][0])
+        # Keep what makes the traces. The spilled serviced cycles stay in chunks, which are read a
+        # range of lines at a time like the arrays.
+        if self.spill_dir is None:
+            ifmap_serviced_cycles = ifmap_serviced_cycles.get_array()
+            filter_serviced_cycles = filter_serviced_cycles.get_array()
+            ofmap_serviced_cycles = ofmap_serviced_cycles.get_array()
+        self.ifmap_serviced_cycles = ifmap_serviced_cycles
+        self.filter_serviced_cycles = filter_serviced_cycles
+        self.ofmap_serviced_cycles = ofmap_serviced_cycles
+        self.ifmap_demand_mat = ifmap_demand_mat
+        self.filter_demand_mat = filter_demand_mat
+        self.ofmap_demand_mat = ofmap_demand_mat
+
+        self.ofmap_buf.empty_all_buffers(self.ofmap_serviced_cycles[-1])
+        self.total_cycles = int(self.ofmap_serviced_cycles[-1][0])
+        if update_activity:
+            self.update_sram_activity()
 
         # END of serving demands from memory
         self.traces_valid = True
 
-    # This is the trace computation logic of this memory system
-    # Anand: This is too complex, perform the serve cycle by cycle for the requests
-    def service_memory_requests_old(self, ifmap_demand_mat, filter_demand_mat, ofmap_demand_mat):
-        """
-        This is the trace computation logic of this memory system.
+    #
+    def service_demand_lines(self, ifmap_demand_mat, filter_demand_mat, ofmap_demand_mat,
+                             first_line_id=0, pbar=None):
+        """
+        Method to service the next demand lines of ifmap, filter and ofmap SRAMs together, which
+        start at line first_line_id of the whole demand. Returns the serviced cycles of the lines
+        for the three SRAMs. The demand lines are handed to the buffers in blocks. The leading lines
+        of a block which none of the buffers stalls on are serviced together, and only the line
+        where a prefetch, a drain or a stall happens is serviced on its own. The block size grows
+        while the blocks are stall free and shrinks around the stalls. The runs of lines where none
+        of the SRAMs has a request, like the gaps between the folds, are skipped in one step. The
+        demand matrices are only sliced in ranges of lines, so virtual demand matrices generating
+        their lines on request can be used as well as arrays.
         """
-        # TODO: assert sanity check
-        assert self.params_valid_flag, 'Memories not initialized yet'
-
-        # Logic:
-        # Stalls can occur in both read and write portions and interfere with each other
-        # We mitigate interference by picking a window in which there are no write stall,
-        # ie, there is sufficient free space in the write buffer
-
-        # The three demand mats have the same shape though
-        ofmap_lines_remaining = ofmap_demand_mat.shape[0]
-        start_line_idx = 0
-        end_line_idx = 0
-
-        first = True
-        cycle_offset = 0
-        self.total_cycles = 0
-        self.stall_cycles = 0
+        ofmap_lines = ofmap_demand_mat.shape[0]
 
-        # Status bar
-        pbar_disable = not self.verbose #or True
-        pbar = tqdm(total=ofmap_lines_remaining, disable=pbar_disable)
-
-        avg_read_time_series = []
-
-        while ofmap_lines_remaining > 0:
-            loop_start_time = time.time()
-            ofmap_free_space = self.ofmap_buf.get_free_space()
-
-            # Find the number of lines till the ofmap_free_space is filled up
-            count = 0
-            while not count > ofmap_free_space:
-                this_line = ofmap_demand_mat[end_line_idx]
-                for elem in this_line:
-                    if not elem == -1:
-                        count += 1
-
-                if not count > ofmap_free_space:
-                    end_line_idx += 1
-                    # Limit check
-                    if not end_line_idx < ofmap_demand_mat.shape[0]:
-                        end_line_idx = ofmap_demand_mat.shape[0] - 1
-                        count = ofmap_free_space + 1
-                else:   # Send request with minimal data ie one line of the requests
-                    end_line_idx += 1
-            # END of line counting
-
-            num_lines = end_line_idx - start_line_idx + 1
-            this_req_cycles_arr = [int(x + cycle_offset) for x in range(num_lines)]
-            this_req_cycles_arr_np = np.asarray(this_req_cycles_arr).reshape((num_lines,1))
-
-            this_req_ifmap_demands = ifmap_demand_mat[start_line_idx:(end_line_idx + 1), :]
-            this_req_filter_demands = filter_demand_mat[start_line_idx:(end_line_idx + 1), :]
-            this_req_ofmap_demands = ofmap_demand_mat[start_line_idx:(end_line_idx + 1), :]
-
-            no_stall_cycles = num_lines     # Since the cycles are consecutive at this point
-
-            time_start = time.time()
-            ifmap_cycles_out = \
-                self.ifmap_buf.service_reads(incoming_requests_arr_np=this_req_ifmap_demands,
-                                             incoming_cycles_arr=this_req_cycles_arr_np)
-            time_end = time.time()
-            delta = time_end - time_start
-            avg_read_time_series.append(delta)
-
-            # Take care of the incurred stalls when launching demands for filter_reads
-            # Note: Stalls incurred on reading line i in ifmap reflect the request cycles for line
-            #       i+1 in filter
-            ifmap_hit_latency = self.ifmap_buf.get_hit_latency()
-            # Vec - vec - scalar
-            ifmap_stalls = ifmap_cycles_out - this_req_cycles_arr_np - ifmap_hit_latency
-            # Shift by one row
-            ifmap_stalls = np.concatenate((np.zeros((1,1)), ifmap_stalls[0:-1]), axis=0)
-            this_req_cycles_arr_np = this_req_cycles_arr_np + ifmap_stalls
-
-            time_start = time.time()
-            filter_cycles_out = \
-                self.filter_buf.service_reads(incoming_requests_arr_np=this_req_filter_demands,
-                                              incoming_cycles_arr=this_req_cycles_arr_np)
-            time_end = time.time()
-            delta = time_end - time_start
-            avg_read_time_series.append(delta)
-
-            # Take care of stalls again --> The entire array stops when there is a stall
-            filter_hit_latency = self.filter_buf.get_hit_latency()
-            # Vec - vec - scalar
-            filter_stalls = filter_cycles_out - this_req_cycles_arr_np - filter_hit_latency
-            # Shift by one row
-            filter_stalls = np.concatenate((np.zeros((1, 1)), filter_stalls[0:-1]), axis=0)
-            this_req_cycles_arr_np = this_req_cycles_arr_np + filter_stalls
-
-            ofmap_cycles_out = \
-                self.ofmap_buf.service_writes(incoming_requests_arr_np=this_req_ofmap_demands,
-                                              incoming_cycles_arr_np=this_req_cycles_arr_np)
-
-            # Make the trace matrices
-            this_req_ifmap_trace_matrix = \
-                np.concatenate((ifmap_cycles_out, this_req_ifmap_demands), axis=1)
-            this_req_filter_trace_matrix = \
-                np.concatenate((filter_cycles_out, this_req_filter_demands), axis=1)
-            this_req_ofmap_trace_matrix = \
-                np.concatenate((ofmap_cycles_out, this_req_ofmap_demands), axis=1)
-
-            actual_cycles = ofmap_cycles_out[-1][0] - this_req_cycles_arr_np[0][0] + 1
-            num_stalls = actual_cycles - no_stall_cycles
-
-            self.stall_cycles += num_stalls
-            self.total_cycles = ofmap_cycles_out[-1][0] + 1         # OFMAP is served the last
-
-            if first:
-                first = False
-                self.ifmap_trace_matrix = this_req_ifmap_trace_matrix
-                self.filter_trace_matrix = this_req_filter_trace_matrix
-                self.ofmap_trace_matrix = this_req_ofmap_trace_matrix
+        # Serviced cycles of the demand lines, as in the first column of the traces
+        ifmap_serviced_cycles = np.zeros((ofmap_lines, 1), dtype=np.int64)
+        filter_serviced_cycles = np.zeros((ofmap_lines, 1), dtype=np.int64)
+        ofmap_serviced_cycles = np.zeros((ofmap_lines, 1), dtype=np.int64)
+
+        min_block_lines = 16
+        max_block_lines = 2 ** 14
+        block_lines = min_block_lines
+
+        # Runs of at least min_block_lines lines without any request
+        null_run_starts, null_run_ends = \
+            self.get_null_line_runs(ifmap_demand_mat, filter_demand_mat, ofmap_demand_mat,
+                                    min_run_lines=min_block_lines)
+        null_run_id = 0
+
+        line_id = 0
+        while line_id < ofmap_lines:
+            next_null_line_id = ofmap_lines
+            if null_run_id < null_run_starts.shape[0]:
+                next_null_line_id = int(null_run_starts[null_run_id])
+
+            if line_id == next_null_line_id:
+                # Nothing to service but the passing cycles, so no stall, prefetch or drain
+                end_line_id = int(null_run_ends[null_run_id])
+                null_run_id += 1
+                cycles_arr = np.arange(line_id, end_line_id, dtype=np.int64).reshape((-1, 1)) \
+                             + first_line_id + self.stall_cycles
+
+                ifmap_serviced_cycles[line_id:end_line_id] = \
+                    self.ifmap_buf.service_null_reads(cycles_arr)
+                filter_serviced_cycles[line_id:end_line_id] = \
+                    self.filter_buf.service_null_reads(cycles_arr)
+                ofmap_serviced_cycles[line_id:end_line_id] = \
+                    self.ofmap_buf.service_null_writes(cycles_arr)
+
+                if pbar is not None:
+                    pbar.update(end_line_id - line_id)
+                line_id = end_line_id
+                continue
+
+            end_line_id = min(line_id + block_lines, next_null_line_id)
+            num_block_lines = end_line_id - line_id
+            cycles_arr = np.arange(line_id, end_line_id, dtype=np.int64).reshape((-1, 1)) \
+                         + first_line_id + self.stall_cycles
+            ifmap_demands = ifmap_demand_mat[line_id:end_line_id, :]
+            filter_demands = filter_demand_mat[line_id:end_line_id, :]
+            ofmap_demands = ofmap_demand_mat[line_id:end_line_id, :]
+
+            num_lines = self.ifmap_buf.get_num_stall_free_lines(ifmap_demands, cycles_arr)
+            if num_lines > 0:
+                num_lines = min(num_lines,
+                                self.filter_buf.get_num_stall_free_lines(filter_demands,
+                                                                         cycles_arr))
+            if num_lines > 0:
+                num_lines = min(num_lines,
+                                self.ofmap_buf.get_num_stall_free_lines(ofmap_demands, cycles_arr))
+
+            if num_lines > 0:
+                cycles_arr = cycles_arr[:num_lines]
+                end_line_id = line_id + num_lines
+                ifmap_serviced_cycles[line_id:end_line_id] = \
+                    self.ifmap_buf.service_stall_free_reads(ifmap_demands[:num_lines], cycles_arr)
+                filter_serviced_cycles[line_id:end_line_id] = \
+                    self.filter_buf.service_stall_free_reads(filter_demands[:num_lines],
+                                                             cycles_arr)
+                ofmap_serviced_cycles[line_id:end_line_id] = \
+                    self.ofmap_buf.service_stall_free_writes(ofmap_demands[:num_lines],
+                                                             cycles_arr)
+            else:
+                num_lines = 1
+                ifmap_serviced_cycles[line_id], filter_serviced_cycles[line_id], \
+                    ofmap_serviced_cycles[line_id] = \
+                    self.service_memory_line(ifmap_demands[:1], filter_demands[:1],
+                                             ofmap_demands[:1], cycles_arr[:1])
+
+            if num_lines == num_block_lines:
+                block_lines = min(2 * block_lines, max_block_lines)
             else:
-                self.ifmap_trace_matrix = \
-                    np.concatenate((self.ifmap_trace_matrix, this_req_ifmap_trace_matrix), axis=0)
-                self.filter_trace_matrix = \
-                    np.concatenate((self.filter_trace_matrix, this_req_filter_trace_matrix), axis=0)
-                self.ofmap_trace_matrix = \
-                    np.concatenate((self.ofmap_trace_matrix, this_req_ofmap_trace_matrix), axis=0)
+                block_lines = max(block_lines // 2, min_block_lines)
 
-            # Update the local variable for another iteration of the while loop
-            cycle_offset = ofmap_cycles_out[-1][0] + 1
-            start_line_idx = end_line_idx + 1
+            line_id += num_lines
+            if pbar is not None:
+                pbar.update(num_lines)
 
-            pbar.update(num_lines)
-            # Cutoff at 0
-            ofmap_lines_remaining = max(ofmap_demand_mat.shape[0] - (end_line_idx + 1), 0)
-            # print("DEBUG: " + str(end_line_idx))
+        return ifmap_serviced_cycles, filter_serviced_cycles, ofmap_serviced_cycles
 
-            if end_line_idx > ofmap_demand_mat.shape[0]:
-                print('Trap')
+    #
+    @staticmethod
+    def get_null_line_runs(ifmap_demand_mat, filter_demand_mat, ofmap_demand_mat,
+                           min_run_lines=1, chunk_lines=2 ** 14):
+        """
+        Method to find the runs of at least min_run_lines demand lines without a request for any
+        of the SRAMs. Returns the ids of the first lines of the runs and of the lines after them.
+        The demand lines are checked chunk_lines at a time.
+        """
+        num_lines = ofmap_demand_mat.shape[0]
+        null_lines = np.zeros(num_lines, dtype=bool)
+        for start_line in range(0, num_lines, chunk_lines):
+            end_line = min(start_line + chunk_lines, num_lines)
+            null_lines[start_line:end_line] = \
+                np.all(ifmap_demand_mat[start_line:end_line] == -1, axis=1) \
+                & np.all(filter_demand_mat[start_line:end_line] == -1, axis=1) \
+                & np.all(ofmap_demand_mat[start_line:end_line] == -1, axis=1)
+
+        edges = np.diff(np.concatenate(([0], null_lines.astype(np.int8), [0])))
+        run_starts = np.flatnonzero(edges == 1)
+        run_ends = np.flatnonzero(edges == -1)
+
+        long_runs = run_ends - run_starts >= min_run_lines
+        return run_starts[long_runs], run_ends[long_runs]
 
-            # if int(ofmap_lines_remaining % 1000) == 0:
-            #     print("DEBUG: " + str(ofmap_lines_remaining))
+    #
+    def service_memory_line(self, ifmap_demand_line, filter_demand_line, ofmap_demand_line,
+                            cycle_arr):
+        """
+        Method to service a single line of demands, which may prefetch, drain or stall. The stalls
+        of the line are added to the stall cycles. Returns the serviced cycles of the line for the
+        ifmap, filter and ofmap SRAMs.
+        """
+        ifmap_hit_latency = self.ifmap_buf.get_hit_latency()
+        filter_hit_latency = self.filter_buf.get_hit_latency()
 
-            # loop_end_time = time.time()
-            # loop_time = loop_end_time - loop_start_time
-            # print('DEBUG: Time taken in one iteration: ' + str(loop_time))
+        ifmap_cycle_out = \
+            self.ifmap_buf.service_reads(incoming_requests_arr_np=ifmap_demand_line,
+                                         incoming_cycles_arr=cycle_arr)
+        ifmap_stalls = ifmap_cycle_out[0] - cycle_arr[0] - ifmap_hit_latency
 
-        # At this stage there might still be some data in the active buffer of the OFMAP scratchpad
-        # The following drains it and generates the OFMAP
-        drain_start_cycle = self.ofmap_trace_matrix[-1][0] + 1
-        self.ofmap_buf.empty_all_buffers(drain_start_cycle)
+        filter_cycle_out = \
+            self.filter_buf.service_reads(incoming_requests_arr_np=filter_demand_line,
+                                          incoming_cycles_arr=cycle_arr)
+        filter_stalls = filter_cycle_out[0] - cycle_arr[0] - filter_hit_latency
 
-        #avg_read_time = sum(avg_read_time_series) / len(avg_read_time_series)
-        #print('DEBUG: Avg time to service reads= ' + str(avg_read_time))
+        ofmap_cycle_out = \
+            self.ofmap_buf.service_writes(incoming_requests_arr_np=ofmap_demand_line,
+                                          incoming_cycles_arr_np=cycle_arr)
+        ofmap_stalls = ofmap_cycle_out[0] - cycle_arr[0]
 
-        pbar.close()
-        # END of serving demands from memory
-        self.traces_valid = True
+        self.stall_cycles += int(max(ifmap_stalls[0], filter_stalls[0], ofmap_stalls[0]))
+
+        return ifmap_cycle_out[0], filter_cycle_out[0], ofmap_cycle_out[0]
 
     #
     def get_total_compute_cycles(self):
@@ -434,6 +464,70 @@ class double_buffered_scratchpad:
         assert self.traces_valid, 'Traces not generated yet'
         return self.stall_cycles
 
+    #
+    @staticmethod
+    def get_trace_activity(serviced_cycles, demand_mat, chunk_lines=2 ** 14):
+        """
+        Method to get the cycles of the first and last lines of an SRAM trace with a valid request,
+        and the number of such lines. The trace is given by the serviced cycles of its lines and
+        its demand matrix, which is checked chunk_lines at a time. The cycles are None if there is
+        no valid request.
+        """
+        num_lines = serviced_cycles.shape[0]
+        active_lines = np.zeros(num_lines, dtype=bool)
+        for start_line in range(0, num_lines, chunk_lines):
+            end_line = min(start_line + chunk_lines, num_lines)
+            active_lines[start_line:end_line] = \
+                np.any(demand_mat[start_line:end_line] != -1, axis=1)
+
+        num_active_lines = int(np.count_nonzero(active_lines))
+        if num_active_lines == 0:
+            return None, None, 0
+
+        first_active_line = int(np.argmax(active_lines))
+        last_active_line = active_lines.shape[0] - 1 - int(np.argmax(active_lines[::-1]))
+
+        first_active_cycle = serviced_cycles[first_active_line][0]
+        last_active_cycle = serviced_cycles[last_active_line][0]
+
+        return first_active_cycle, last_active_cycle, num_active_lines
+
+    #
+    def update_sram_activity(self):
+        """
+        Method to find the first and last active cycles and the number of active lines of the
+        ifmap, filter and ofmap SRAM traces once they are generated. If an SRAM has no valid
+        request, its start and stop cycles are left as they are.
+        """
+        for operand in ['ifmap', 'filter', 'ofmap']:
+            start_cycle, stop_cycle, num_active_lines = \
+                self.get_trace_activity(getattr(self, operand + '_serviced_cycles'),
+                                        getattr(self, operand + '_demand_mat'))
+
+            if num_active_lines > 0:
+                setattr(self, operand + '_sram_start_cycle', start_cycle)
+                setattr(self, operand + '_sram_stop_cycle', stop_cycle)
+            setattr(self, operand + '_sram_active_lines', num_active_lines)
+
+    #
+    def get_sram_activity_summary(self):
+        """
+        Method to get the activity of the ifmap, filter and ofmap SRAMs if trace_valid flag is set,
+        as a dictionary with the first active cycle, the last active cycle and the number of active
+        lines of each of them. The active lines are the lines with at least one valid request.
+        """
+        assert self.traces_valid, 'Traces not generated yet'
+
+        summary = {}
+        for operand in ['ifmap', 'filter', 'ofmap']:
+            summary[operand] = {
+                'first_active_cycle': getattr(self, operand + '_sram_start_cycle'),
+                'last_active_cycle': getattr(self, operand + '_sram_stop_cycle'),
+                'num_active_lines': getattr(self, operand + '_sram_active_lines')
+            }
+
+        return summary
+
     #
     def get_ifmap_sram_start_stop_cycles(self):
         """
@@ -441,30 +535,6 @@ class double_buffered_scratchpad:
         trace_valid flag is set.
         """
         assert self.traces_valid, 'Traces not generated yet'
-
-        done = False
-        for ridx in range(self.ifmap_trace_matrix.shape[0]):
-            if done:
-                break
-            row = self.ifmap_trace_matrix[ridx,1:]
-            for addr in row:
-                if not addr == -1:
-                    self.ifmap_sram_start_cycle = self.ifmap_trace_matrix[ridx][0]
-                    done = True
-                    break
-
-        done = False
-        for ridx in range(self.ifmap_trace_matrix.shape[0]):
-            if done:
-                break
-            ridx = -1 * (ridx + 1)
-            row = self.ifmap_trace_matrix[ridx,1:]
-            for addr in row:
-                if not addr == -1:
-                    self.ifmap_sram_stop_cycle  = self.ifmap_trace_matrix[ridx][0]
-                    done = True
-                    break
-
         return self.ifmap_sram_start_cycle, self.ifmap_sram_stop_cycle
 
     #
@@ -474,32 +544,6 @@ class double_buffered_scratchpad:
         trace_valid flag is set.
         """
         assert self.traces_valid, 'Traces not generated yet'
-
-        done = False
-        for ridx in range(self.filter_trace_matrix.shape[0]):
-
-            if done:
-                break
-            row = self.filter_trace_matrix[ridx, 1:]
-            for addr in row:
-                if not addr == -1:
-                    self.filter_sram_start_cycle = self.filter_trace_matrix[ridx][0]
-                    done = True
-                    break
-
-        done = False
-        for ridx in range(self.filter_trace_matrix.shape[0]):
-            if done:
-                break
-            ridx = -1 * (ridx + 1)
-
-            row = self.filter_trace_matrix[ridx, 1:]
-            for addr in row:
-                if not addr == -1:
-                    self.filter_sram_stop_cycle = self.filter_trace_matrix[ridx][0]
-                    done = True
-                    break
-
         return self.filter_sram_start_cycle, self.filter_sram_stop_cycle
 
     #
@@ -509,30 +553,6 @@ class double_buffered_scratchpad:
         trace_valid flag is set.
         """
         assert self.traces_valid, 'Traces not generated yet'
-
-        done = False
-        for ridx in range(self.ofmap_trace_matrix.shape[0]):
-            if done:
-                break
-            row = self.ofmap_trace_matrix[ridx, 1:]
-            for addr in row:
-                if not addr == -1:
-                    self.ofmap_sram_start_cycle = self.ofmap_trace_matrix[ridx][0]
-                    done = True
-                    break
-
-        done = False
-        for ridx in range(self.ofmap_trace_matrix.shape[0]):
-            if done:
-                break
-            ridx = -1 * (ridx + 1)
-            row = self.ofmap_trace_matrix[ridx, 1:]
-            for addr in row:
-                if not addr == -1:
-                    self.ofmap_sram_stop_cycle = self.ofmap_trace_matrix[ridx][0]
-                    done = True
-                    break
-
         return self.ofmap_sram_start_cycle, self.ofmap_sram_stop_cycle
 
     #
@@ -584,7 +604,7 @@ class double_buffered_scratchpad:
         array and the cycles (first column) at which the requests are made.
         """
         assert self.traces_valid, 'Traces not generated yet'
-        return self.ifmap_trace_matrix
+        return self.get_sram_trace_rows('ifmap')
 
     #
     def get_filter_sram_trace_matrix(self):
@@ -593,7 +613,7 @@ class double_buffered_scratchpad:
         array and the cycles (first column) at which the requests are made.
         """
         assert self.traces_valid, 'Traces not generated yet'
-        return self.filter_trace_matrix
+        return self.get_sram_trace_rows('filter')
 
     #
     def get_ofmap_sram_trace_matrix(self):
@@ -602,7 +622,7 @@ class double_buffered_scratchpad:
         array and the cycles (first column) at which the requests are made.
         """
         assert self.traces_valid, 'Traces not generated yet'
-        return self.ofmap_trace_matrix
+        return self.get_sram_trace_rows('ofmap')
 
     #
     def get_sram_trace_matrices(self):
@@ -610,7 +630,34 @@ class double_buffered_scratchpad:
         Method to get the ifmap, filter and ofmap SRAM trace matrices.
         """
         assert self.traces_valid, 'Traces not generated yet'
-        return self.ifmap_trace_matrix, self.filter_trace_matrix, self.ofmap_trace_matrix
+        return self.get_sram_trace_rows('ifmap'), self.get_sram_trace_rows('filter'), \
+               self.get_sram_trace_rows('ofmap')
+
+    #
+    def get_sram_trace_rows(self, operand, start_line=0, end_line=None):
+        """
+        Method to get the lines [start_line, end_line) of the SRAM trace matrix of an operand, or
+        all of them, by putting the serviced cycles and the demand lines together.
+        """
+        serviced_cycles = getattr(self, operand + '_serviced_cycles')
+        demand_mat = getattr(self, operand + '_demand_mat')
+        if end_line is None:
+            end_line = serviced_cycles.shape[0]
+
+        return np.concatenate((serviced_cycles[start_line:end_line],
+                               demand_mat[start_line:end_line]), axis=1)
+
+    #
+    def save_sram_trace(self, operand, filename, chunk_lines=2 ** 14):
+        """
+        Method to write the SRAM trace matrix of an operand to a file, chunk_lines at a time.
+        """
+        num_lines = getattr(self, operand + '_serviced_cycles').shape[0]
+        with open(filename, 'wb') as f:
+            for start_line in range(0, num_lines, chunk_lines):
+                end_line = min(start_line + chunk_lines, num_lines)
+                np.savetxt(f, self.get_sram_trace_rows(operand, start_line, end_line), fmt='%i',
+                           delimiter=",")
 
     #
     def get_ifmap_dram_trace_matrix(self):
@@ -654,7 +701,7 @@ class double_buffered_scratchpad:
         """
         assert self.traces_valid, 'Traces not generated yet'
         os.makedirs(os.path.dirname(filename), exist_ok=True)
-        np.savetxt(filename, self.ifmap_trace_matrix, fmt='%i', delimiter=",")
+        self.save_sram_trace('ifmap', filename)
 
     #
     def print_filter_sram_trace(self, filename):
@@ -662,7 +709,7 @@ class double_buffered_scratchpad:
         Method to write the filter SRAM trace matrix to a file if trace_valid flag is set.
         """
         assert self.traces_valid, 'Traces not generated yet'
-        np.savetxt(filename, self.filter_trace_matrix, fmt='%i', delimiter=",")
+        self.save_sram_trace('filter', filename)
 
     #
     def print_ofmap_sram_trace(self, filename):
@@ -670,7 +717,7 @@ class double_buffered_scratchpad:
         Method to write the Ofmap SRAM trace matrix to a file if trace_valid flag is set.
         """
         assert self.traces_valid, 'Traces not generated yet'
-        np.savetxt(filename, self.ofmap_trace_matrix, fmt='%i', delimiter=",")
+        self.save_sram_trace('ofmap', filename)
 
     #
     def print_ifmap_dram_trace(self, filename):
@@ -0,0 +1,195 @@
+"""
+This file contains the kernels used in the inner loops of the memory simulation. When Numba is
+installed, the loop versions of the kernels are compiled and used. Otherwise the NumPy versions
+are used, which give the same results. Setting the SCALESIM_DISABLE_JIT environment variable to 1
+selects the NumPy versions even when Numba is installed.
+"""
+
+import os
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+JIT_ENABLED = numba is not None and os.environ.get('SCALESIM_DISABLE_JIT', '0') == '0'
+
+
+#
+def bisect_left_loop(arr, value):
+    """
+    Function to get the index at which value would be inserted in the sorted array arr, before
+    any equal element, as bisect.bisect_left() does.
+    """
+    lo = 0
+    hi = arr.shape[0]
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if arr[mid] < value:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+#
+def window_hits_loop(requests, index_addrs, index_keys, num_lines, start_id, end_id):
+    """
+    Function to check which addresses of a vector of requests have a line in the window of lines
+    [start_id, end_id) of a read buffer, wrapping around num_lines. The read buffer is described by
+    its sorted distinct addresses index_addrs and the sorted keys index_keys, which hold
+    rank * num_lines + line_id for every line holding the address of rank rank. The null requests
+    (-1) are counted as hits. This version loops over the requests.
+    """
+    num_addrs = index_addrs.shape[0]
+    num_keys = index_keys.shape[0]
+    hits = np.zeros(requests.shape[0], dtype=np.bool_)
+
+    for i in range(requests.shape[0]):
+        addr = requests[i]
+        if addr == -1:
+            hits[i] = True
+            continue
+
+        rank = bisect_left_loop(index_addrs, addr)
+        if rank == num_addrs or not index_addrs[rank] == addr:
+            continue
+
+        base = rank * num_lines
+        idx = bisect_left_loop(index_keys, base + start_id)
+        if idx < num_keys and index_keys[idx] < base + end_id:
+            hits[i] = True
+        elif not start_id < end_id:
+            # The window wraps around, or covers all the lines if start_id == end_id
+            if idx < num_keys and index_keys[idx] < base + num_lines:
+                hits[i] = True
+            else:
+                idx = bisect_left_loop(index_keys, base)
+                hits[i] = idx < num_keys and index_keys[idx] < base + end_id
+
+    return hits
+
+
+#
+def window_hits_numpy(requests, index_addrs, index_keys, num_lines, start_id, end_id):
+    """
+    Function to check which addresses of a vector of requests have a line in a window of lines of
+    a read buffer, as window_hits_loop() does, with array operations.
+    """
+    hits = requests == -1
+    if index_addrs.shape[0] == 0:
+        return hits
+
+    num_keys = index_keys.shape[0]
+    ranks = np.searchsorted(index_addrs, requests)
+    ranks = np.minimum(ranks, index_addrs.shape[0] - 1)
+    present = index_addrs[ranks] == requests
+    base = ranks.astype(np.int64) * num_lines
+
+    idx = np.searchsorted(index_keys, base + start_id)
+    first_keys = index_keys[np.minimum(idx, num_keys - 1)]
+    if start_id < end_id:
+        in_window = (idx < num_keys) & (first_keys < base + end_id)
+    else:
+        in_window = (idx < num_keys) & (first_keys < base + num_lines)
+        lowest_keys = index_keys[np.minimum(np.searchsorted(index_keys, base), num_keys - 1)]
+        in_window |= lowest_keys < base + end_id
+
+    hits |= present & in_window
+    return hits
+
+
+#
+def first_new_addrs_loop(addr_ids, last_set_ids, set_start_id, num_new_to_move):
+    """
+    Function to find the new addresses in a vector of address ids, up to num_new_to_move of them.
+    An address is new if its last set id is less than set_start_id, and only its first occurrence
+    is counted. Returns the indices of the new addresses and the number of ids scanned to find
+    them. This version loops over the ids, marking the new ones in last_set_ids while it scans and
+    restoring them afterwards.
+    """
+    num_ids = addr_ids.shape[0]
+    max_new = max(min(num_new_to_move, num_ids), 0)
+    new_idx = np.zeros(max_new, dtype=np.int64)
+    saved_set_ids = np.zeros(max_new, dtype=last_set_ids.dtype)
+
+    num_new = 0
+    num_scanned = num_ids
+    for i in range(num_ids):
+        if num_new == max_new:
+            break
+
+        addr_id = addr_ids[i]
+        if last_set_ids[addr_id] < set_start_id:
+            saved_set_ids[num_new] = last_set_ids[addr_id]
+            last_set_ids[addr_id] = set_start_id
+            new_idx[num_new] = i
+            num_new += 1
+            if num_new == num_new_to_move:
+                num_scanned = i + 1
+
+    for j in range(num_new):
+        last_set_ids[addr_ids[new_idx[j]]] = saved_set_ids[j]
+
+    return new_idx[:num_new], num_scanned
+
+
+#
+def first_new_addrs_numpy(addr_ids, last_set_ids, set_start_id, num_new_to_move):
+    """
+    Function to find the new addresses in a vector of address ids, as first_new_addrs_loop() does,
+    with array operations over a growing number of the ids until there are enough new ones.
+    """
+    num_ids = addr_ids.shape[0]
+    if num_new_to_move <= 0:
+        return np.zeros(0, dtype=np.int64), num_ids
+
+    num_scanned = min(max(num_new_to_move, 1024), num_ids)
+    while True:
+        scanned_ids = addr_ids[:num_scanned]
+        candidates = np.flatnonzero(last_set_ids[scanned_ids] < set_start_id)
+        _, first_idx = np.unique(scanned_ids[candidates], return_index=True)
+        new_idx = candidates[np.sort(first_idx)]
+
+        if not new_idx.shape[0] < num_new_to_move or num_scanned == num_ids:
+            break
+        num_scanned = min(2 * num_scanned, num_ids)
+
+    if not new_idx.shape[0] < num_new_to_move:
+        new_idx = new_idx[:num_new_to_move]
+        num_scanned = int(new_idx[-1]) + 1
+
+    return new_idx, num_scanned
+
+
+if JIT_ENABLED:
+    bisect_left_loop = numba.njit(cache=True)(bisect_left_loop)
+    window_hits = numba.njit(cache=True)(window_hits_loop)
+    first_new_addrs = numba.njit(cache=True)(first_new_addrs_loop)
+else:
+    window_hits = window_hits_numpy
+    first_new_addrs = first_new_addrs_numpy
+
+
+#
+def get_window_hits(requests, index_addrs, index_keys, num_lines, start_id, end_id):
+    """
+    Function to check which addresses of an array of requests of any shape have a line in the
+    window of lines [start_id, end_id) of a read buffer, with the kernel selected on import.
+    """
+    flat_requests = np.ascontiguousarray(requests).reshape(-1)
+    hits = window_hits(flat_requests, index_addrs, index_keys,
+                       int(num_lines), int(start_id), int(end_id))
+    return hits.reshape(np.shape(requests))
+
+
+#
+def get_first_new_addrs(addr_ids, last_set_ids, set_start_id, num_new_to_move):
+    """
+    Function to find the first new addresses in a vector of address ids, with the kernel selected
+    on import.
+    """
+    return first_new_addrs(np.ascontiguousarray(addr_ids), last_set_ids,
+                           int(set_start_id), int(num_new_to_move))
@@ -2,11 +2,13 @@
 Double buffer read memory implementation
 """
 # TODO: Verification Pending
+import bisect
 import math
 import numpy as np
-from tqdm import tqdm
 
 from scalesim.memory.read_port import read_port
+from scalesim.memory.trace_array import trace_array
+from scalesim.memory.kernels import get_window_hits
 
 
 class read_buffer:
@@ -43,6 +45,14 @@ class read_buffer:
         self.active_buffer_set_limits = []
         self.prefetch_buffer_set_limits = []
 
+        # Index from the addresses to the ids of the lines holding them. The distinct addresses
+        # are sorted, and each (address, line) pair is keyed as rank * num_lines + line id, sorted.
+        # The lists are used for single lookups and the arrays for vectorized ones.
+        self.index_addrs = np.zeros(0)
+        self.index_keys = np.zeros(0, dtype=np.int64)
+        self.index_addrs_list = []
+        self.index_keys_list = []
+
         # Variables to enable prefetching
         self.fetch_matrix = np.ones((1, 1))
         self.last_prefect_cycle = -1
@@ -53,7 +63,7 @@ class read_buffer:
         self.num_access = 0
 
         # Trace matrix
-        self.trace_matrix = np.ones((1, 1))
+        self.trace_matrix = trace_array()
 
         # Flags
         self.active_buf_full_flag = False
@@ -63,11 +73,12 @@ class read_buffer:
     #
     def set_params(self, backing_buf_obj,
                    total_size_bytes=1, word_size=1, active_buf_frac=0.9,
-                   hit_latency=1, backing_buf_bw=1
+                   hit_latency=1, backing_buf_bw=1, spill_dir=None
                    ):
         """
         Method to set the ifmap/filter double buffered memory simulation parameters for
-        housekeeping.
+        housekeeping. If spill_dir is provided, the trace is spilled to files in this directory
+        as it grows.
         """
 
         self.total_size_bytes = total_size_bytes
@@ -85,6 +96,8 @@ class read_buffer:
         self.active_buf_size = int(math.ceil(self.total_size_elems * self.active_buf_frac))
         self.prefetch_buf_size = self.total_size_elems - self.active_buf_size
 
+        self.trace_matrix = trace_array(spill_dir=spill_dir)
+
     #
     def reset(self): # TODO: check if all resets are working propoerly
         """
@@ -110,6 +123,14 @@ class read_buffer:
         self.active_buffer_set_limits = []
         self.prefetch_buffer_set_limits = []
 
+        # Index from the addresses to the ids of the lines holding them. The distinct addresses
+        # are sorted, and each (address, line) pair is keyed as rank * num_lines + line id, sorted.
+        # The lists are used for single lookups and the arrays for vectorized ones.
+        self.index_addrs = np.zeros(0)
+        self.index_keys = np.zeros(0, dtype=np.int64)
+        self.index_addrs_list = []
+        self.index_keys_list = []
+
         # Variables to enable prefetching
         self.fetch_matrix = np.ones((1, 1))
         self.last_prefect_cycle = -1
@@ -120,7 +141,7 @@ class read_buffer:
         self.num_access = 0
 
         # Trace matrix
-        self.trace_matrix = np.ones((1, 1))
+        self.trace_matrix = trace_array()
 
         # Flags
         self.active_buf_full_flag = False
@@ -137,19 +158,12 @@ class read_buffer:
 
         num_elems = fetch_matrix_np.shape[0] * fetch_matrix_np.shape[1]
         num_lines = int(math.ceil(num_elems / self.req_gen_bandwidth))
-        self.fetch_matrix = np.ones((num_lines, self.req_gen_bandwidth)) * -1
-
-        # Put stuff into the fetch matrix
-        # This is done to ensure that there is no shape mismatch
-        # Not sure if this is the optimal way to do it or not
-        for i in range(num_elems):
-            src_row = math.floor(i / fetch_matrix_np.shape[1])
-            src_col = math.floor(i % fetch_matrix_np.shape[1])
 
-            dest_row = math.floor(i / self.req_gen_bandwidth)
-            dest_col = math.floor(i % self.req_gen_bandwidth)
-
-            self.fetch_matrix[dest_row][dest_col] = fetch_matrix_np[src_row][src_col]
+        # Lay the elements out in row major order over lines of req_gen_bandwidth elements, and
+        # pad the last line with -1
+        fetch_elems = np.full(num_lines * self.req_gen_bandwidth, -1, dtype=fetch_matrix_np.dtype)
+        fetch_elems[:num_elems] = fetch_matrix_np.reshape(-1)
+        self.fetch_matrix = fetch_elems.reshape((num_lines, self.req_gen_bandwidth))
 
         # Once the fetch matrices are set, populate the data structure for faster lookups and
         # servicing
@@ -162,32 +176,19 @@ class read_buffer:
         """
         elems_per_set = math.ceil(self.total_size_elems / 100)
 
-        prefetch_rows = self.fetch_matrix.shape[0]
-        prefetch_cols = self.fetch_matrix.shape[1]
-
-        line_id = 0
-        elem_ctr = 0
-        current_line = set()
-
-        for r in range(prefetch_rows):
-            for c in range(prefetch_cols):
-                elem = self.fetch_matrix[r][c]
+        # The valid elements of the fetch matrix fill the lines in order, and a line is closed once
+        # it has elems_per_set elements. The last line is always added, even if empty.
+        fetch_elems = self.fetch_matrix.reshape(-1)
+        valid_elems = fetch_elems[fetch_elems != -1]
+        line_ids = np.arange(valid_elems.shape[0], dtype=np.int64) // elems_per_set
+        num_lines = valid_elems.shape[0] // elems_per_set + 1
 
-                if not elem == -1:
-                    current_line.add(elem)
-                    elem_ctr += 1
-
-                if not elem_ctr < elems_per_set:    # ie > or =
-                    self.hashed_buffer[line_id] = current_line
-                    line_id += 1
-                    elem_ctr = 0
-                    current_line = set()        # new set
-
-        self.hashed_buffer[line_id] = current_line
+        line_bounds = np.searchsorted(line_ids, np.arange(1, num_lines))
+        self.hashed_buffer = {line_id: set(line_elems.tolist()) for line_id, line_elems
+                              in enumerate(np.split(valid_elems, line_bounds))}
 
         max_num_active_buf_lines = int(math.ceil(self.active_buf_size / elems_per_set))
         max_num_prefetch_buf_lines = int(math.ceil(self.prefetch_buf_size / elems_per_set))
-        num_lines = line_id + 1
 
         if num_lines > max_num_active_buf_lines:
             self.num_active_buf_lines = max_num_active_buf_lines
@@ -202,35 +203,197 @@ class read_buffer:
             self.num_prefetch_buf_lines = remaining_lines
 
         self.num_lines = num_lines
+        self.prepare_line_index(valid_elems, line_ids)
         self.hashed_buffer_valid = True
 
+    #
+    def prepare_line_index(self, valid_elems, line_ids):
+        """
+        Method to build the index from the addresses to the ids of the hashed buffer lines holding
+        them, from the valid elements of the fetch matrix and the ids of their lines, as found in
+        prepare_hashed_buffer().
+        """
+        # Sort by address then line id, and keep the distinct (address, line) pairs
+        order = np.lexsort((line_ids, valid_elems))
+        valid_elems = valid_elems[order]
+        line_ids = line_ids[order]
+        distinct = np.ones(valid_elems.shape[0], dtype=bool)
+        distinct[1:] = (valid_elems[1:] != valid_elems[:-1]) | (line_ids[1:] != line_ids[:-1])
+        valid_elems = valid_elems[distinct]
+        line_ids = line_ids[distinct]
+
+        self.index_addrs, ranks = np.unique(valid_elems, return_inverse=True)
+        self.index_keys = ranks.astype(np.int64) * self.num_lines + line_ids
+
+        self.index_addrs_list = self.index_addrs.tolist()
+        self.index_keys_list = self.index_keys.tolist()
+
     #
     def active_buffer_hit(self, addr):
         """
-        Method to check if the address is hit or miss in the active read buffer.
+        Method to check if the address is hit or miss in the active read buffer. The address is
+        looked up in the line index, and it is a hit if one of its lines is in the active window.
         """
         assert self.active_buf_full_flag, 'Active buffer is not ready yet'
 
+        rank = bisect.bisect_left(self.index_addrs_list, addr)
+        if rank == len(self.index_addrs_list) or not self.index_addrs_list[rank] == addr:
+            return False
+
         start_id, end_id = self.active_buffer_set_limits
+        keys = self.index_keys_list
+        base = rank * self.num_lines
+
+        # First line of the address from the start of the window
+        idx = bisect.bisect_left(keys, base + start_id)
         if start_id < end_id:
-            for line_id in range(start_id, end_id):
-                this_set = self.hashed_buffer[line_id]      # O(1) --> accessing hash
-                if addr in this_set:                        # Checking in a set(), O(1) lookup
-                    return True
+            return idx < len(keys) and keys[idx] < base + end_id
 
-        else:
-            for line_id in range(start_id, self.num_lines):
-                this_set = self.hashed_buffer[line_id]  # O(1) --> accessing hash
-                if addr in this_set:  # Checking in a set(), O(1) lookup
-                    return True
-
-            for line_id in range(end_id):
-                this_set = self.hashed_buffer[line_id]  # O(1) --> accessing hash
-                if addr in this_set:  # Checking in a set(), O(1) lookup
-                    return True
-        # Fixing for ISSUE #14
-        # return True
-        return False
+        # The window wraps around, or covers all the lines if start_id == end_id
+        if idx < len(keys) and keys[idx] < base + self.num_lines:
+            return True
+        return keys[bisect.bisect_left(keys, base)] < base + end_id
+
+    #
+    def get_active_buffer_hits(self, incoming_requests_arr_np, set_limits=None):
+        """
+        Method to check which addresses of an array hit in the active read buffer, in the same way
+        as active_buffer_hit(). The null requests (-1) are counted as hits. If set_limits is
+        provided, the addresses are checked against this window of lines instead of the active one.
+        """
+        if set_limits is None:
+            set_limits = self.active_buffer_set_limits
+        start_id, end_id = set_limits
+
+        return get_window_hits(incoming_requests_arr_np, self.index_addrs, self.index_keys,
+                               self.num_lines, start_id, end_id)
+
+    #
+    def get_num_prefetches_to_hit(self, addr, start_id):
+        """
+        Method to get the number of new prefetches after which the address hits in the active
+        buffer, when the active window starts at the line start_id. Each prefetch moves the start
+        of the window by num_prefetch_buf_lines, so the windows repeat after a fixed number of
+        prefetches and the first one holding a line of the address is found in one pass.
+        """
+        rank = bisect.bisect_left(self.index_addrs_list, addr)
+        assert rank < len(self.index_addrs_list) and self.index_addrs_list[rank] == addr, \
+            'Address ' + str(addr) + ' is never prefetched'
+
+        base = rank * self.num_lines
+        lo = bisect.bisect_left(self.index_keys_list, base)
+        hi = bisect.bisect_left(self.index_keys_list, base + self.num_lines)
+        addr_line_ids = self.index_keys[lo:hi] - base
+
+        num_windows = self.num_lines // math.gcd(self.num_lines, self.num_prefetch_buf_lines)
+        steps = np.arange(1, num_windows + 1, dtype=np.int64)
+        start_ids = (start_id + steps * self.num_prefetch_buf_lines) % self.num_lines
+
+        dist = (addr_line_ids.reshape((1, -1)) - start_ids.reshape((-1, 1))) % self.num_lines
+        window_hits = np.any(dist < self.num_active_buf_lines, axis=1)
+        assert np.any(window_hits), 'Address ' + str(addr) + ' never hits in the active buffer'
+
+        return int(steps[np.argmax(window_hits)])
+
+    #
+    def get_num_line_prefetches(self, request_line, set_limits=None):
+        """
+        Method to get the number of new prefetches needed to service a request line. The addresses
+        are checked in order: the ones hitting in the current window are skipped together, and at
+        the first miss the window is moved by the prefetches needed for that address. If
+        set_limits is provided, the line is checked from this window of lines instead of the
+        active one.
+        """
+        if set_limits is None:
+            set_limits = self.active_buffer_set_limits
+        start_id, end_id = set_limits
+
+        addrs = request_line[request_line != -1]
+        hits = self.get_active_buffer_hits(addrs, set_limits=[start_id, end_id])
+
+        num_prefetches = 0
+        while not np.all(hits):
+            miss_idx = int(np.argmin(hits))
+            steps = self.get_num_prefetches_to_hit(addrs[miss_idx], start_id)
+            num_prefetches += steps
+
+            start_id = (start_id + steps * self.num_prefetch_buf_lines) % self.num_lines
+            end_id = (start_id + self.num_active_buf_lines) % self.num_lines
+            addrs = addrs[miss_idx + 1:]
+            hits = self.get_active_buffer_hits(addrs, set_limits=[start_id, end_id])
+
+        return num_prefetches
+
+    #
+    def get_num_prefetches_per_line(self, incoming_requests_arr_np, min_chunk_lines=16):
+        """
+        Method to get the number of new prefetches needed by each request line, before any of them
+        is made. The lines hitting in the active window are found a chunk of lines at a time, and
+        the window is only moved at the lines which miss, by the prefetches they need. The chunks
+        grow while they only hit.
+        """
+        num_lines = incoming_requests_arr_np.shape[0]
+        num_prefetches_per_line = np.zeros(num_lines, dtype=np.int64)
+        start_id, end_id = self.active_buffer_set_limits
+
+        chunk_lines = min_chunk_lines
+        line_id = 0
+        while line_id < num_lines:
+            end_line_id = min(line_id + chunk_lines, num_lines)
+            line_hits = np.all(self.get_active_buffer_hits(
+                incoming_requests_arr_np[line_id:end_line_id], set_limits=[start_id, end_id]),
+                axis=1)
+            if np.all(line_hits):
+                line_id = end_line_id
+                chunk_lines *= 2
+                continue
+
+            line_id += int(np.argmin(line_hits))
+            num_prefetches = self.get_num_line_prefetches(incoming_requests_arr_np[line_id],
+                                                          set_limits=[start_id, end_id])
+            num_prefetches_per_line[line_id] = num_prefetches
+
+            start_id = (start_id + num_prefetches * self.num_prefetch_buf_lines) % self.num_lines
+            end_id = (start_id + self.num_active_buf_lines) % self.num_lines
+            line_id += 1
+            chunk_lines = min_chunk_lines
+
+        return num_prefetches_per_line
+
+    #
+    def get_num_stall_free_lines(self, incoming_requests_arr_np, incoming_cycles_arr):
+        """
+        Method to get the number of leading request lines which only hit in the active buffer.
+        These are serviced with the hit latency without any prefetch, so they can be serviced
+        together by service_stall_free_reads().
+        """
+        if not self.active_buf_full_flag:
+            return 0
+
+        line_hits = np.all(self.get_active_buffer_hits(incoming_requests_arr_np), axis=1)
+        if np.all(line_hits):
+            return incoming_requests_arr_np.shape[0]
+        return int(np.argmin(line_hits))
+
+    #
+    def service_stall_free_reads(self, incoming_requests_arr_np, incoming_cycles_arr):
+        """
+        Method to service request lines which only hit in the active buffer, as found by
+        get_num_stall_free_lines().
+        """
+        return incoming_cycles_arr + self.hit_latency
+
+    #
+    def service_null_reads(self, incoming_cycles_arr):
+        """
+        Method to service request lines without any valid request, which are served with the hit
+        latency. The active buffer is prefetched first if these are the first lines serviced, as in
+        service_reads().
+        """
+        if not self.active_buf_full_flag:
+            self.prefetch_active_buffer(start_cycle=incoming_cycles_arr[0][0])
+
+        return incoming_cycles_arr + self.hit_latency
 
     #
     def service_reads(self,
@@ -240,6 +403,12 @@ class read_buffer:
         Method to service read requests coming from systolic array. Logic: Always check if an addr
         is in active buffer. If hit, return with hit latency Else, make the contents of prefetch
         buffer as active and then check Continue making new prefetches until there is a hit.
+
+        The number of prefetches of each line is found first for all the lines, and the prefetches
+        are then made together. Each prefetch completes prefetch_cycles after the previous one,
+        and moves the serviced cycle of the line to its completion cycle, plus the cycles it was
+        waited for. The serviced cycles are the request cycles plus an offset, which only changes
+        on the lines making prefetches.
         """
         # Service the incoming read requests
         # returns a cycles array corresponding to the requests buffer
@@ -254,35 +423,43 @@ class read_buffer:
             # keeping in mind the tile order and everything
             self.prefetch_active_buffer(start_cycle=start_cycle)
 
-        out_cycles_arr = []
+        # The active window only moves with the prefetches, so the number of prefetches needed
+        # by every line is found before making them
+        num_prefetches_per_line = self.get_num_prefetches_per_line(incoming_requests_arr_np)
+        prefetch_line_ids = np.flatnonzero(num_prefetches_per_line)
+
+        prefetch_cycles = math.ceil(self.prefetch_buf_size / self.req_gen_bandwidth) \
+                          + self.backing_buffer.get_latency()
+        last_prefetch_cycle = self.last_prefect_cycle
         offset = self.hit_latency
-        # for cycle, request_line in tqdm(zip(incoming_cycles_arr, incoming_requests_arr_np)):
-        for i in tqdm(range(incoming_requests_arr_np.shape[0]), disable=True):
-            cycle = incoming_cycles_arr[i]
-            # Fixing for ISSUE #14
-            # request_line = set(incoming_requests_arr_np[i]) #shaves off a few seconds
-            request_line = incoming_requests_arr_np[i]
-
-            for addr in request_line:
-                if addr == -1:
-                    continue
-
-                # if addr not in self.active_buffer_contents: #this is super slow!!!
-                # Fixing for ISSUE #14
-                # if not self.active_buffer_hit(addr):  # --> While loop ensures multiple prefetches
-                #                                             if needed
-                while not self.active_buffer_hit(addr):
-                    self.new_prefetch()
-                    potential_stall_cycles = self.last_prefect_cycle - (cycle + offset)
-                    # Offset increments if there were potential stalls
-                    offset += potential_stall_cycles
-                    if potential_stall_cycles > 0:
-                        offset += potential_stall_cycles
-
-            out_cycles = cycle + offset
-            out_cycles_arr.append(out_cycles)
-
-        out_cycles_arr_np = np.asarray(out_cycles_arr).reshape((len(out_cycles_arr), 1))
+        line_offsets = [offset]
+        for line_id in prefetch_line_ids.tolist():
+            num_prefetches = int(num_prefetches_per_line[line_id])
+            cycle = int(incoming_cycles_arr[line_id][0])
+            first_prefetch_cycle = last_prefetch_cycle + prefetch_cycles
+            last_prefetch_cycle = first_prefetch_cycle + (num_prefetches - 1) * prefetch_cycles
+
+            # The first prefetch moves the serviced cycle to its completion cycle plus the cycles
+            # it was waited for, if any. Each next prefetch does the same from the previous one,
+            # so the extra cycles alternate between two values.
+            extra_cycles = max(first_prefetch_cycle - (cycle + offset), 0)
+            if num_prefetches > 1:
+                if extra_cycles > prefetch_cycles:
+                    extra_cycles = prefetch_cycles * (num_prefetches % 2)
+                elif num_prefetches % 2 == 0:
+                    extra_cycles = prefetch_cycles - extra_cycles
+
+            offset = last_prefetch_cycle + extra_cycles - cycle
+            line_offsets.append(offset)
+
+        self.new_prefetches(int(np.sum(num_prefetches_per_line)))
+        assert self.last_prefect_cycle == last_prefetch_cycle, 'Prefetch cycles do not match'
+
+        # Each line takes the offset of the last line making prefetches up to it
+        segment_ids = np.searchsorted(prefetch_line_ids,
+                                      np.arange(incoming_requests_arr_np.shape[0]), side='right')
+        line_offsets_np = np.asarray(line_offsets, dtype=np.int64)[segment_ids]
+        out_cycles_arr_np = incoming_cycles_arr + line_offsets_np.reshape((-1, 1))
 
         return out_cycles_arr_np
 
@@ -313,18 +490,16 @@ class read_buffer:
             valid_cols = int(self.active_buf_size % self.req_gen_bandwidth)
             row = end_idx - 1
             self.next_col_prefetch_idx = valid_cols
-            for col in range(valid_cols, self.req_gen_bandwidth):
-                prefetch_requests[row][col] = -1
+            prefetch_requests[row, valid_cols:self.req_gen_bandwidth] = -1
 
         # TODO: Tally and check if this agrees with the contents of the hashed buffer
 
         # 2. Preparing the cycles array
         #    The start_cycle variable ensures that all the requests have been made before any
         #    incoming reads came
-        cycles_arr = np.zeros((num_lines, 1))
-        for i in range(cycles_arr.shape[0]):
-            cycles_arr[i][0] = \
-                -1 * (num_lines - start_cycle - (i - self.backing_buffer.get_latency()))
+        backing_latency = self.backing_buffer.get_latency()
+        cycles_arr = -1 * (num_lines - start_cycle - (np.arange(num_lines) - backing_latency))
+        cycles_arr = cycles_arr.reshape((num_lines, 1))
 
         # 3. Send the request and get the response cycles count
         response_cycles_arr = \
@@ -335,7 +510,8 @@ class read_buffer:
         self.last_prefect_cycle = int(response_cycles_arr[-1][0])
 
         # Update the trace matrix
-        self.trace_matrix = np.concatenate((response_cycles_arr, prefetch_requests), axis=1)
+        self.trace_matrix.clear()
+        self.trace_matrix.append(np.concatenate((response_cycles_arr, prefetch_requests), axis=1))
         self.trace_valid = True
 
         # Set active buffer contents
@@ -364,17 +540,25 @@ class read_buffer:
         be deleted to accomodate the prefetched data In this case we overwrite some data in the
         active buffer with the prefetched data and then create a new prefetch request.
         """
-        # In a new prefetch, some portion of the original data needs to be deleted to accomodate the
-        # prefetched data.
-        # In this case we overwrite some data in the active buffer with the prefetched data
-        # And then create a new prefetch request
-        # Also return when the prefetched data was made available
+        self.new_prefetches(num_prefetches=1)
+
+    #
+    def new_prefetches(self, num_prefetches=1):
+        """
+        Method to do a number of new prefetches one after the other, as new_prefetch() does, with
+        the requests and the trace rows of all of them made at once. Every prefetch after the first
+        one fetches from the same line of the fetch matrix, so their requests repeat, and each one
+        is requested once the previous one completes.
+        """
+        if num_prefetches == 0:
+            return
 
         # 1. Rewrite the active buffer
         assert self.active_buf_full_flag, 'Active buffer is empty'
-        active_start, active_end = self.active_buffer_set_limits
+        active_start, _ = self.active_buffer_set_limits
 
-        active_start = int((active_start + self.num_prefetch_buf_lines) % self.num_lines)
+        active_start = int((active_start + num_prefetches * self.num_prefetch_buf_lines)
+                           % self.num_lines)
         active_end = int((active_start + self.num_active_buf_lines) % self.num_lines)
         prefetch_start = active_end
         prefetch_end = int((prefetch_start + self.num_prefetch_buf_lines) % self.num_lines)
@@ -382,7 +566,53 @@ class read_buffer:
         self.active_buffer_set_limits = [active_start, active_end]
         self.prefetch_buffer_set_limits = [prefetch_start, prefetch_end]
 
-        # 2. Create the request
+        # 2. Create the requests
+        # The requests are copied, as the next ones can overwrite the fetch matrix they view
+        num_lines = math.ceil(self.prefetch_buf_size / self.req_gen_bandwidth)
+        prefetch_requests = np.array(self.get_prefetch_requests())
+        if num_prefetches > 1:
+            next_prefetch_requests = self.get_prefetch_requests()
+            self.num_access += (num_prefetches - 2) * num_lines * self.req_gen_bandwidth
+            prefetch_requests = \
+                np.concatenate((prefetch_requests,
+                                np.tile(next_prefetch_requests, (num_prefetches - 1, 1))))
+
+        # 3. Create the request cycles
+        # Fixing ISSUE #14
+        # cycles_arr[i][0] = self.last_prefect_cycle + i
+        prefetch_cycles = num_lines + self.backing_buffer.get_latency()
+        cycles_arr = self.last_prefect_cycle + 1 \
+                     + prefetch_cycles * np.arange(num_prefetches).reshape((-1, 1)) \
+                     + np.arange(num_lines).reshape((1, -1))
+        cycles_arr = cycles_arr.reshape((-1, 1))
+
+        # 4. Send the request
+        response_cycles_arr = \
+            self.backing_buffer.service_reads(incoming_cycles_arr=cycles_arr,
+                                              incoming_requests_arr_np=prefetch_requests)
+
+        # 5. Update the variables
+        self.last_prefect_cycle = response_cycles_arr[-1][0]
+
+        assert response_cycles_arr.shape == cycles_arr.shape, \
+               'The request and response cycles dims do not match'
+
+        this_prefetch_trace = np.concatenate((response_cycles_arr, prefetch_requests), axis=1)
+        self.trace_matrix.append(this_prefetch_trace)
+
+        # This does not need to return anything
+
+    #
+    def get_prefetch_requests(self):
+        """
+        Method to get the requests of a new prefetch from the fetch matrix, starting at the line
+        to be prefetched next, and to set the line to be prefetched after it.
+        """
+        # In a new prefetch, some portion of the original data needs to be deleted to accomodate the
+        # prefetched data.
+        # In this case we overwrite some data in the active buffer with the prefetched data
+        # And then create a new prefetch request
+        # Also return when the prefetched data was made available
         start_idx = self.next_line_prefetch_idx
         num_lines = math.ceil(self.prefetch_buf_size / self.req_gen_bandwidth)
         end_idx = start_idx + num_lines
@@ -402,36 +632,12 @@ class read_buffer:
 
         # Modify the prefetch request to drop unwanted addresses
         # a. Chomp the elements in the first line included in previous fetches
-        for i in range(0, self.next_col_prefetch_idx):
-            prefetch_requests[0][i] = -1
+        prefetch_requests[0, :self.next_col_prefetch_idx] = -1
 
         # b. Chomp the excess elements in the last line
         if requested_data_size > self.active_buf_size:
             valid_cols = int(self.active_buf_size % self.req_gen_bandwidth)
-            row = prefetch_requests.shape[0] - 1
-            for col in range(valid_cols, self.req_gen_bandwidth):
-                prefetch_requests[row][col] = -1
-
-        # 3. Create the request cycles
-        cycles_arr = np.zeros((num_lines, 1))
-        for i in range(cycles_arr.shape[0]):
-            # Fixing ISSUE #14
-            # cycles_arr[i][0] = self.last_prefect_cycle + i
-            cycles_arr[i][0] = self.last_prefect_cycle + i + 1
-
-        # 4. Send the request
-        response_cycles_arr = \
-            self.backing_buffer.service_reads(incoming_cycles_arr=cycles_arr,
-                                              incoming_requests_arr_np=prefetch_requests)
-
-        # 5. Update the variables
-        self.last_prefect_cycle = response_cycles_arr[-1][0]
-
-        assert response_cycles_arr.shape == cycles_arr.shape, \
-               'The request and response cycles dims do not match'
-
-        this_prefetch_trace = np.concatenate((response_cycles_arr, prefetch_requests), axis=1)
-        self.trace_matrix = np.concatenate((self.trace_matrix, this_prefetch_trace), axis=0)
+            prefetch_requests[-1, valid_cols:self.req_gen_bandwidth] = -1
 
         # Set the line to be prefetched next
         if requested_data_size > self.active_buf_size:
@@ -439,7 +645,7 @@ class read_buffer:
         else:
             self.next_line_prefetch_idx = (num_lines + 1) % self.fetch_matrix.shape[0]
 
-        # This does not need to return anything
+        return prefetch_requests
 
     #
     def get_trace_matrix(self):
@@ -451,7 +657,7 @@ class read_buffer:
             print('No trace has been generated yet')
             return
 
-        return self.trace_matrix
+        return self.trace_matrix.get_array()
 
     #
     def get_hit_latency(self):
@@ -481,8 +687,9 @@ class read_buffer:
         Method to get start and stop cycles of the read buffer if trace_valid flag is set.
         """
         assert self.trace_valid, 'Traces not ready yet'
-        start_cycle = self.trace_matrix[0][0]
-        end_cycle = self.trace_matrix[-1][0]
+        num_rows = self.trace_matrix.get_num_rows()
+        start_cycle = self.trace_matrix.get_rows(0, 1)[0][0]
+        end_cycle = self.trace_matrix.get_rows(num_rows - 1, num_rows)[0][0]
 
         return start_cycle, end_cycle
 
@@ -495,4 +702,4 @@ class read_buffer:
             print('No trace has been generated yet')
             return
 
-        np.savetxt(filename, self.trace_matrix, fmt='%s', delimiter=",")
+        self.trace_matrix.savetxt(filename, fmt='%i', delimiter=",")
@@ -7,6 +7,8 @@ import math
 import numpy as np
 
 from scalesim.memory.read_port import read_port
+from scalesim.memory.trace_array import trace_array
+from scalesim.memory.kernels import get_first_new_addrs
 
 
 class ReadBufferEstimateBw:
@@ -37,7 +39,9 @@ class ReadBufferEstimateBw:
         self.num_access = 0
 
         # Trace matrix
-        self.trace_matrix = np.ones((1, 1))
+        # The prefetch bandwidth changes between prefetches, and the narrower rows are padded with
+        # ones to the widest
+        self.trace_matrix = trace_array(pad_value=1)
 
         # Tracking variables
         self.num_items_per_set = -1
@@ -57,8 +61,20 @@ class ReadBufferEstimateBw:
         self.num_sets_active_buffer = 1
         self.num_sets_prefetch_buffer = 1
 
+        # Demand lines set up front and not tracked yet, as the valid addresses in order with their
+        # ids, which are their offsets from the lowest address seen, and the id of the set each
+        # address was last added to
+        self.demand_addrs = np.zeros(0)
+        self.demand_addr_ids = np.zeros(0, dtype=np.int64)
+        self.demand_line_starts = np.zeros(1, dtype=np.int64)
+        self.addr_id_base = 0
+        self.last_set_ids = np.zeros(0, dtype=np.int64)
+        self.next_demand_line = 0
+
         # Flags
         self.first_request_seen = False
+        self.demand_matrix_set_flag = False
+        self.demand_added_on_service = False
         self.params_set_flag = False
         self.active_buffer_prefetch_done = False
         self.trace_valid = False
@@ -66,10 +82,11 @@ class ReadBufferEstimateBw:
     #
     def set_params(self, backing_buf_obj,
                    total_size_bytes=1, word_size=1, active_buf_frac=0.9,
-                   hit_latency=1, backing_buf_default_bw=1):
+                   hit_latency=1, backing_buf_default_bw=1, spill_dir=None):
         """
         Method to set the ifmap/filter double buffered memory simulation parameters for estimate
-        bandwidth mode.
+        bandwidth mode. If spill_dir is provided, the trace is spilled to files in this directory
+        as it grows.
         """
 
         self.total_size_bytes = total_size_bytes
@@ -88,6 +105,8 @@ class ReadBufferEstimateBw:
         self.active_buf_size = int(math.ceil(self.total_size_elems * self.active_buf_frac))
         self.prefetch_buf_size = self.total_size_elems - self.active_buf_size
 
+        self.trace_matrix = trace_array(pad_value=1, spill_dir=spill_dir)
+
         #
         self.num_items_per_set = math.floor(self.total_size_elems / 100)
         self.num_sets_active_buffer = int(self.active_buf_frac * 100)
@@ -117,81 +136,258 @@ class ReadBufferEstimateBw:
         # In estimate mode, operation is stall free.
         # Therefore its always a hit
 
+        # Without a demand matrix set up front, the lines are added to the demand as they come
+        if not self.demand_matrix_set_flag:
+            self.set_demand_matrix(incoming_requests_arr_np)
+            self.demand_added_on_service = True
+        elif self.demand_added_on_service:
+            self.add_demand_lines(incoming_requests_arr_np)
+
         # The following to track requests and maintain proper state of the buffer
-        for i in range(incoming_requests_arr_np.shape[0]):
-            cycle = int(incoming_cycles_arr[i][0])
+        self.track_demand_lines(incoming_requests_arr_np, incoming_cycles_arr)
 
-            requests_this_cycle = incoming_requests_arr_np[i]
-            if not self.first_request_seen:
-                if max(requests_this_cycle) > -1:
-                    self.first_request_rcvd_cycle = cycle
-                    self.first_request_seen = True
+        return outcycles
+
+    #
+    def set_demand_matrix(self, demand_matrix_np, chunk_lines=2 ** 14):
+        """
+        Method to set the demand matrix up front. The valid addresses and their ids are then found
+        once, and service_reads() tracks the new addresses of the demand lines in bulk with
+        track_demand_lines(). The demand lines must then be serviced in order. The demand matrix
+        can be the first lines of the demand only, with the next ones added by add_demand_lines().
+        """
+        self.demand_addrs = np.zeros(0, dtype=demand_matrix_np.dtype)
+        self.demand_addr_ids = np.zeros(0, dtype=np.int64)
+        self.demand_line_starts = np.zeros(1, dtype=np.int64)
+        self.addr_id_base = 0
 
-            for addr in requests_this_cycle:
-                if not addr == -1:
-                    self.manage_prefetches(cycle, addr)
+        # The addresses never added to a set are misses in any active buffer
+        self.last_set_ids = np.zeros(0, dtype=np.int64)
+        self.next_demand_line = 0
+        self.demand_matrix_set_flag = True
 
-        return outcycles
+        self.add_demand_lines(demand_matrix_np, chunk_lines=chunk_lines)
 
     #
-    def manage_prefetches(self, cycle, addr):
+    def add_demand_lines(self, demand_lines_np, chunk_lines=2 ** 14):
         """
-        Method to manage prefetches in estimate bandwidth mode.
+        Method to add the next lines of the demand after the ones set up front, like the lines of
+        the next fold. The lines tracked already are dropped first. The demand lines are read
+        chunk_lines at a time and only their valid addresses are kept, so they can be given by a
+        virtual demand matrix generating its lines on request.
         """
+        assert self.demand_matrix_set_flag, 'Demand matrix is not set yet'
+
+        # Drop the lines tracked already
+        start = self.demand_line_starts[self.next_demand_line]
+        self.demand_addrs = self.demand_addrs[start:]
+        self.demand_addr_ids = self.demand_addr_ids[start:]
+        self.demand_line_starts = self.demand_line_starts[self.next_demand_line:] - start
+        self.next_demand_line = 0
+
+        num_lines = demand_lines_np.shape[0]
+        new_addrs_list = [self.demand_addrs[:0]]
+        line_counts = np.zeros(num_lines, dtype=np.int64)
+        for start_line in range(0, num_lines, chunk_lines):
+            end_line = min(start_line + chunk_lines, num_lines)
+            demand_lines = demand_lines_np[start_line:end_line]
+            valid_mask = demand_lines != -1
+            new_addrs_list.append(demand_lines[valid_mask])
+            line_counts[start_line:end_line] = np.count_nonzero(valid_mask, axis=1)
+
+        new_addrs = np.concatenate(new_addrs_list)
+        new_addr_ids = self.get_addr_ids(new_addrs)
+
+        self.demand_addrs = np.concatenate((self.demand_addrs, new_addrs))
+        self.demand_addr_ids = np.concatenate((self.demand_addr_ids, new_addr_ids))
+        self.demand_line_starts = \
+            np.concatenate((self.demand_line_starts,
+                            self.demand_line_starts[-1] + np.cumsum(line_counts)))
 
-        # If this is a new address, otherwise its a hit
-        if self.check_hit(addr):
-            return
+    #
+    def get_addr_ids(self, addrs):
+        """
+        Method to get the ids of addresses, which are their offsets from the lowest address seen.
+        The set ids are extended to cover the new addresses, which were never added to a set.
+        """
+        if addrs.shape[0] == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        low_addr = int(addrs.min())
+        high_addr = int(addrs.max())
+        num_ids = self.last_set_ids.shape[0]
+
+        if num_ids == 0:
+            self.addr_id_base = low_addr
+        elif low_addr < self.addr_id_base:
+            # Shift the ids to start from the new lowest address
+            shift = self.addr_id_base - low_addr
+            self.last_set_ids = np.concatenate((np.full(shift, -1, dtype=np.int64),
+                                                self.last_set_ids))
+            self.demand_addr_ids += shift
+            self.addr_id_base = low_addr
+            num_ids += shift
+
+        if not high_addr - self.addr_id_base < num_ids:
+            # Grow the set ids geometrically, as the addresses of the next lines extend them
+            new_num_ids = max(high_addr - self.addr_id_base + 1, 2 * num_ids)
+            self.last_set_ids = np.concatenate((self.last_set_ids,
+                                                np.full(new_num_ids - num_ids, -1,
+                                                        dtype=np.int64)))
+
+        return addrs.astype(np.int64) - self.addr_id_base
+
+    #
+    def track_demand_lines(self, incoming_requests_arr_np, incoming_cycles_arr):
+        """
+        Method to track the next demand lines of the demand matrix set by set_demand_matrix(). Each
+        new address is added to the current set, and the active buffer moves once the set after it
+        is complete. An address is new if it was never added to a set, or only to sets before the
+        active buffer. Until the active buffer
+        moves, the new addresses are then the first occurrences of such addresses, found together.
+        """
+        num_lines = incoming_requests_arr_np.shape[0]
+        start_line = self.next_demand_line
+        end_line = start_line + num_lines
+        assert end_line < self.demand_line_starts.shape[0], 'More lines than the demand matrix'
+
+        start = self.demand_line_starts[start_line]
+        end = self.demand_line_starts[end_line]
+        assert np.array_equal(incoming_requests_arr_np[incoming_requests_arr_np != -1],
+                              self.demand_addrs[start:end]), \
+            'The requests are not the next lines of the demand matrix'
+        self.next_demand_line = end_line
+
+        line_counts = np.diff(self.demand_line_starts[start_line:end_line + 1])
+        if not self.first_request_seen and end > start:
+            first_line = int(np.argmax(line_counts > 0))
+            self.first_request_rcvd_cycle = int(incoming_cycles_arr[first_line][0])
+            self.first_request_seen = True
+
+        addr_ids = self.demand_addr_ids[start:end]
+        addr_cycles = np.repeat(incoming_cycles_arr[:, 0], line_counts)
+
+        pos = 0
+        while pos < addr_ids.shape[0]:
+            # Number of new addresses after which the active buffer moves
+            if self.num_items_per_set > 0:
+                num_new_to_move = \
+                    (self.read_buffer_set_end_id + 1 - self.current_set_id) \
+                    * self.num_items_per_set - self.elems_current_set
+            else:
+                num_new_to_move = addr_ids.shape[0] + 1
+
+            new_idx, num_scanned = get_first_new_addrs(addr_ids[pos:], self.last_set_ids,
+                                                       self.read_buffer_set_start_id,
+                                                       num_new_to_move)
+
+            self.add_new_addrs(addr_ids[pos + new_idx], addr_cycles[pos + new_idx])
+            pos += num_scanned
+
+    #
+    def add_new_addrs(self, new_addr_ids, new_addr_cycles):
+        """
+        Method to add new addresses, given as their ids, to the sets in order, and
+        complete the sets as they fill up.
+        """
+        num_new = new_addr_ids.shape[0]
+        new_addrs = new_addr_ids + self.addr_id_base
 
-        if addr not in self.current_set:
-            self.current_set.add(addr)
-            self.elems_current_set += 1
+        idx = 0
+        while idx < num_new:
+            if self.num_items_per_set > 0:
+                num_to_add = min(self.num_items_per_set - self.elems_current_set, num_new - idx)
+            else:
+                num_to_add = num_new - idx
+
+            self.current_set.update(new_addrs[idx:idx + num_to_add].tolist())
+            self.last_set_ids[new_addr_ids[idx:idx + num_to_add]] = self.current_set_id
+            self.elems_current_set += num_to_add
+            idx += num_to_add
 
             if self.elems_current_set == self.num_items_per_set:
-                self.list_of_sets += [self.current_set]
-                self.current_set = set()
-                self.elems_current_set = 0
-                self.current_set_id += 1
-
-                # This should be prefetched
-                if self.current_set_id == self.read_buffer_set_end_id + 1:
-                    if not self.active_buffer_prefetch_done:
-                        self.prefetch_bandwidth = self.default_bandwidth
-                        self.last_prefetch_end_cycle = \
-                            self.first_request_rcvd_cycle - 1 - self.backing_buffer.get_latency()
-
-                        cycles_needed = (self.num_sets_prefetch_buffer * self.num_items_per_set) \
-                                        / self.prefetch_bandwidth
-                        cycles_needed = math.ceil(cycles_needed)
-
-                        self.last_prefetch_start_cycle = \
-                            self.last_prefetch_end_cycle - cycles_needed + 1
-
-                        self.prefetch()
-                        self.prefetch_buffer_set_start_id =self.read_buffer_set_end_id + 1
-                        self.prefetch_buffer_set_end_id = self.prefetch_buffer_set_start_id + \
-                                                          self.num_sets_prefetch_buffer - 1
-                        self.active_buffer_prefetch_done = True
-
-                    else:
-                        elems_to_prefetch = self.num_sets_prefetch_buffer * self.num_items_per_set
-                        cycles_needed = \
-                            self.last_prefetch_end_cycle - self.last_prefetch_start_cycle + 1
-                        self.prefetch_bandwidth = math.ceil(elems_to_prefetch / cycles_needed)
-                        self.prefetch()
-                        self.prefetch_buffer_set_start_id += self.num_sets_prefetch_buffer
-                        self.prefetch_buffer_set_end_id += self.num_sets_prefetch_buffer
-
-                    # Solving memory leak by discarding sets that are no longer in use
-                    i = self.read_buffer_set_start_id
-                    for j in range(self.num_sets_prefetch_buffer):
-                        self.list_of_sets[i+j] = None
-
-
-                    self.read_buffer_set_start_id += self.num_sets_prefetch_buffer
-                    self.read_buffer_set_end_id += self.num_sets_prefetch_buffer
-                    self.last_prefetch_start_cycle = self.last_prefetch_end_cycle +1
-                    self.last_prefetch_end_cycle = cycle
+                self.complete_current_set(int(new_addr_cycles[idx - 1]))
+
+    #
+    def get_num_stall_free_lines(self, incoming_requests_arr_np, incoming_cycles_arr):
+        """
+        Method to get the number of leading request lines which are serviced without stalls. In
+        estimate bandwidth mode there are no stalls, so these are all the lines.
+        """
+        return incoming_requests_arr_np.shape[0]
+
+    #
+    def service_stall_free_reads(self, incoming_requests_arr_np, incoming_cycles_arr):
+        """
+        Method to service request lines which are serviced without stalls. The prefetches are
+        still tracked, as they depend on the cycles of the requests.
+        """
+        return self.service_reads(incoming_requests_arr_np, incoming_cycles_arr)
+
+    #
+    def service_null_reads(self, incoming_cycles_arr):
+        """
+        Method to service request lines without any valid request. They do not change the state of
+        the buffer, but count as serviced lines of the demand matrix if it is set.
+        """
+        if self.demand_matrix_set_flag and not self.demand_added_on_service:
+            start_line = self.next_demand_line
+            self.next_demand_line += incoming_cycles_arr.shape[0]
+            assert self.demand_line_starts[self.next_demand_line] \
+                   == self.demand_line_starts[start_line], 'The lines have valid requests'
+
+        return incoming_cycles_arr + self.hit_latency
+
+    #
+    def complete_current_set(self, cycle):
+        """
+        Method to close the current set once it is full. If it is the set following the active
+        buffer, the prefetch buffer is prefetched and the active buffer moves forward.
+        """
+        self.list_of_sets += [self.current_set]
+        self.current_set = set()
+        self.elems_current_set = 0
+        self.current_set_id += 1
+
+        # This should be prefetched
+        if self.current_set_id == self.read_buffer_set_end_id + 1:
+            if not self.active_buffer_prefetch_done:
+                self.prefetch_bandwidth = self.default_bandwidth
+                self.last_prefetch_end_cycle = \
+                    self.first_request_rcvd_cycle - 1 - self.backing_buffer.get_latency()
+
+                cycles_needed = (self.num_sets_prefetch_buffer * self.num_items_per_set) \
+                                / self.prefetch_bandwidth
+                cycles_needed = math.ceil(cycles_needed)
+
+                self.last_prefetch_start_cycle = \
+                    self.last_prefetch_end_cycle - cycles_needed + 1
+
+                self.prefetch()
+                self.prefetch_buffer_set_start_id =self.read_buffer_set_end_id + 1
+                self.prefetch_buffer_set_end_id = self.prefetch_buffer_set_start_id + \
+                                                  self.num_sets_prefetch_buffer - 1
+                self.active_buffer_prefetch_done = True
+
+            else:
+                elems_to_prefetch = self.num_sets_prefetch_buffer * self.num_items_per_set
+                cycles_needed = \
+                    self.last_prefetch_end_cycle - self.last_prefetch_start_cycle + 1
+                self.prefetch_bandwidth = math.ceil(elems_to_prefetch / cycles_needed)
+                self.prefetch()
+                self.prefetch_buffer_set_start_id += self.num_sets_prefetch_buffer
+                self.prefetch_buffer_set_end_id += self.num_sets_prefetch_buffer
+
+            # Solving memory leak by discarding sets that are no longer in use
+            i = self.read_buffer_set_start_id
+            for j in range(self.num_sets_prefetch_buffer):
+                self.list_of_sets[i+j] = None
+
+
+            self.read_buffer_set_start_id += self.num_sets_prefetch_buffer
+            self.read_buffer_set_end_id += self.num_sets_prefetch_buffer
+            self.last_prefetch_start_cycle = self.last_prefetch_end_cycle +1
+            self.last_prefetch_end_cycle = cycle
 
     #
     def check_hit(self, addr):
@@ -278,15 +474,13 @@ class ReadBufferEstimateBw:
         delta = max_prefetch_capacity - len(all_addresses)
 
         if delta > 0:
-            for _ in range(delta):
-                all_addresses += [-1]
+            all_addresses += [-1] * delta
 
         prefetch_requests = np.asarray(all_addresses).reshape((cycles_needed,
                                                                self.prefetch_bandwidth))
 
-        cycles_arr = np.zeros((cycles_needed,1))
-        for i in range(cycles_arr.shape[0]):
-            cycles_arr[i][0] = self.last_prefetch_start_cycle + i
+        cycles_arr = self.last_prefetch_start_cycle + np.arange(cycles_needed)
+        cycles_arr = cycles_arr.reshape((cycles_needed, 1))
 
         response_cycles_arr = \
             self.backing_buffer.service_reads(incoming_cycles_arr=cycles_arr,
@@ -294,23 +488,8 @@ class ReadBufferEstimateBw:
 
         # Create / add elements to the trace matrix
         this_prefetch_traces = np.concatenate((response_cycles_arr, prefetch_requests), axis=1)
-
-        if not self.trace_valid:
-            self.trace_matrix = this_prefetch_traces
-            self.trace_valid = True
-
-        else:
-            del_cols = self.trace_matrix.shape[1] - this_prefetch_traces.shape[1]
-            if del_cols > 0:
-                empty_cols = np.ones((this_prefetch_traces.shape[0], del_cols))
-                this_prefetch_traces = np.concatenate((this_prefetch_traces, empty_cols), axis=1)
-
-            elif del_cols < 0:
-                del_cols = int(-1 * del_cols)
-                empty_cols = np.ones((self.trace_matrix.shape[0], del_cols))
-                self.trace_matrix = np.concatenate((self.trace_matrix, empty_cols), axis=1)
-
-            self.trace_matrix = np.concatenate((self.trace_matrix, this_prefetch_traces), axis=0)
+        self.trace_matrix.append(this_prefetch_traces)
+        self.trace_valid = True
 
     #
     def get_latency(self):
@@ -330,7 +509,7 @@ class ReadBufferEstimateBw:
             print('No trace has been generated yet')
             return
 
-        return self.trace_matrix
+        return self.trace_matrix.get_array()
 
     #
     def get_hit_latency(self):
@@ -353,8 +532,9 @@ class ReadBufferEstimateBw:
         Method to get start and stop cycles of the read estimate buffer if trace_valid flag is set.
         """
         assert self.trace_valid, 'Traces not ready yet'
-        start_cycle = self.trace_matrix[0][0]
-        end_cycle = self.trace_matrix[-1][0]
+        num_rows = self.trace_matrix.get_num_rows()
+        start_cycle = self.trace_matrix.get_rows(0, 1)[0][0]
+        end_cycle = self.trace_matrix.get_rows(num_rows - 1, num_rows)[0][0]
 
         return start_cycle, end_cycle
 
@@ -367,4 +547,4 @@ class ReadBufferEstimateBw:
             print('No trace has been generated yet')
             return
 
-        np.savetxt(filename, self.trace_matrix, fmt='%s', delimiter=",")
+        self.trace_matrix.savetxt(filename, fmt='%i', delimiter=",")
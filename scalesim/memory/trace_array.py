@@ -0,0 +1,233 @@
+"""
+This file contains the 'trace_array' class, an append only 2D array used by the buffers to grow
+their traces.
+"""
+
+import os
+import tempfile
+import bisect
+import numpy as np
+
+
+class trace_array:
+    """
+    Class which stores the rows appended to a trace in chunks, so that appending does not copy the
+    rows already stored. The rows are merged into chunks of about chunk_rows rows, which can
+    optionally be spilled to the disk. The complete array is only built when asked for, and it is
+    kept only when the chunks are in memory. A spilled trace is served from its chunks by
+    get_rows() and savetxt().
+    """
+    #
+    def __init__(self, pad_value=None, chunk_rows=2 ** 16, spill_dir=None):
+        """
+        __init__ method. If pad_value is provided, rows of different widths can be appended and
+        the narrower rows are padded with pad_value up to the widest one. Otherwise all the rows
+        must have the same width. If spill_dir is provided, the full chunks are saved to files in
+        this directory instead of being kept in memory.
+        """
+        self.pad_value = pad_value
+        self.chunk_rows = chunk_rows
+        self.spill_dir = spill_dir
+
+        # Merged chunks, as arrays or as the paths of the spilled files, and their first rows
+        self.chunks = []
+        self.chunk_start_rows = []
+
+        # Rows appended since the last merge
+        self.pending = []
+        self.num_pending_rows = 0
+
+        self.num_rows = 0
+        self.num_cols = 0
+        self.dtype = None
+
+        # The complete array, once built and until the next append, when the chunks are in memory
+        self.array = None
+
+    #
+    def append(self, rows):
+        """
+        Method to append a 2D array of rows at the end of the trace. The rows are copied, so the
+        array can be modified by the caller afterwards.
+        """
+        if rows.shape[0] == 0:
+            return
+
+        if self.num_rows > 0 and not rows.shape[1] == self.num_cols:
+            assert self.pad_value is not None, 'Trace rows of different widths'
+
+        self.num_cols = max(self.num_cols, rows.shape[1])
+        self.dtype = rows.dtype if self.dtype is None else np.promote_types(self.dtype, rows.dtype)
+
+        self.pending.append(np.array(rows))
+        self.num_pending_rows += rows.shape[0]
+        self.num_rows += rows.shape[0]
+        self.array = None
+
+        if not self.num_pending_rows < self.chunk_rows:
+            self.merge_pending()
+
+    #
+    def merge_pending(self):
+        """
+        Method to merge the rows appended since the last merge into a new chunk.
+        """
+        if self.num_pending_rows == 0:
+            return
+
+        chunk = self.concatenate(self.pending)
+        self.chunk_start_rows.append(self.num_rows - self.num_pending_rows)
+        self.pending = []
+        self.num_pending_rows = 0
+
+        if self.spill_dir is not None and not chunk.shape[0] < self.chunk_rows:
+            file_handle, path = tempfile.mkstemp(suffix='.npy', dir=self.spill_dir)
+            with os.fdopen(file_handle, 'wb') as f:
+                np.save(f, chunk)
+            self.chunks.append(path)
+        else:
+            self.chunks.append(chunk)
+
+    #
+    def concatenate(self, arrays):
+        """
+        Method to stack arrays of rows, padding the narrower ones to the current width.
+        """
+        padded = []
+        for arr in arrays:
+            if arr.shape[1] < self.num_cols:
+                pad = np.full((arr.shape[0], self.num_cols - arr.shape[1]), self.pad_value)
+                arr = np.concatenate((arr, pad), axis=1)
+            padded.append(arr)
+
+        if len(padded) == 1:
+            return padded[0]
+        return np.concatenate(padded, axis=0)
+
+    #
+    def get_chunk(self, chunk_id):
+        """
+        Method to get a merged chunk, reading it back if it was spilled to the disk.
+        """
+        chunk = self.chunks[chunk_id]
+        if isinstance(chunk, str):
+            chunk = np.load(chunk, mmap_mode='r')
+        return chunk
+
+    #
+    def get_num_rows(self):
+        """
+        Method to get the number of rows in the trace.
+        """
+        return self.num_rows
+
+    #
+    @property
+    def shape(self):
+        """
+        Shape of the trace.
+        """
+        return self.num_rows, self.num_cols
+
+    #
+    def __len__(self):
+        """
+        Method to get the number of rows in the trace.
+        """
+        return self.num_rows
+
+    #
+    def __getitem__(self, key):
+        """
+        Method to index the trace as a numpy array, on a contiguous range of rows or a single row.
+        """
+        if isinstance(key, slice):
+            start_row, end_row, step = key.indices(self.num_rows)
+            assert step == 1, 'Only contiguous ranges of trace rows can be read'
+            return self.get_rows(start_row, end_row)
+
+        row_id = int(key)
+        if row_id < 0:
+            row_id += self.num_rows
+        assert 0 <= row_id < self.num_rows, 'Trace row out of range'
+        return self.get_rows(row_id, row_id + 1)[0]
+
+    #
+    def get_rows(self, start_row, end_row):
+        """
+        Method to get the rows from start_row up to, but not including, end_row as an array.
+        """
+        start_row = max(start_row, 0)
+        end_row = min(end_row, self.num_rows)
+        if self.array is not None:
+            return self.array[start_row:end_row]
+        if not start_row < end_row:
+            return np.zeros((0, self.num_cols), dtype=self.dtype)
+
+        self.merge_pending()
+
+        parts = []
+        chunk_id = bisect.bisect_right(self.chunk_start_rows, start_row) - 1
+        while chunk_id < len(self.chunks) and self.chunk_start_rows[chunk_id] < end_row:
+            chunk_start = self.chunk_start_rows[chunk_id]
+            chunk = self.get_chunk(chunk_id)
+            parts.append(chunk[max(start_row - chunk_start, 0):end_row - chunk_start])
+            chunk_id += 1
+
+        return self.concatenate(parts).astype(self.dtype, copy=False)
+
+    #
+    def get_array(self):
+        """
+        Method to get the complete trace as a single array. When the chunks are kept in memory, the
+        array is built once, replaces the chunks and is kept until the next append. When the chunks
+        are spilled, the array is built on every call and is not kept.
+        """
+        if self.spill_dir is not None:
+            return self.get_rows(0, self.num_rows)
+
+        if self.array is None:
+            self.array = self.get_rows(0, self.num_rows)
+            self.chunks = [self.array]
+            self.chunk_start_rows = [0]
+
+        return self.array
+
+    #
+    def savetxt(self, filename, fmt='%s', delimiter=','):
+        """
+        Method to write the trace to a csv file one chunk at a time, as np.savetxt() would write the
+        complete array.
+        """
+        self.merge_pending()
+
+        with open(filename, 'wb') as f:
+            for chunk_id in range(len(self.chunks)):
+                chunk = self.concatenate([self.get_chunk(chunk_id)]).astype(self.dtype, copy=False)
+                np.savetxt(f, chunk, fmt=fmt, delimiter=delimiter)
+
+    #
+    def clear(self):
+        """
+        Method to remove all the rows from the trace, along with the spilled files.
+        """
+        for chunk in self.chunks:
+            if isinstance(chunk, str) and os.path.exists(chunk):
+                os.remove(chunk)
+
+        self.chunks = []
+        self.chunk_start_rows = []
+        self.pending = []
+        self.num_pending_rows = 0
+        self.num_rows = 0
+        self.num_cols = 0
+        self.dtype = None
+        self.array = None
+
+    #
+    def __del__(self):
+        """
+        __del__ method. Removes the spilled files.
+        """
+        if self.spill_dir is not None:
+            self.clear()
@@ -8,6 +8,7 @@ import numpy as np
 # import matplotlib.pyplot as plt
 from tqdm import tqdm
 from scalesim.memory.write_port import write_port
+from scalesim.memory.trace_array import trace_array
 
 
 class write_buffer:
@@ -38,18 +39,18 @@ class write_buffer:
         self.drain_buf_start_line_id = 0
         self.drain_buf_end_line_id = 0
 
-        # Helper data structures for faster execution
+        # Ring buffer of the request lines which are not drained yet, sized from the SRAM capacity.
+        # Line number n of the trace is assembled in the line n % (number of lines) of the ring.
         self.line_idx = 0
-        self.current_line = np.ones((1, 1)) * -1
-        self.max_cache_lines = 2 ** 10  # TODO: This is arbitrary, check if this can be tuned
-        self.trace_matrix_cache = np.zeros((1, 1))
+        self.num_lines_assembled = 0
+        self.line_buf = np.full((1, 1), -1, dtype=np.int64)
 
         # Access counts
         self.num_access = 0
 
         # Trace matrix
-        self.trace_matrix = np.zeros((1, 1))
-        self.cycles_vec = np.zeros((1, 1))
+        self.trace_matrix = trace_array()
+        self.cycles_vec = trace_array()
 
         # Flags
         # This variable determines where the new requests should be buffered
@@ -59,17 +60,15 @@ class write_buffer:
         self.drain_end_cycle = 0
 
         self.trace_valid = False
-        # Fixing ISSUE #10
-        self.trace_matrix_cache_empty = True
-        self.trace_matrix_empty = True
 
     #
     def set_params(self, backing_buf_obj,
                    total_size_bytes=128, word_size=1, active_buf_frac=0.9,
-                   backing_buf_bw=100
+                   backing_buf_bw=100, spill_dir=None
                    ):
         """
-        Method to set the ofmap memory simulation parameters for housekeeping.
+        Method to set the ofmap memory simulation parameters for housekeeping. If spill_dir is
+        provided, the trace is spilled to files in this directory as it grows.
         """
         self.total_size_bytes = total_size_bytes
         self.word_size = word_size
@@ -85,6 +84,11 @@ class write_buffer:
         self.drain_buf_size = self.total_size_elems - self.active_buf_size
         self.free_space = self.total_size_elems
 
+        self.trace_matrix = trace_array(spill_dir=spill_dir)
+        self.cycles_vec = trace_array(spill_dir=spill_dir)
+
+        self.init_line_buf()
+
     #
     def reset(self):
         """
@@ -100,89 +104,119 @@ class write_buffer:
         self.free_space = self.total_size_elems
         self.drain_end_cycle = 0
 
-        self.trace_matrix = np.zeros((1, 1))
+        self.trace_matrix = trace_array()
+        self.cycles_vec = trace_array()
+        self.drain_buf_start_line_id = 0
+        self.drain_buf_end_line_id = 0
+        self.init_line_buf()
 
         self.num_access = 0
         self.state = 0
 
         self.trace_valid = False
-        # Fixing ISSUE #10
-        self.trace_matrix_cache_empty = True
-        self.trace_matrix_empty = True
+
+    #
+    def init_line_buf(self):
+        """
+        Method to allocate an empty ring buffer of request lines, with enough lines to hold the
+        whole SRAM plus a partially filled line.
+        """
+        num_buf_lines = int(math.ceil(self.total_size_elems / self.req_gen_bandwidth)) + 2
+        self.line_buf = np.full((num_buf_lines, self.req_gen_bandwidth), -1, dtype=np.int64)
+        self.line_idx = 0
+        self.num_lines_assembled = 0
+
+    #
+    def grow_line_buf(self, num_lines_needed):
+        """
+        Method to grow the ring buffer so that it can hold num_lines_needed lines from the first
+        line not drained yet. The lines are moved to their positions in the larger ring.
+        """
+        num_buf_lines = self.line_buf.shape[0]
+        if not num_lines_needed > num_buf_lines:
+            return
+
+        new_num_buf_lines = max(2 * num_buf_lines, num_lines_needed)
+        new_line_buf = np.full((new_num_buf_lines, self.req_gen_bandwidth), -1,
+                               dtype=np.int64)
+
+        # The closed lines, and the line being assembled if it has elements
+        end_line_id = self.num_lines_assembled + (1 if self.line_idx > 0 else 0)
+        line_ids = np.arange(self.drain_buf_start_line_id, end_line_id)
+        new_line_buf[line_ids % new_num_buf_lines] = self.line_buf[line_ids % num_buf_lines]
+        self.line_buf = new_line_buf
 
     #
     def store_to_trace_mat_cache(self, elem):
         """
-        Method to add the incoming element to the trace matrix cache.
+        Method to add the incoming element to the line being assembled.
         """
         if elem == -1:
             return
 
-        if self.current_line.shape == (1,1):    # This line is empty
-            self.current_line = np.ones((1, self.req_gen_bandwidth)) * -1
-
-        self.current_line[0, self.line_idx] = elem
+        row = self.num_lines_assembled % self.line_buf.shape[0]
+        self.line_buf[row, self.line_idx] = elem
         self.line_idx += 1
         self.free_space -= 1
 
         if not self.line_idx < self.req_gen_bandwidth:
-            # Store to the cache matrix
-            # Fixing ISSUE #10
-            # if self.trace_matrix_cache.shape == (1,1):
-            if self.trace_matrix_cache_empty:
-                self.trace_matrix_cache = self.current_line
-                self.trace_matrix_cache_empty = False
-            else:
-                self.trace_matrix_cache = np.concatenate((
-                                                          self.trace_matrix_cache,
-                                                          self.current_line
-                                                         ),
-                                                         axis=0)
-
-            self.current_line = np.ones((1,1)) * -1
+            self.num_lines_assembled += 1
             self.line_idx = 0
-
-            if not self.trace_matrix_cache.shape[0] < self.max_cache_lines:
-                self.append_to_trace_mat()
+            self.grow_line_buf(self.num_lines_assembled + 1 - self.drain_buf_start_line_id)
 
     #
-    def append_to_trace_mat(self, force=False):
-        """
-        Method to append to the trace matrix cache.
-        """
-        if force:
-            # This forces the contents for self.current_line and self.trace_matrix
-            # cache to be dumped
-            if not self.line_idx == 0:
-                #if self.trace_matrix_cache.shape == (1,1):
-                if self.trace_matrix_cache_empty:
-                    self.trace_matrix_cache = self.current_line
-                    self.trace_matrix_cache_empty = False
-                else:
-                    self.trace_matrix_cache = np.concatenate((
-                                                              self.trace_matrix_cache,
-                                                              self.current_line
-                                                             ),
-                                                             axis=0)
-
-                self.current_line = np.ones((1,1)) * -1
-                self.line_idx = 0
-        # Fixing ISSUE #10
-        # if self.trace_matrix_cache.shape == (1,1):
-        if self.trace_matrix_cache_empty:
+    def store_block_to_trace_mat_cache(self, elems):
+        """
+        Method to add a vector of valid elements to the lines being assembled, in order, with slice
+        assignments over the ring buffer. This is the same as adding them one by one with
+        store_to_trace_mat_cache().
+        """
+        num_elems = elems.shape[0]
+        if num_elems == 0:
             return
 
-        #if self.trace_matrix.shape == (1,1):
-        if self.trace_matrix_empty:
-            self.trace_matrix = self.trace_matrix_cache
-            self.drain_buf_start_line_id = 0
-            self.trace_matrix_empty = False
-        else:
-            self.trace_matrix = np.concatenate((self.trace_matrix, self.trace_matrix_cache), axis=0)
+        bandwidth = self.req_gen_bandwidth
+        self.free_space -= num_elems
+
+        # Lines holding the elements, with one more in case the last one gets completed
+        end_pos = self.line_idx + num_elems
+        self.grow_line_buf(self.num_lines_assembled + end_pos // bandwidth + 1
+                           - self.drain_buf_start_line_id)
 
-        self.trace_matrix_cache = np.zeros((1,1))
-        # Fixing ISSUE #10
-        self.trace_matrix_cache_empty = True
+        # The ring buffer seen as a flat vector, written in at most two slices as it wraps around
+        ring_elems = self.line_buf.reshape(-1)
+        ring_size = ring_elems.shape[0]
+        start = (self.num_lines_assembled * bandwidth + self.line_idx) % ring_size
+        first_part = min(num_elems, ring_size - start)
+        ring_elems[start:start + first_part] = elems[:first_part]
+        ring_elems[:num_elems - first_part] = elems[first_part:]
+
+        self.num_lines_assembled += end_pos // bandwidth
+        self.line_idx = end_pos % bandwidth
+
+    #
+    def close_current_line(self):
+        """
+        Method to close the line being assembled, if it has elements, so that it can be drained.
+        The rest of the line is left as -1.
+        """
+        if not self.line_idx == 0:
+            self.num_lines_assembled += 1
+            self.line_idx = 0
+            self.grow_line_buf(self.num_lines_assembled + 1 - self.drain_buf_start_line_id)
+
+    #
+    def get_num_elems_till_event(self, current_cycle):
+        """
+        Method to get the number of valid elements which can be written at current_cycle up to, and
+        including, the one after which a write stalls or a drain starts in service_writes().
+        """
+        if current_cycle < self.drain_end_cycle:
+            # Stalls once there is no free space
+            return max(self.free_space, 1)
+
+        # Starts a drain once the free space is less than the size of the active buffer
+        return max(self.free_space - (self.total_size_elems - self.drain_buf_size) + 1, 1)
 
     #
     def service_writes(self, incoming_requests_arr_np, incoming_cycles_arr_np):
@@ -203,20 +237,26 @@ class write_buffer:
             cycle = incoming_cycles_arr_np[i]
             current_cycle = cycle[0] + offset
 
-            for elem in row:
-                # Pay no attention to empty requests
-                if elem == -1:
-                    continue
+            # Pay no attention to empty requests
+            elems = row[row != -1]
 
-                self.store_to_trace_mat_cache(elem)
+            # The elements are stored in runs, each ending with the element after which a write
+            # stalls or a drain starts
+            pos = 0
+            while pos < elems.shape[0]:
+                num_elems = self.get_num_elems_till_event(current_cycle)
+                if not num_elems < elems.shape[0] - pos + 1:
+                    self.store_block_to_trace_mat_cache(elems[pos:])
+                    break
 
-                if current_cycle < self.drain_end_cycle:
-                    if not self.free_space > 0:
-                        offset += max(self.drain_end_cycle - current_cycle, 0)
-                        current_cycle = self.drain_end_cycle
+                self.store_block_to_trace_mat_cache(elems[pos:pos + num_elems])
+                pos += num_elems
 
-                elif self.free_space < (self.total_size_elems - self.drain_buf_size):
-                    self.append_to_trace_mat(force=True)
+                if current_cycle < self.drain_end_cycle:
+                    offset += max(self.drain_end_cycle - current_cycle, 0)
+                    current_cycle = self.drain_end_cycle
+                else:
+                    self.close_current_line()
                     self.drain_end_cycle = self.empty_drain_buf(empty_start_cycle=current_cycle)
 
             out_cycles_arr.append(current_cycle)
@@ -231,37 +271,83 @@ class write_buffer:
 
         return out_cycles_arr_np
 
+    #
+    def get_num_stall_free_lines(self, incoming_requests_arr_np, incoming_cycles_arr_np):
+        """
+        Method to get the number of leading request lines which neither stall nor start draining
+        the drain buffer when serviced by service_writes(). These can be serviced together by
+        service_stall_free_writes(). The free space only goes down over these lines, so checking
+        it after the last element of each line is enough.
+        """
+        line_counts = np.count_nonzero(incoming_requests_arr_np != -1, axis=1)
+        free_space_after = self.free_space - np.cumsum(line_counts)
+        cycles = incoming_cycles_arr_np[:, 0]
+
+        # While draining, writes stall once there is no free space. Otherwise, a drain starts once
+        # the free space is less than the size of the active buffer.
+        draining = cycles < self.drain_end_cycle
+        stall_free = (line_counts == 0) \
+            | (draining & (free_space_after > 0)) \
+            | (~draining & (free_space_after >= self.total_size_elems - self.drain_buf_size))
+
+        if np.all(stall_free):
+            return incoming_requests_arr_np.shape[0]
+        return int(np.argmin(stall_free))
+
+    #
+    def service_stall_free_writes(self, incoming_requests_arr_np, incoming_cycles_arr_np):
+        """
+        Method to service request lines which neither stall nor start a drain, as found by
+        get_num_stall_free_lines().
+        """
+        valid_elems = incoming_requests_arr_np[incoming_requests_arr_np != -1]
+        self.store_block_to_trace_mat_cache(valid_elems)
+
+        return incoming_cycles_arr_np
+
+    #
+    def service_null_writes(self, incoming_cycles_arr_np):
+        """
+        Method to service request lines without any valid request. Nothing is stored, so these
+        neither stall nor start a drain.
+        """
+        return incoming_cycles_arr_np
+
     #
     def empty_drain_buf(self, empty_start_cycle=0):
         """
-        Method to drain the drain buffer once the active buffer is full.
+        Method to drain the drain buffer once the active buffer is full. The drained lines are sent
+        to the backing buffer as a view of the ring buffer when they do not wrap around it.
         """
 
         lines_to_fill_dbuf = int(math.ceil(self.drain_buf_size / self.req_gen_bandwidth))
         self.drain_buf_end_line_id = self.drain_buf_start_line_id + lines_to_fill_dbuf
-        self.drain_buf_end_line_id = min(self.drain_buf_end_line_id, self.trace_matrix.shape[0])
-
-        requests_arr_np = \
-                    self.trace_matrix[self.drain_buf_start_line_id: self.drain_buf_end_line_id, :]
-        num_lines = requests_arr_np.shape[0]
+        self.drain_buf_end_line_id = min(self.drain_buf_end_line_id, self.num_lines_assembled)
+
+        num_buf_lines = self.line_buf.shape[0]
+        start_row = self.drain_buf_start_line_id % num_buf_lines
+        num_lines = self.drain_buf_end_line_id - self.drain_buf_start_line_id
+        if start_row + num_lines > num_buf_lines:
+            rows = np.arange(start_row, start_row + num_lines) % num_buf_lines
+            requests_arr_np = self.line_buf[rows]
+        else:
+            rows = slice(start_row, start_row + num_lines)
+            requests_arr_np = self.line_buf[rows]
 
         data_sz_to_drain = num_lines * requests_arr_np.shape[1]
         # Adjust for -1
-        for elem in requests_arr_np[-1,:]:
-            if elem == -1:
-                data_sz_to_drain -= 1
+        data_sz_to_drain -= int(np.count_nonzero(requests_arr_np[-1, :] == -1))
         self.num_access += data_sz_to_drain
 
-        cycles_arr = [x+empty_start_cycle for x in range(num_lines)]
-        cycles_arr_np = np.asarray(cycles_arr).reshape((num_lines, 1))
+        cycles_arr_np = (np.arange(num_lines) + empty_start_cycle).reshape((num_lines, 1))
         serviced_cycles_arr = self.backing_buffer.service_writes(requests_arr_np, cycles_arr_np)
 
-        # Assign the cycles vector which will be used to generate the complete trace
-        if not self.trace_valid:
-            self.cycles_vec = serviced_cycles_arr
-            self.trace_valid = True
-        else:
-            self.cycles_vec = np.concatenate((self.cycles_vec, serviced_cycles_arr), axis=0)
+        # Add the drained lines and their cycles to the complete trace, and free their lines in the
+        # ring buffer
+        self.trace_matrix.append(requests_arr_np)
+        self.cycles_vec.append(serviced_cycles_arr)
+        self.trace_valid = True
+        self.line_buf[rows] = -1
 
         service_end_cycle = serviced_cycles_arr[-1][0]
         self.free_space += data_sz_to_drain
@@ -274,12 +360,9 @@ class write_buffer:
         """
         Method to drain all of the active buffer.
         """
-        self.append_to_trace_mat(force=True)
+        self.close_current_line()
 
-        if self.trace_matrix_empty:
-            return
-
-        while self.drain_buf_start_line_id < self.trace_matrix.shape[0]:
+        while self.drain_buf_start_line_id < self.num_lines_assembled:
             self.drain_end_cycle = self.empty_drain_buf(empty_start_cycle=cycle)
             cycle = self.drain_end_cycle + 1
 
@@ -293,7 +376,8 @@ class write_buffer:
             print('No trace has been generated yet')
             return
 
-        trace_matrix = np.concatenate((self.cycles_vec, self.trace_matrix), axis=1)
+        trace_matrix = np.concatenate((self.cycles_vec.get_array(), self.trace_matrix.get_array()),
+                                      axis=1)
 
         return trace_matrix
 
@@ -318,8 +402,9 @@ class write_buffer:
         Method to get start and stop cycles of the write buffer if trace_valid flag is set.
         """
         assert self.trace_valid, 'Traces not ready yet'
-        start_cycle = self.cycles_vec[0][0]
-        end_cycle = self.cycles_vec[-1][0]
+        num_rows = self.cycles_vec.get_num_rows()
+        start_cycle = self.cycles_vec.get_rows(0, 1)[0][0]
+        end_cycle = self.cycles_vec.get_rows(num_rows - 1, num_rows)[0][0]
 
         return start_cycle, end_cycle
 
@@ -331,5 +416,14 @@ class write_buffer:
         if not self.trace_valid:
             print('No trace has been generated yet')
             return
-        trace_matrix = self.get_trace_matrix()
-        np.savetxt(filename, trace_matrix, fmt='%s', delimiter=",")
+
+        # Write a chunk of the cycles and the requests at a time
+        num_rows = self.cycles_vec.get_num_rows()
+        chunk_rows = self.cycles_vec.chunk_rows
+        with open(filename, 'wb') as f:
+            for start_row in range(0, num_rows, chunk_rows):
+                end_row = min(start_row + chunk_rows, num_rows)
+                trace_rows = np.concatenate((self.cycles_vec.get_rows(start_row, end_row),
+                                             self.trace_matrix.get_rows(start_row, end_row)),
+                                            axis=1)
+                np.savetxt(f, trace_rows, fmt='%i', delimiter=",")
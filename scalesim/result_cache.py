@@ -0,0 +1,215 @@
+"""
+This file contains the 'result_cache' class which stores the results of layer simulations on disk,
+so that a layer which was simulated before with the same config is not simulated again.
+"""
+
+import gzip
+import hashlib
+import os
+import pickle
+import shutil
+
+from scalesim import __version__
+
+
+# Bump this when the format of the stored results or traces changes, and with any change to the
+# simulated timing or to the reports which does not bump __version__, so that old entries are not
+# used anymore. The key holds the package version, but not the changes made between releases.
+CACHE_FORMAT_VERSION = 2
+
+
+class result_cache:
+    """
+    Class which manages a content addressed cache of layer results. Each entry is a directory named
+    after the hash of the layer parameters, the config parameters which affect the simulation and
+    the simulator version. It holds the report items and optionally the compressed traces. The
+    least recently used entries are evicted once the cache grows beyond its size limit.
+    """
+    #
+    def __init__(self):
+        """
+        __init__ method
+        """
+        self.cache_dir = ''
+        self.max_size_bytes = 1024 * 1024 * 1024
+
+        self.report_items_filename = 'report_items.pkl'
+
+        # Running estimate of the size of the cache, so that the entries are only scanned when a
+        # store may push the cache over its size limit. None until the first scan.
+        self.size_estimate_bytes = None
+
+        self.params_set_flag = False
+
+    #
+    def set_params(self, cache_dir='', max_size_mb=1024):
+        """
+        Method to set the cache directory and its maximum size in MB.
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        self.size_estimate_bytes = None
+        self.params_set_flag = True
+
+    #
+    @staticmethod
+    def get_key(layer_params, timing_conf_list):
+        """
+        Method to get the key of a layer from its parameters (without the name) and the config
+        parameters which affect the simulation.
+        """
+        key_items = [str(x) for x in layer_params[1:]]
+        key_items += [str(x) for x in timing_conf_list]
+        key_items += [str(__version__), str(CACHE_FORMAT_VERSION)]
+
+        key = hashlib.sha256('|'.join(key_items).encode()).hexdigest()
+        return key
+
+    #
+    def lookup(self, key, trace_dir=''):
+        """
+        Method to look up the results for a key. If trace_dir is provided, the entry must hold the
+        traces as well, which are then restored into trace_dir. Returns the report items and the
+        restored trace paths, or None if there is no usable entry.
+        """
+        assert self.params_set_flag, 'Cache parameters are not set'
+
+        entry_dir = self.cache_dir + '/' + key
+        report_items_file = entry_dir + '/' + self.report_items_filename
+        if not os.path.isfile(report_items_file):
+            return None
+
+        # The entry can be evicted by another run at any point, which is treated as a miss
+        try:
+            trace_files = sorted(x for x in os.listdir(entry_dir) if x.endswith('.csv.gz'))
+            if not trace_dir == '' and len(trace_files) == 0:
+                return None
+
+            with open(report_items_file, 'rb') as f:
+                report_items = pickle.load(f)
+
+            trace_paths = []
+            if not trace_dir == '':
+                if not os.path.isdir(trace_dir):
+                    os.mkdir(trace_dir)
+                for trace_file in trace_files:
+                    trace_path = trace_dir + '/' + trace_file[:-len('.gz')]
+                    with gzip.open(entry_dir + '/' + trace_file, 'rb') as src, \
+                            open(trace_path, 'wb') as dst:
+                        shutil.copyfileobj(src, dst)
+                    trace_paths.append(trace_path)
+
+            # Mark the entry as recently used
+            os.utime(report_items_file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # The entry was evicted or broken while being read, treat it as a miss
+            return None
+
+        return report_items, trace_paths
+
+    #
+    def store(self, key, report_items, trace_paths=None):
+        """
+        Method to store the report items and, if provided, the compressed traces for a key. The
+        entry is written to a temporary directory first so that a partial entry is never visible.
+        An entry larger than the maximum size of the cache is not stored, as it would be evicted
+        right away along with all the other entries.
+        """
+        assert self.params_set_flag, 'Cache parameters are not set'
+
+        if trace_paths is None:
+            trace_paths = []
+
+        entry_dir = self.cache_dir + '/' + key
+        tmp_dir = entry_dir + '.tmp' + str(os.getpid())
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.mkdir(tmp_dir)
+
+        with open(tmp_dir + '/' + self.report_items_filename, 'wb') as f:
+            pickle.dump(report_items, f)
+
+        for trace_path in trace_paths:
+            trace_file = os.path.basename(trace_path) + '.gz'
+            with open(trace_path, 'rb') as src, gzip.open(tmp_dir + '/' + trace_file, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+
+        entry_size = self.get_dir_size(tmp_dir)
+        if entry_size > self.max_size_bytes:
+            print('WARNING: The results of size ' + str(entry_size // (1024 * 1024)) + ' MB do not '
+                  + 'fit in the result cache of ' + str(self.max_size_bytes // (1024 * 1024))
+                  + ' MB, they are not cached')
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        # A previous entry without traces is replaced by this one
+        if os.path.isdir(entry_dir):
+            shutil.rmtree(entry_dir, ignore_errors=True)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another run stored the same entry in the meantime
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        # The entries are only scanned when this store may push the cache over its size limit
+        if self.size_estimate_bytes is not None:
+            self.size_estimate_bytes += entry_size
+        if self.size_estimate_bytes is None or self.size_estimate_bytes > self.max_size_bytes:
+            self.evict()
+
+    #
+    @staticmethod
+    def get_dir_size(dir_path):
+        """
+        Method to get the size in bytes of the files in a cache entry directory. The files removed
+        by another run in the meantime are not counted.
+        """
+        dir_size = 0
+        for file_name in os.listdir(dir_path):
+            try:
+                dir_size += os.path.getsize(dir_path + '/' + file_name)
+            except FileNotFoundError:
+                continue
+        return dir_size
+
+    #
+    def evict(self):
+        """
+        Method to remove the least recently used entries until the cache fits in its maximum size.
+        The entries being written by other runs are skipped, and the entries renamed or evicted by
+        other runs while they are scanned are ignored. The size left is kept as the running
+        estimate of the size of the cache.
+        """
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.cache_dir):
+            if '.tmp' in name:
+                continue
+
+            entry_dir = self.cache_dir + '/' + name
+            report_items_file = entry_dir + '/' + self.report_items_filename
+            try:
+                last_used = os.path.getmtime(report_items_file)
+                entry_size = self.get_dir_size(entry_dir)
+            except OSError:
+                continue
+
+            entries.append((last_used, entry_size, entry_dir))
+            total_size += entry_size
+
+        entries.sort()
+        for _, entry_size, entry_dir in entries:
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                shutil.rmtree(entry_dir)
+            except OSError:
+                # Evicted by another run in the meantime
+                pass
+            total_size -= entry_size
+
+        self.size_estimate_bytes = total_size
@@ -25,12 +25,53 @@ if __name__ == '__main__':
                         default="conv",
                         help="Type of input topology, gemm: MNK, conv: conv"
                         )
+    parser.add_argument('-w', metavar='num workers', type=int,
+                        default=None,
+                        help="Number of worker processes to run the layers, "
+                             "0 uses all the cores (overrides the config file)"
+                        )
+    parser.add_argument('-r', metavar='result cache dir', type=str,
+                        default=None,
+                        help="Path to the cache of layer results reused across runs "
+                             "(overrides the config file)"
+                        )
+    parser.add_argument('-m', metavar='run mode', type=str,
+                        default=None, choices=['full', 'analytic'],
+                        help="full: simulate every layer, analytic: estimate the stall free layers "
+                             "in closed form (overrides the config file)"
+                        )
+    parser.add_argument('--resume', action='store_true',
+                        help="Resume an interrupted run in the same log dir, skipping the layers "
+                             "which are already done"
+                        )
+    parser.add_argument('--bounded_memory', action='store_true',
+                        help="Release the matrices of each layer once it is reported, so that the "
+                             "memory use is bounded by the largest layer "
+                             "(overrides the config file)"
+                        )
+    parser.add_argument('--profile', action='store_true',
+                        help="Record the wall time and the peak allocated memory of each phase "
+                             "of the layer runs in PROFILE_REPORT.csv "
+                             "(overrides the config file)"
+                        )
+    parser.add_argument('--spill_traces', action='store_true',
+                        help="Spill the traces of the layers to the disk under the log dir as "
+                             "they grow, instead of keeping them in memory "
+                             "(overrides the config file)"
+                        )
 
     args = parser.parse_args()
     topology = args.t
     config = args.c
     logpath = args.p
     inp_type = args.i
+    num_workers = args.w
+    result_cache_dir = args.r
+    run_mode = args.m
+    resume = args.resume
+    bounded_memory = True if args.bounded_memory else None
+    profile = True if args.profile else None
+    spill_traces = True if args.spill_traces else None
 
     GEMM_INPUT = False
     if inp_type == 'gemm':
@@ -39,6 +80,13 @@ if __name__ == '__main__':
     s = scalesim(save_disk_space=True, verbose=True,
                  config=config,
                  topology=topology,
-                 input_type_gemm=GEMM_INPUT
+                 input_type_gemm=GEMM_INPUT,
+                 num_workers=num_workers,
+                 result_cache_dir=result_cache_dir,
+                 run_mode=run_mode,
+                 resume=resume,
+                 bounded_memory=bounded_memory,
+                 profile=profile,
+                 spill_traces=spill_traces
                  )
     s.run_scale(top_path=logpath)
@@ -42,17 +42,108 @@ class scale_config:
         self.sparsity_block_size = 4
         self.sparsity_rand_seed = 40
 
+        # Number of worker processes used to simulate the layers, 1 runs them serially
+        self.num_workers = 1
+
+        # Directory of the on-disk cache of layer results, an empty path disables the cache
+        self.result_cache_dir = ''
+        self.result_cache_size_mb = 1024
+
+        # 'full' simulates every layer, 'analytic' estimates the layers in closed form when possible
+        self.run_mode = 'full'
+        self.valid_run_mode_list = ['full', 'analytic']
+
+        # Release the matrices of each layer once it is reported, to bound the memory of long runs
+        self.bounded_memory = False
+
+        # Record the wall time and the peak allocated memory of each phase of the layer runs
+        self.profile = False
+        self.spill_traces = False
+
+        # Batch size of the layers which do not have a batch size column in the topology file
+        self.batch_size = 1
+
     #
     def read_conf_file(self, conf_file_in):
         """
         Method to read the configuration file and extract all the archietctural knobs.
         """
 
-        me = 'scale_config.' + 'read_conf_file()'
-
         config = cp.ConfigParser()
         config.read(conf_file_in)
 
+        self.parse_conf(config)
+
+    #
+    def read_conf_dict(self, conf_dict):
+        """
+        Method to read the configuration from a dictionary instead of a file. The dictionary either
+        has the sections of the config file, each with a dictionary of keys, or only the keys, in
+        which case their sections are looked up. The missing keys take their default values.
+        """
+        config = cp.ConfigParser()
+        config.read_dict(self.get_default_conf_as_dict())
+
+        if all(isinstance(x, dict) for x in conf_dict.values()):
+            config.read_dict(conf_dict)
+        else:
+            for key, value in conf_dict.items():
+                section = self.get_conf_key_section(key)
+                assert not section == '', 'Unknown config key: ' + str(key)
+                config.set(section, key, str(value))
+
+        self.parse_conf(config)
+
+    #
+    @staticmethod
+    def get_default_conf_as_dict():
+        """
+        Method to get the default configuration as a dictionary with the sections of the config
+        file.
+        """
+        conf_dict = {'general': {'run_name': 'scale_run'},
+                     'architecture_presets': {'ArrayHeight': '4',
+                                              'ArrayWidth': '4',
+                                              'IfmapSramSzkB': '256',
+                                              'FilterSramSzkB': '256',
+                                              'OfmapSramSzkB': '128',
+                                              'IfmapOffset': '0',
+                                              'FilterOffset': '10000000',
+                                              'OfmapOffset': '20000000',
+                                              'Bandwidth': '10',
+                                              'Dataflow': 'ws'},
+                     'sparsity': {'SparsitySupport': 'false',
+                                  'SparseRep': 'ellpack_block',
+                                  'OptimizedMapping': 'false',
+                                  'BlockSize': '4',
+                                  'RandomNumberGeneratorSeed': '40'},
+                     'run_presets': {'InterfaceBandwidth': 'CALC'}}
+        return conf_dict
+
+    #
+    @staticmethod
+    def get_conf_key_section(key):
+        """
+        Method to get the section of the config file which has the given key. Returns an empty
+        string for an unknown key.
+        """
+        keys_per_section = scale_config.get_default_conf_as_dict()
+        keys_per_section['run_presets'].update({'NumWorkers': '', 'ResultCacheDir': '',
+                                                'ResultCacheSizeMB': '', 'RunMode': '',
+                                                'BoundedMemory': '', 'Profile': '',
+                                                'SpillTraces': '', 'BatchSize': ''})
+        for section, keys in keys_per_section.items():
+            if key.lower() in [x.lower() for x in keys]:
+                return section
+        return ''
+
+    #
+    def parse_conf(self, config):
+        """
+        Method to extract all the archietctural knobs from a parsed configuration.
+        """
+        me = 'scale_config.' + 'parse_conf()'
+
         section = 'general'
         self.run_name = config.get(section, 'run_name')
 
@@ -68,6 +159,35 @@ class scale_config:
             message += 'Use either USER or CALC in InterfaceBandwidth feild. Aborting!'
             return
 
+        if config.has_option(section, 'NumWorkers'):
+            self.num_workers = int(config.get(section, 'NumWorkers'))
+
+        if config.has_option(section, 'ResultCacheDir'):
+            self.result_cache_dir = config.get(section, 'ResultCacheDir').strip()
+        if config.has_option(section, 'ResultCacheSizeMB'):
+            self.result_cache_size_mb = int(config.get(section, 'ResultCacheSizeMB'))
+
+        if config.has_option(section, 'RunMode'):
+            self.run_mode = config.get(section, 'RunMode').strip().lower()
+            if self.run_mode not in self.valid_run_mode_list:
+                print("WARNING: Invalid run mode, using full simulation")
+                self.run_mode = 'full'
+
+        if config.has_option(section, 'BoundedMemory'):
+            self.bounded_memory = config.get(section, 'BoundedMemory').strip().lower() == 'true'
+
+        if config.has_option(section, 'Profile'):
+            self.profile = config.get(section, 'Profile').strip().lower() == 'true'
+
+        if config.has_option(section, 'SpillTraces'):
+            self.spill_traces = config.get(section, 'SpillTraces').strip().lower() == 'true'
+
+        if config.has_option(section, 'BatchSize'):
+            self.batch_size = int(config.get(section, 'BatchSize'))
+            if self.batch_size < 1:
+                print("WARNING: Invalid batch size, using a batch size of 1")
+                self.batch_size = 1
+
         section = 'architecture_presets'
         self.array_rows = int(config.get(section, 'ArrayHeight'))
         self.array_cols = int(config.get(section, 'ArrayWidth'))
@@ -234,6 +354,62 @@ class scale_config:
         self.ifmap_offset = ofmap_offset
         self.valid_conf_flag = True
 
+    #
+    def set_num_workers(self, num_workers=1):
+        """
+        Method to set the number of worker processes used to run the layers. A value less than 1
+        uses all the available cores.
+        """
+        self.num_workers = num_workers
+
+    #
+    def set_result_cache(self, cache_dir='', size_mb=1024):
+        """
+        Method to set the directory and the maximum size in MB of the cache of layer results. An
+        empty directory disables the cache.
+        """
+        self.result_cache_dir = cache_dir
+        self.result_cache_size_mb = size_mb
+
+    #
+    def set_run_mode(self, run_mode='full'):
+        """
+        Method to set the run mode, either 'full' or 'analytic'.
+        """
+        assert run_mode in self.valid_run_mode_list, 'Invalid run mode'
+        self.run_mode = run_mode
+
+    #
+    def set_bounded_memory(self, bounded_memory=False):
+        """
+        Method to set if the matrices of each layer are released once the layer is reported.
+        """
+        self.bounded_memory = bounded_memory
+
+    #
+    def set_profile(self, profile=False):
+        """
+        Method to set if the wall time and the peak allocated memory of each phase of the layer runs
+        are recorded.
+        """
+        self.profile = profile
+
+    #
+    def set_spill_traces(self, spill_traces=False):
+        """
+        Method to set if the traces of the layers are spilled to the disk as they grow, instead of
+        being kept in memory.
+        """
+        self.spill_traces = spill_traces
+
+    #
+    def set_batch_size(self, batch_size=1):
+        """
+        Method to set the default batch size of the layers.
+        """
+        assert batch_size > 0, 'The batch size should be positive'
+        self.batch_size = batch_size
+
     #
     def force_valid(self):
         """
@@ -248,6 +424,16 @@ class scale_config:
         """
         self.use_user_bandwidth = False
 
+    #
+    def set_bw_mode_to_user(self, bandwidths=None):
+        """
+        Method to set the 'use_user_bandwidth' to USER mode with the given list of bandwidths.
+        """
+        if bandwidths is None:
+            bandwidths = [10]
+        self.bandwidths = bandwidths
+        self.use_user_bandwidth = True
+
     #
     def use_user_dram_bandwidth(self):
         """
@@ -290,6 +476,28 @@ class scale_config:
 
         return out_list
 
+    #
+    def get_timing_conf_as_list(self):
+        """
+        Method to extract the configuration parameters which affect the simulation results in the
+        form of a list. The run name and the topology path are left out.
+        """
+        if not self.valid_conf_flag:
+            print("ERROR: scale_config.get_timing_conf_as_list: Configuration is not valid")
+            return
+
+        out_list = [self.array_rows, self.array_cols,
+                    self.ifmap_sz_kb, self.filter_sz_kb, self.ofmap_sz_kb,
+                    self.ifmap_offset, self.filter_offset, self.ofmap_offset,
+                    self.df, self.use_user_bandwidth, self.run_mode]
+        out_list += [self.bandwidths if self.use_user_bandwidth else []]
+        out_list += [self.sparsity_support]
+        if self.sparsity_support:
+            out_list += [self.sparsity_representation, self.sparsity_optimized_mapping,
+                         self.sparsity_block_size, self.sparsity_rand_seed]
+
+        return [str(x) for x in out_list]
+
     #
     def get_run_name(self):
         """
@@ -363,6 +571,64 @@ class scale_config:
         if self.valid_conf_flag:
             return self.ifmap_offset, self.filter_offset, self.ofmap_offset
 
+    #
+    def get_num_workers(self):
+        """
+        Method to get the number of worker processes used to run the layers.
+        """
+        return self.num_workers
+
+    #
+    def get_result_cache_dir(self):
+        """
+        Method to get the directory of the cache of layer results.
+        """
+        return self.result_cache_dir
+
+    #
+    def get_result_cache_size_mb(self):
+        """
+        Method to get the maximum size in MB of the cache of layer results.
+        """
+        return self.result_cache_size_mb
+
+    #
+    def get_run_mode(self):
+        """
+        Method to get the run mode, either 'full' or 'analytic'.
+        """
+        return self.run_mode
+
+    #
+    def get_bounded_memory(self):
+        """
+        Method to get if the matrices of each layer are released once the layer is reported.
+        """
+        return self.bounded_memory
+
+    #
+    def get_profile(self):
+        """
+        Method to get if the wall time and the peak allocated memory of each phase of the layer runs
+        are recorded.
+        """
+        return self.profile
+
+    #
+    def get_spill_traces(self):
+        """
+        Method to get if the traces of the layers are spilled to the disk as they grow, instead of
+        being kept in memory.
+        """
+        return self.spill_traces
+
+    #
+    def get_batch_size(self):
+        """
+        Method to get the default batch size of the layers.
+        """
+        return self.batch_size
+
     #
     def get_bandwidths_as_string(self):
         """
@@ -1,12 +1,84 @@
 """
-This file contains 'scalesim' class that provides a framework to run simulations, generate traces
-and reports.
+This file contains the 'scalesim' class that provides a framework to run simulations, generate
+traces and reports, along with the simulate() function which runs them in memory.
 """
 
+import copy
 import os
 from scalesim.scale_config import scale_config
 from scalesim.topology_utils import topologies
 from scalesim.simulator import simulator
+from scalesim.simulation_result import simulation_result
+
+
+#
+def simulate(config,
+             topology,
+             top_path=None,
+             save_trace=False,
+             input_type_gemm=False,
+             num_workers=None,
+             run_mode=None,
+             verbose=False):
+    """
+    Function to run the simulation of a workload and return the results of each layer in memory, as
+    a 'simulation_result' object. The config is a 'scale_config' object, a dictionary of config keys
+    or the path of a config file. The topology is a 'topologies' object, a list of layer
+    dictionaries as taken by topologies.load_layer_dicts() or the path of a topology file, which is
+    read as GEMM layers if input_type_gemm is set. Nothing is written to the disk unless top_path is
+    provided, in which case the reports, and the traces if save_trace is set, are written there as
+    in a regular run. If num_workers or run_mode are provided, they take precedence over the values
+    in the config, which is not modified.
+    """
+    if isinstance(config, scale_config):
+        config_obj = config
+        if num_workers is not None or run_mode is not None:
+            config_obj = copy.deepcopy(config)
+    else:
+        config_obj = scale_config()
+        if isinstance(config, dict):
+            config_obj.read_conf_dict(config)
+        else:
+            config_obj.read_conf_file(config)
+
+    if num_workers is not None:
+        config_obj.set_num_workers(num_workers)
+    if run_mode is not None:
+        config_obj.set_run_mode(run_mode)
+
+    if isinstance(topology, topologies):
+        topo_obj = topology
+    else:
+        topo_obj = topologies()
+        if isinstance(topology, str):
+            topo_obj.load_arrays(topofile=topology, mnk_inputs=input_type_gemm,
+                                 batch_size=config_obj.get_batch_size())
+        else:
+            topo_obj.load_layer_dicts(topology, batch_size=config_obj.get_batch_size())
+
+    write_reports = top_path is not None
+    runner = simulator()
+    runner.set_params(config_obj=config_obj,
+                      topo_obj=topo_obj,
+                      top_path=top_path if write_reports else './',
+                      verbosity=verbose,
+                      save_trace=save_trace and write_reports,
+                      write_reports=write_reports)
+    runner.run()
+
+    report_columns = {}
+    for report_kind in runner.get_report_names():
+        columns = runner.get_report_columns(report_kind)
+        if report_kind == 'sparse':
+            # The sparsity representation is a part of the config, not of the report items
+            columns = columns[1:]
+        report_columns[report_kind] = columns
+
+    result = simulation_result()
+    result.set_params(layer_names=[topo_obj.get_layer_name(x) for x in range(runner.num_layers)],
+                      layer_report_items_list=runner.layer_report_items_list,
+                      report_columns=report_columns)
+    return result
 
 
 class scalesim:
@@ -20,10 +92,20 @@ class scalesim:
                  verbose=True,
                  config='',
                  topology='',
-                 input_type_gemm=False
+                 input_type_gemm=False,
+                 num_workers=None,
+                 result_cache_dir=None,
+                 run_mode=None,
+                 resume=False,
+                 bounded_memory=None,
+                 profile=None,
+                 spill_traces=None
                  ):
         """
-        __init__ method
+        __init__ method. If num_workers, result_cache_dir, run_mode, bounded_memory, profile or
+        spill_traces are provided, they take precedence over the values in the config file. When
+        resume is set, the layers completed by a previous interrupted run in the same log directory
+        are not run again.
         """
         # Data structures
         self.config = scale_config()
@@ -41,12 +123,32 @@ class scalesim:
         # Flags
         self.read_gemm_inputs = input_type_gemm
         self.save_space = save_disk_space
+        self.resume = resume
         self.verbose_flag = verbose
         self.run_done_flag = False
         self.logs_generated_flag = False
 
         self.set_params(config_filename=config, topology_filename=topology)
 
+        if num_workers is not None:
+            self.config.set_num_workers(num_workers)
+
+        if result_cache_dir is not None:
+            self.config.set_result_cache(cache_dir=result_cache_dir,
+                                         size_mb=self.config.get_result_cache_size_mb())
+
+        if run_mode is not None:
+            self.config.set_run_mode(run_mode)
+
+        if bounded_memory is not None:
+            self.config.set_bounded_memory(bounded_memory)
+
+        if profile is not None:
+            self.config.set_profile(profile)
+
+        if spill_traces is not None:
+            self.config.set_spill_traces(spill_traces)
+
     #
     def set_params(self,
                    config_filename='',
@@ -83,7 +185,8 @@ class scalesim:
             self.config.set_topology_file(self.topology_file)
 
         # Parse the topology
-        self.topo.load_arrays(topofile=self.topology_file, mnk_inputs=self.read_gemm_inputs)
+        self.topo.load_arrays(topofile=self.topology_file, mnk_inputs=self.read_gemm_inputs,
+                              batch_size=self.config.get_batch_size())
 
         #num_layers = self.topo.get_num_layers()
         #self.config.scale_memory_maps(num_layers=num_layers)
@@ -101,7 +204,8 @@ class scalesim:
             topo_obj=self.topo,
             top_path=self.top_path,
             verbosity=self.verbose_flag,
-            save_trace=save_trace
+            save_trace=save_trace,
+            resume=self.resume
         )
         self.run_once()
 
@@ -160,6 +264,15 @@ class scalesim:
         print("SRAM Filter (kB): \t" + str(filter_kb))
         print("SRAM OFMAP (kB): \t" + str(ofmap_kb))
         print("Dataflow: \t" + df_string)
+        print("Num Workers: \t" + str(self.config.get_num_workers()))
+        if not self.config.get_result_cache_dir() == '':
+            print("Result Cache: \t" + self.config.get_result_cache_dir())
+        if self.config.get_run_mode() == 'analytic':
+            print('Working in ANALYTIC run mode.')
+        if self.config.get_bounded_memory():
+            print('Working in BOUNDED MEMORY mode.')
+        if self.config.get_profile():
+            print('Profiling the layer runs.')
         print("CSV file path: \t" + self.config.get_topology_path())
 
         if self.config.use_user_dram_bandwidth():
@@ -0,0 +1,110 @@
+"""
+This file contains the 'simulation_result' class which holds the per layer results of a run in
+memory, as returned by scalesim.scale_sim.simulate().
+"""
+
+import pandas as pd
+
+
+class simulation_result:
+    """
+    Class which holds the report items of each layer of a run along with the names of the report
+    columns, and provides them as a DataFrame or a NumPy structured array.
+    """
+    #
+    def __init__(self):
+        """
+        __init__ method
+        """
+        self.layer_names = []
+        self.layer_report_items_list = []
+
+        # Names of the columns of each report, in the order of the report items
+        self.report_columns = {}
+
+        self.dataframe = None
+        self.params_set_flag = False
+
+    #
+    def set_params(self, layer_names, layer_report_items_list, report_columns):
+        """
+        Method to set the layer names, the report items of each layer and the names of the columns
+        of each report. The report items without a column are not included in the tables.
+        """
+        assert len(layer_names) == len(layer_report_items_list), \
+            'The number of layer names and results do not match'
+
+        self.layer_names = layer_names
+        self.layer_report_items_list = layer_report_items_list
+        self.report_columns = report_columns
+
+        self.dataframe = None
+        self.params_set_flag = True
+
+    #
+    def get_num_layers(self):
+        """
+        Method to get the number of layers in the results.
+        """
+        return len(self.layer_report_items_list)
+
+    #
+    def get_layer_names(self):
+        """
+        Method to get the names of the layers in the results.
+        """
+        return self.layer_names
+
+    #
+    def get_report_items(self, layer_id):
+        """
+        Method to get the report items of a layer, as a dictionary with a list of items per report.
+        """
+        assert self.params_set_flag, 'Results are not set'
+        return self.layer_report_items_list[layer_id]
+
+    #
+    def get_total_cycles(self):
+        """
+        Method to get the total cycles (stalls + compute) across all the layers.
+        """
+        assert self.params_set_flag, 'Results are not set'
+
+        total_cycles = 0
+        for report_items in self.layer_report_items_list:
+            total_cycles += int(report_items['compute'][0])
+
+        return total_cycles
+
+    #
+    def get_dataframe(self):
+        """
+        Method to get the results as a DataFrame with one row per layer. The columns are the layer
+        id, the layer name and the columns of the reports, named as in the report files.
+        """
+        assert self.params_set_flag, 'Results are not set'
+
+        if self.dataframe is not None:
+            return self.dataframe
+
+        rows = []
+        for layer_id, report_items in enumerate(self.layer_report_items_list):
+            row = {'LayerID': layer_id, 'Layer Name': self.layer_names[layer_id]}
+            for report_kind, columns in self.report_columns.items():
+                row.update(zip(columns, report_items[report_kind]))
+            rows.append(row)
+
+        columns = ['LayerID', 'Layer Name']
+        for report_columns in self.report_columns.values():
+            columns += [x for x in report_columns if x not in columns]
+
+        self.dataframe = pd.DataFrame(rows, columns=columns)
+        return self.dataframe
+
+    #
+    def get_structured_array(self):
+        """
+        Method to get the results as a NumPy structured array with one record per layer and the
+        same fields as the columns of the DataFrame.
+        """
+        return self.get_dataframe().to_records(index=False)
@@ -3,11 +3,94 @@ This file contains the 'simulator' class that simulates the entire model using t
 'single_layer_sim' and generates the reports (.csv files).
 """
 
+import gc
+import hashlib
+import json
 import os
+import shutil
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
 
+from scalesim.result_cache import result_cache
 from scalesim.scale_config import scale_config as cfg
 from scalesim.topology_utils import topologies as topo
 from scalesim.single_layer_sim import single_layer_sim as layer_sim
+from scalesim.single_layer_sim import PROFILE_PHASES
+from scalesim.analytic_layer_sim import analytic_layer_sim
+
+
+# Config and topology shared by the layers run in a worker process. These are set once per worker
+# by init_layer_worker() so that they are not sent again with every layer.
+worker_config = cfg()
+worker_topo = topo()
+
+
+#
+def init_layer_worker(config_obj, topo_obj):
+    """
+    Function to install the config and topology objects in a worker process of the layer pool.
+    """
+    global worker_config, worker_topo   # pylint: disable=global-statement
+    worker_config = config_obj
+    worker_topo = topo_obj
+
+
+#
+def estimate_layer(layer_id, config_obj, topo_obj):
+    """
+    Function to estimate the report items of a single layer analytically. Returns None if the layer
+    stalls on memory, in which case it needs to be simulated.
+    """
+    this_layer_estimate = analytic_layer_sim()
+    this_layer_estimate.set_params(layer_id=layer_id,
+                                   config_obj=config_obj,
+                                   topology_obj=topo_obj,
+                                   verbose=False)
+    this_layer_estimate.run()
+
+    if not this_layer_estimate.is_stall_free():
+        return None
+
+    return this_layer_estimate.get_report_items()
+
+
+#
+def get_layer_fingerprint(layer_id, config_obj, topo_obj):
+    """
+    Function to get the fingerprint of a layer. It is made of the layer dimensions, strides and
+    sparsity ratio along with the config parameters which affect the simulation. The layer name is
+    not a part of it. Layers with the same fingerprint generate identical results.
+    """
+    layer_params = topo_obj.get_layer_params(layer_id)
+    fingerprint = tuple(layer_params[1:]) + tuple(config_obj.get_timing_conf_as_list())
+    return fingerprint
+
+
+#
+def run_layer_in_worker(layer_id, top_path, save_trace, spill_dir=None):
+    """
+    Function to run the simulation of a single layer in a worker process. Only the report items and
+    the paths of the saved traces are sent back to the parent process. The traces are spilled to
+    spill_dir as they grow, if provided.
+    """
+    if worker_config.get_run_mode() == 'analytic':
+        report_items = estimate_layer(layer_id, worker_config, worker_topo)
+        if report_items is not None:
+            return report_items, []
+
+    this_layer_sim = layer_sim()
+    this_layer_sim.set_params(layer_id=layer_id,
+                              config_obj=worker_config,
+                              topology_obj=worker_topo,
+                              verbose=False,
+                              spill_dir=spill_dir)
+    this_layer_sim.run()
+
+    trace_paths = []
+    if save_trace:
+        trace_paths = this_layer_sim.save_traces(top_path)
+
+    return this_layer_sim.get_report_items(), trace_paths
 
 
 class simulator:
@@ -25,11 +108,43 @@ class simulator:
         self.top_path = "./"
         self.verbose = True
         self.save_trace = True
+        self.num_workers = 1
+        self.memoize_layers = True
+        self.run_mode = 'full'
+        self.resume = False
+        self.bounded_memory = False
+        self.profile = False
+        self.write_reports = True
+
+        # Directory where the traces of the layers are spilled as they grow, if any
+        self.spill_dir = None
 
         self.num_layers = 0
 
         self.single_layer_sim_object_list = []
 
+        # For each layer, the id of the first layer with the same fingerprint. Only these layers
+        # are simulated, the rest reuse their results.
+        self.source_layer_ids = []
+
+        # On-disk cache of layer results, used when a cache directory is set in the config
+        self.cache = result_cache()
+        self.use_cache = False
+
+        # Report items and trace paths for each layer, in layer order
+        self.layer_report_items_list = []
+        self.layer_trace_paths_list = []
+
+        # The reports are written as soon as each layer is done. The manifest records the completed
+        # layers along with the hash of the run parameters, so that an interrupted run can resume.
+        self.report_files = {}
+        self.manifest_path = ''
+        self.run_hash = ''
+        self.completed_layer_ids = []
+
+        # Report items of the layers completed by the previous run, when resuming
+        self.resumed_report_items = {}
+
         self.params_set_flag = False
         self.all_layer_run_done = False
 
@@ -39,10 +154,19 @@ class simulator:
                    topo_obj=topo(),
                    top_path="./",
                    verbosity=True,
-                   save_trace=True
+                   save_trace=True,
+                   num_workers=None,
+                   memoize_layers=True,
+                   resume=False,
+                   write_reports=True
                    ):
         """
-        Method to set the run parameters including inputs and parameters for housekeeping.
+        Method to set the run parameters including inputs and parameters for housekeeping. If the
+        number of workers is not provided, the value from the config is used. When memoize_layers
+        is set, layers with identical dimensions are simulated only once. When resume is set, the
+        layers completed by a previous run in the same directory are not run again. When
+        write_reports is not set, nothing is written to the disk and the results are only kept in
+        memory.
         """
         self.conf = config_obj
         self.topo = topo_obj
@@ -51,6 +175,15 @@ class simulator:
         self.verbose = verbosity
         self.save_trace = save_trace
 
+        if num_workers is None:
+            num_workers = self.conf.get_num_workers()
+        self.num_workers = num_workers
+        self.memoize_layers = memoize_layers
+        self.resume = resume
+        self.write_reports = write_reports
+        assert write_reports or not (save_trace or resume), \
+            'Traces are saved and runs are resumed from the reports on the disk'
+
         # Calculate inferrable parameters here
         self.num_layers = self.topo.get_num_layers()
 
@@ -60,178 +193,681 @@ class simulator:
     def run(self):
         """
         Method to run scalesim simulation for all layers. This method first runs compute and memory
-        simulations for each layer and gathers the required stats. Once the simulation runs are
-        done, it gathers the stats from single_layer_sim objects and calls generate_report() method
-        to create the report files. If save_trace flag is set, then layer wise traces are saved as
-        well.
+        simulations for each layer and gathers the required stats. The report rows of each layer are
+        written as soon as the layer is done, along with a manifest of the completed layers. If
+        save_trace flag is set, then layer wise traces are saved as well. When more than one worker
+        is requested, the layers are run in a process pool. When resuming, the layers completed by
+        a previous run with the same config and topology are not run again.
         """
         assert self.params_set_flag, 'Simulator parameters are not set'
 
-        # 1. Create the layer runners for each layer
-        for i in range(self.num_layers):
-            this_layer_sim = layer_sim()
-            this_layer_sim.set_params(layer_id=i,
-                                 config_obj=self.conf,
-                                 topology_obj=self.topo,
-                                 verbose=self.verbose)
+        if self.write_reports:
+            if not os.path.isdir(self.top_path):
+                os.mkdir(self.top_path)
+
+            report_path = self.top_path + '/' + self.conf.get_run_name()
+
+            if not os.path.isdir(report_path):
+                os.mkdir(report_path)
+
+            self.top_path = report_path
+
+        # The traces are spilled under the run directory, so only when the reports are written
+        self.spill_dir = None
+        if self.conf.get_spill_traces() and self.write_reports:
+            self.spill_dir = self.top_path + '/trace_spill'
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+        self.run_mode = self.conf.get_run_mode()
+        self.bounded_memory = self.conf.get_bounded_memory()
+        self.profile = self.conf.get_profile()
+        self.single_layer_sim_object_list = []
+        if self.run_mode == 'analytic' and self.save_trace:
+            # The estimated layers have no traces, so none are saved for consistency
+            if self.verbose:
+                print('Traces are not saved in the analytic run mode')
+            self.save_trace = False
+
+        self.layer_report_items_list = []
+        self.layer_trace_paths_list = []
+
+        self.find_source_layers()
+
+        self.use_cache = not self.conf.get_result_cache_dir() == ''
+        if self.use_cache:
+            self.cache.set_params(cache_dir=self.conf.get_result_cache_dir(),
+                                  max_size_mb=self.conf.get_result_cache_size_mb())
+
+        self.start_reports()
+
+        # The layers start tracing the allocations when profiling, which is stopped once they are
+        # done unless it was already running
+        was_tracing = tracemalloc.is_tracing()
 
-            self.single_layer_sim_object_list.append(this_layer_sim)
+        if self.num_workers == 1:
+            self.run_layers_serial()
+        else:
+            self.run_layers_parallel()
+
+        if self.profile and not was_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
 
-        if not os.path.isdir(self.top_path):
-            os.mkdir(self.top_path)
+        self.close_reports()
 
-        report_path = self.top_path + '/' + self.conf.get_run_name()
+        if self.spill_dir is not None:
+            # The directory is left in place while the layers kept for later use hold spilled traces
+            try:
+                os.rmdir(self.spill_dir)
+            except OSError:
+                pass
 
-        if not os.path.isdir(report_path):
-            os.mkdir(report_path)
+        self.all_layer_run_done = True
 
-        self.top_path = report_path
+    #
+    def get_layer_fingerprint(self, layer_id):
+        """
+        Method to get the fingerprint of a layer with the config of this simulator.
+        """
+        return get_layer_fingerprint(layer_id, self.conf, self.topo)
 
-        # 2. Run each layer
-        # TODO: This is parallelizable
-        for single_layer_obj in self.single_layer_sim_object_list:
+    #
+    def find_source_layers(self):
+        """
+        Method to find, for each layer, the first layer with the same fingerprint. The results of
+        that layer are reused when memoization is enabled.
+        """
+        self.source_layer_ids = []
+        first_layer_with_fingerprint = {}
+
+        for layer_id in range(self.num_layers):
+            source_id = layer_id
+            if self.memoize_layers:
+                fingerprint = self.get_layer_fingerprint(layer_id)
+                source_id = first_layer_with_fingerprint.setdefault(fingerprint, layer_id)
+            self.source_layer_ids.append(source_id)
+
+    #
+    def copy_layer_traces(self, source_trace_paths, layer_id):
+        """
+        Method to copy the traces of a previously simulated layer to the directory of this layer.
+        The addresses only depend on the layer dimensions and the offsets, so the traces of
+        identical layers are the same.
+        """
+        dir_name = self.top_path + '/layer' + str(layer_id)
+        if not os.path.isdir(dir_name):
+            os.mkdir(dir_name)
+
+        trace_paths = []
+        for source_path in source_trace_paths:
+            dest_path = dir_name + '/' + os.path.basename(source_path)
+            shutil.copyfile(source_path, dest_path)
+            trace_paths.append(dest_path)
+
+        return trace_paths
+
+    #
+    def record_layer(self, layer_id, report_items, trace_paths):
+        """
+        Method to record the results of a layer which is done. The layers are recorded in order.
+        The report rows of the layer are written out and the layer is added to the manifest. When
+        profiling, the layers which were not simulated in this run are profiled as 0.
+        """
+        assert layer_id == len(self.layer_report_items_list), 'Layers are recorded out of order'
+
+        if self.profile and 'profile' not in report_items:
+            report_items = dict(report_items)
+            report_items['profile'] = [0] * len(self.get_report_columns('profile'))
+
+        self.layer_report_items_list.append(report_items)
+        self.layer_trace_paths_list.append(trace_paths)
+
+        self.completed_layer_ids.append(layer_id)
+        if self.write_reports:
+            self.write_layer_reports(layer_id, report_items)
+            self.write_manifest()
+
+    #
+    def resume_layer(self, layer_id):
+        """
+        Method to record the results of a layer completed by the previous run. Its report rows are
+        already in the reports and its traces in the layer directory.
+        """
+        assert layer_id == len(self.layer_report_items_list), 'Layers are recorded out of order'
+
+        trace_paths = []
+        dir_name = self.top_path + '/layer' + str(layer_id)
+        if self.save_trace and os.path.isdir(dir_name):
+            trace_paths = [dir_name + '/' + x for x in sorted(os.listdir(dir_name))]
+
+        self.layer_report_items_list.append(self.resumed_report_items[layer_id])
+        self.layer_trace_paths_list.append(trace_paths)
+        self.completed_layer_ids.append(layer_id)
+
+    #
+    def reuse_source_layer(self, layer_id):
+        """
+        Method to record the results of a layer by reusing the ones of its source layer.
+        """
+        source_id = self.source_layer_ids[layer_id]
+        # The profile of the source layer does not apply to this one
+        report_items = {k: v for k, v in self.layer_report_items_list[source_id].items()
+                        if not k == 'profile'}
+
+        trace_paths = []
+        if self.save_trace:
+            trace_paths = self.copy_layer_traces(self.layer_trace_paths_list[source_id], layer_id)
+
+        self.record_layer(layer_id, report_items, trace_paths)
+
+    #
+    def get_layer_cache_key(self, layer_id):
+        """
+        Method to get the key of a layer in the result cache.
+        """
+        return self.cache.get_key(self.topo.get_layer_params(layer_id),
+                                  self.conf.get_timing_conf_as_list())
+
+    #
+    def get_cached_layer(self, layer_id):
+        """
+        Method to get the report items and trace paths of a layer from the result cache. The traces
+        are restored into the directory of the layer. Returns None on a miss.
+        """
+        if not self.use_cache:
+            return None
+
+        trace_dir = ''
+        if self.save_trace:
+            trace_dir = self.top_path + '/layer' + str(layer_id)
+
+        return self.cache.lookup(self.get_layer_cache_key(layer_id), trace_dir=trace_dir)
+
+    #
+    def cache_layer(self, layer_id, report_items, trace_paths):
+        """
+        Method to store the report items and traces of a simulated layer in the result cache.
+        """
+        if not self.use_cache:
+            return
+
+        # The profile is specific to this run, so it is not cached
+        report_items = {k: v for k, v in report_items.items() if not k == 'profile'}
+        self.cache.store(self.get_layer_cache_key(layer_id), report_items, trace_paths)
+
+    #
+    def run_layers_serial(self):
+        """
+        Method to run the layers one after the other in this process.
+        """
+        for layer_id in range(self.num_layers):
+            if layer_id in self.resumed_report_items:
+                self.resume_layer(layer_id)
+                if self.verbose:
+                    print('\nLayer ' + str(layer_id) + ' was completed by the previous run')
+                continue
 
             if self.verbose:
-                layer_id = single_layer_obj.get_layer_id()
                 print('\nRunning Layer ' + str(layer_id))
 
-            single_layer_obj.run()
+            source_id = self.source_layer_ids[layer_id]
+            if not source_id == layer_id:
+                self.reuse_source_layer(layer_id)
+                if self.verbose:
+                    print('Identical to layer ' + str(source_id) + ', reusing its results')
+                    self.print_layer_report(self.layer_report_items_list[layer_id])
+                continue
+
+            cached_results = self.get_cached_layer(layer_id)
+            if cached_results is not None:
+                report_items, trace_paths = cached_results
+                self.record_layer(layer_id, report_items, trace_paths)
+                if self.verbose:
+                    print('Found in the result cache, reusing its results')
+                    self.print_layer_report(report_items)
+                continue
+
+            if self.run_mode == 'analytic':
+                report_items = estimate_layer(layer_id, self.conf, self.topo)
+                if report_items is not None:
+                    self.cache_layer(layer_id, report_items, [])
+                    self.record_layer(layer_id, report_items, [])
+                    if self.verbose:
+                        print('Estimated analytically')
+                        self.print_layer_report(report_items)
+                    continue
+                if self.verbose:
+                    print('Memory stalls expected, running the full simulation')
 
-            if self.verbose:
-                comp_items = single_layer_obj.get_compute_report_items()
-                comp_cycles = comp_items[0]
-                stall_cycles = comp_items[1]
-                util = comp_items[2]
-                mapping_eff = comp_items[3]
-                print('Compute cycles: ' + str(comp_cycles))
-                print('Stall cycles: ' + str(stall_cycles))
-                print('Overall utilization: ' + "{:.2f}".format(util) +'%')
-                print('Mapping efficiency: ' + "{:.2f}".format(mapping_eff) +'%')
-
-                avg_bw_items = single_layer_obj.get_bandwidth_report_items()
-                if self.conf.sparsity_support is True:
-                    avg_ifmap_sram_bw = avg_bw_items[0]
-                    avg_filter_sram_bw = avg_bw_items[1]
-                    avg_filter_metadata_sram_bw = avg_bw_items[2]
-                    avg_ofmap_sram_bw = avg_bw_items[3]
-                    avg_ifmap_dram_bw = avg_bw_items[4]
-                    avg_filter_dram_bw = avg_bw_items[5]
-                    avg_ofmap_dram_bw = avg_bw_items[6]
-                else:
-                    avg_ifmap_sram_bw = avg_bw_items[0]
-                    avg_filter_sram_bw = avg_bw_items[1]
-                    avg_ofmap_sram_bw = avg_bw_items[2]
-                    avg_ifmap_dram_bw = avg_bw_items[3]
-                    avg_filter_dram_bw = avg_bw_items[4]
-                    avg_ofmap_dram_bw = avg_bw_items[5]
-
-                print('Average IFMAP SRAM BW: ' + "{:.3f}".format(avg_ifmap_sram_bw) + \
-                      ' words/cycle')
-                print('Average Filter SRAM BW: ' + "{:.3f}".format(avg_filter_sram_bw) + \
-                      ' words/cycle')
-                if self.conf.sparsity_support is True:
-                    print('Average Filter Metadata SRAM BW: ' + \
-                          "{:.3f}".format(avg_filter_metadata_sram_bw) + ' words/cycle')
-                print('Average OFMAP SRAM BW: ' + "{:.3f}".format(avg_ofmap_sram_bw) + \
-                      ' words/cycle')
-                print('Average IFMAP DRAM BW: ' + "{:.3f}".format(avg_ifmap_dram_bw) + \
-                      ' words/cycle')
-                print('Average Filter DRAM BW: ' + "{:.3f}".format(avg_filter_dram_bw) + \
-                      ' words/cycle')
-                print('Average OFMAP DRAM BW: ' + "{:.3f}".format(avg_ofmap_dram_bw) + \
-                      ' words/cycle')
+            single_layer_obj = layer_sim()
+            single_layer_obj.set_params(layer_id=layer_id,
+                                        config_obj=self.conf,
+                                        topology_obj=self.topo,
+                                        verbose=self.verbose,
+                                        spill_dir=self.spill_dir)
+            if not self.bounded_memory:
+                self.single_layer_sim_object_list.append(single_layer_obj)
+
+            single_layer_obj.run()
 
+            trace_paths = []
             if self.save_trace:
                 if self.verbose:
                     print('Saving traces: ', end='')
-                single_layer_obj.save_traces(self.top_path)
+                trace_paths = single_layer_obj.save_traces(self.top_path)
                 if self.verbose:
                     print('Done!')
 
-        self.all_layer_run_done = True
+            # The report items are collected after the traces are saved, so that the profile
+            # includes the trace writing
+            report_items = single_layer_obj.get_report_items()
+
+            if self.verbose:
+                self.print_layer_report(report_items)
 
-        self.generate_reports()
+            self.cache_layer(layer_id, report_items, trace_paths)
+            self.record_layer(layer_id, report_items, trace_paths)
+
+            if self.bounded_memory:
+                # The layer is reported, so its matrices are freed before the next layer starts
+                single_layer_obj.release_memory()
+                del single_layer_obj
+                gc.collect()
 
     #
-    def generate_reports(self):
+    def run_layers_parallel(self):
         """
-        Method to generate the report files for scalesim run if the runs are already completed. For
-        each layer, this method collects the report data from single_layer_sim objects and then
-        prints them out into COMPUTE_REPORT.csv, BANDWIDTH_REPORT.csv, DETAILED_ACCESS_REPORT.csv
-        and SPARSE_REPORT.csv files.
+        Method to run the layers in a pool of worker processes. The results are recorded in layer
+        order as soon as all the previous layers are done, so the reports are identical to the ones
+        from a serial run.
         """
-        assert self.all_layer_run_done, 'Layer runs are not done yet'
+        num_workers = self.num_workers
+        if num_workers < 1:
+            num_workers = os.cpu_count()
+
+        results_per_layer = {}
+        layer_ids = []
+        for layer_id in range(self.num_layers):
+            if layer_id in self.resumed_report_items:
+                continue
+            if not self.source_layer_ids[layer_id] == layer_id:
+                continue
+            cached_results = self.get_cached_layer(layer_id)
+            if cached_results is not None:
+                results_per_layer[layer_id] = cached_results
+            else:
+                layer_ids.append(layer_id)
+        num_runs = len(layer_ids)
+
+        if self.verbose:
+            print('\nRunning ' + str(num_runs) + ' distinct layers out of '
+                  + str(self.num_layers) + ' on ' + str(num_workers) + ' workers')
+
+        top_paths = [self.top_path] * num_runs
+        save_traces = [self.save_trace] * num_runs
+        spill_dirs = [self.spill_dir] * num_runs
+
+        next_layer_id = self.record_ready_layers(0, results_per_layer)
+        with ProcessPoolExecutor(max_workers=num_workers,
+                                 initializer=init_layer_worker,
+                                 initargs=(self.conf, self.topo)) as executor:
+            results = executor.map(run_layer_in_worker, layer_ids, top_paths, save_traces,
+                                   spill_dirs)
+            for layer_id, (report_items, trace_paths) in zip(layer_ids, results):
+                results_per_layer[layer_id] = (report_items, trace_paths)
+                self.cache_layer(layer_id, report_items, trace_paths)
+                next_layer_id = self.record_ready_layers(next_layer_id, results_per_layer)
+
+        assert next_layer_id == self.num_layers, 'Some layers were not run'
+
+    #
+    def record_ready_layers(self, next_layer_id, results_per_layer):
+        """
+        Method to record the layers from next_layer_id onwards, until a layer which is not done yet.
+        Returns the id of that layer.
+        """
+        while next_layer_id < self.num_layers:
+            layer_id = next_layer_id
+            if layer_id in self.resumed_report_items:
+                self.resume_layer(layer_id)
+            elif layer_id in results_per_layer:
+                report_items, trace_paths = results_per_layer.pop(layer_id)
+                self.record_layer(layer_id, report_items, trace_paths)
+            elif not self.source_layer_ids[layer_id] == layer_id:
+                # The source layer comes first, so it is recorded already
+                self.reuse_source_layer(layer_id)
+            else:
+                break
 
-        compute_report_name = self.top_path + '/COMPUTE_REPORT.csv'
-        compute_report = open(compute_report_name, 'w')
-        header = ('LayerID, Total Cycles, Stall Cycles, Overall Util %, Mapping Efficiency %,'
-                  ' Compute Util %,\n')
-        compute_report.write(header)
+            if self.verbose:
+                print('\nLayer ' + str(layer_id) + ' done')
+                self.print_layer_report(self.layer_report_items_list[layer_id])
+            next_layer_id += 1
+
+        return next_layer_id
 
-        bandwidth_report_name = self.top_path + '/BANDWIDTH_REPORT.csv'
-        bandwidth_report = open(bandwidth_report_name, 'w')
+    #
+    def print_layer_report(self, report_items):
+        """
+        Method to print the compute and bandwidth stats of a layer which has finished running.
+        """
+        comp_items = report_items['compute']
+        comp_cycles = comp_items[0]
+        stall_cycles = comp_items[1]
+        util = comp_items[2]
+        mapping_eff = comp_items[3]
+        print('Compute cycles: ' + str(comp_cycles))
+        print('Stall cycles: ' + str(stall_cycles))
+        print('Overall utilization: ' + "{:.2f}".format(util) +'%')
+        print('Mapping efficiency: ' + "{:.2f}".format(mapping_eff) +'%')
+
+        avg_bw_items = report_items['bandwidth']
         if self.conf.sparsity_support is True:
-            header = ('LayerID, Avg IFMAP SRAM BW, Avg FILTER SRAM BW, Avg FILTER Metadata SRAM BW,'
-                      ' Avg OFMAP SRAM BW, ')
+            avg_ifmap_sram_bw = avg_bw_items[0]
+            avg_filter_sram_bw = avg_bw_items[1]
+            avg_filter_metadata_sram_bw = avg_bw_items[2]
+            avg_ofmap_sram_bw = avg_bw_items[3]
+            avg_dram_bw_items = avg_bw_items[4:]
         else:
-            header = 'LayerID, Avg IFMAP SRAM BW, Avg FILTER SRAM BW, Avg OFMAP SRAM BW, '
-        header += 'Avg IFMAP DRAM BW, Avg FILTER DRAM BW, Avg OFMAP DRAM BW,\n'
-        bandwidth_report.write(header)
-
-        detail_report_name = self.top_path + '/DETAILED_ACCESS_REPORT.csv'
-        detail_report = open(detail_report_name, 'w')
-        header = 'LayerID, '
-        header += 'SRAM IFMAP Start Cycle, SRAM IFMAP Stop Cycle, SRAM IFMAP Reads, '
-        header += 'SRAM Filter Start Cycle, SRAM Filter Stop Cycle, SRAM Filter Reads, '
-        header += 'SRAM OFMAP Start Cycle, SRAM OFMAP Stop Cycle, SRAM OFMAP Writes, '
-        header += 'DRAM IFMAP Start Cycle, DRAM IFMAP Stop Cycle, DRAM IFMAP Reads, '
-        header += 'DRAM Filter Start Cycle, DRAM Filter Stop Cycle, DRAM Filter Reads, '
-        header += 'DRAM OFMAP Start Cycle, DRAM OFMAP Stop Cycle, DRAM OFMAP Writes,\n'
-        detail_report.write(header)
+            avg_ifmap_sram_bw = avg_bw_items[0]
+            avg_filter_sram_bw = avg_bw_items[1]
+            avg_ofmap_sram_bw = avg_bw_items[2]
+            avg_dram_bw_items = avg_bw_items[3:]
+
+        print('Average IFMAP SRAM BW: ' + "{:.3f}".format(avg_ifmap_sram_bw) + \
+              ' words/cycle')
+        print('Average Filter SRAM BW: ' + "{:.3f}".format(avg_filter_sram_bw) + \
+              ' words/cycle')
+        if self.conf.sparsity_support is True:
+            print('Average Filter Metadata SRAM BW: ' + \
+                  "{:.3f}".format(avg_filter_metadata_sram_bw) + ' words/cycle')
+        print('Average OFMAP SRAM BW: ' + "{:.3f}".format(avg_ofmap_sram_bw) + \
+              ' words/cycle')
+
+        # DRAM bandwidths are not available for the layers estimated analytically
+        if len(avg_dram_bw_items) == 0:
+            return
+
+        avg_ifmap_dram_bw, avg_filter_dram_bw, avg_ofmap_dram_bw = avg_dram_bw_items
+        print('Average IFMAP DRAM BW: ' + "{:.3f}".format(avg_ifmap_dram_bw) + \
+              ' words/cycle')
+        print('Average Filter DRAM BW: ' + "{:.3f}".format(avg_filter_dram_bw) + \
+              ' words/cycle')
+        print('Average OFMAP DRAM BW: ' + "{:.3f}".format(avg_ofmap_dram_bw) + \
+              ' words/cycle')
 
+    #
+    def get_report_names(self):
+        """
+        Method to get the file names of the reports of this run. In the analytic run mode only
+        COMPUTE_REPORT.csv and the SRAM columns of BANDWIDTH_REPORT.csv are written, since the
+        other data is not estimated. PROFILE_REPORT.csv is written when profiling.
+        """
+        report_names = {'compute': 'COMPUTE_REPORT.csv',
+                        'bandwidth': 'BANDWIDTH_REPORT.csv'}
+        if self.profile:
+            report_names['profile'] = 'PROFILE_REPORT.csv'
+        if self.run_mode == 'analytic':
+            return report_names
+
+        report_names['detail'] = 'DETAILED_ACCESS_REPORT.csv'
         if self.conf.sparsity_support is True:
-            sparse_report_name = self.top_path + '/SPARSE_REPORT.csv'
-            sparse_report = open(sparse_report_name, 'w')
-            header = 'LayerID, '
-            header += 'Sparsity Representation, '
-            header += ('Original Filter Storage, New Storage (Filter+Metadata),'
-                       ' Filter Metadata Storage, ')
-            header += 'Avg FILTER Metadata SRAM BW, '
-            header += '\n'
-            sparse_report.write(header)
-
-        for lid in range(len(self.single_layer_sim_object_list)):
-            single_layer_obj = self.single_layer_sim_object_list[lid]
-            compute_report_items_this_layer = single_layer_obj.get_compute_report_items()
-            log = str(lid) +', '
-            log += ', '.join([str(x) for x in compute_report_items_this_layer])
-            log += ',\n'
-            compute_report.write(log)
-
-            bandwidth_report_items_this_layer = single_layer_obj.get_bandwidth_report_items()
-            log = str(lid) + ', '
-            log += ', '.join([str(x) for x in bandwidth_report_items_this_layer])
-            log += ',\n'
-            bandwidth_report.write(log)
-
-            detail_report_items_this_layer = single_layer_obj.get_detail_report_items()
-            log = str(lid) + ', '
-            log += ', '.join([str(x) for x in detail_report_items_this_layer])
-            log += ',\n'
-            detail_report.write(log)
+            report_names['sparse'] = 'SPARSE_REPORT.csv'
 
+        return report_names
+
+    #
+    def get_report_columns(self, report_kind):
+        """
+        Method to get the names of the columns of a report, other than the layer id.
+        """
+        columns = []
+        if report_kind == 'compute':
+            columns = ['Total Cycles', 'Stall Cycles', 'Overall Util %', 'Mapping Efficiency %',
+                       'Compute Util %']
+        elif report_kind == 'bandwidth':
             if self.conf.sparsity_support is True:
-                sparse_report_items_this_layer = single_layer_obj.get_sparse_report_items()
-                log = str(lid) + ', ' + self.conf.sparsity_representation + ', '
-                log += ', '.join([str(x) for x in sparse_report_items_this_layer])
-                log += ',\n'
-                sparse_report.write(log)
-
-        compute_report.close()
-        bandwidth_report.close()
-        detail_report.close()
-        if self.conf.sparsity_support is True:
-            sparse_report.close()
+                columns = ['Avg IFMAP SRAM BW', 'Avg FILTER SRAM BW',
+                           'Avg FILTER Metadata SRAM BW', 'Avg OFMAP SRAM BW']
+            else:
+                columns = ['Avg IFMAP SRAM BW', 'Avg FILTER SRAM BW', 'Avg OFMAP SRAM BW']
+            if not self.run_mode == 'analytic':
+                columns += ['Avg IFMAP DRAM BW', 'Avg FILTER DRAM BW', 'Avg OFMAP DRAM BW']
+        elif report_kind == 'detail':
+            for memory in ['SRAM', 'DRAM']:
+                for operand, access in [('IFMAP', 'Reads'), ('Filter', 'Reads'),
+                                        ('OFMAP', 'Writes')]:
+                    columns += [memory + ' ' + operand + ' Start Cycle',
+                                memory + ' ' + operand + ' Stop Cycle',
+                                memory + ' ' + operand + ' ' + access]
+        elif report_kind == 'sparse':
+            columns = ['Sparsity Representation', 'Original Filter Storage',
+                       'New Storage (Filter+Metadata)', 'Filter Metadata Storage',
+                       'Avg FILTER Metadata SRAM BW']
+        elif report_kind == 'profile':
+            for phase in PROFILE_PHASES:
+                columns += [phase + ' Time (s)', phase + ' Peak Alloc (B)']
+            columns += ['Total Time (s)']
+        return columns
+
+    #
+    def get_report_header(self, report_kind):
+        """
+        Method to get the header line of a report.
+        """
+        header = ', '.join(['LayerID'] + self.get_report_columns(report_kind))
+        if report_kind == 'sparse':
+            header += ', \n'
+        else:
+            header += ',\n'
+        return header
+
+    #
+    def get_report_row(self, layer_id, report_items, report_kind):
+        """
+        Method to get the row of a layer in a report.
+        """
+        report_items_this_layer = report_items[report_kind]
+        log = str(layer_id) + ', '
+        if report_kind == 'sparse':
+            log += self.conf.sparsity_representation + ', '
+        if report_kind == 'bandwidth' and self.run_mode == 'analytic':
+            num_sram_items = 4 if self.conf.sparsity_support is True else 3
+            report_items_this_layer = report_items_this_layer[:num_sram_items]
+        log += ', '.join([str(x) for x in report_items_this_layer])
+        log += ',\n'
+        return log
+
+    #
+    def open_reports(self, mode='w'):
+        """
+        Method to open the report files of this run. The headers are written unless the reports
+        are opened to append to the ones of a previous run.
+        """
+        self.report_files = {}
+        for report_kind, report_name in self.get_report_names().items():
+            report_file = open(self.top_path + '/' + report_name, mode)
+            if mode == 'w':
+                report_file.write(self.get_report_header(report_kind))
+                report_file.flush()
+            self.report_files[report_kind] = report_file
+
+    #
+    def write_layer_reports(self, layer_id, report_items):
+        """
+        Method to write the rows of a layer to the open reports and flush them to the disk, so that
+        they are kept if the run is interrupted.
+        """
+        for report_kind, report_file in self.report_files.items():
+            report_file.write(self.get_report_row(layer_id, report_items, report_kind))
+            report_file.flush()
+            os.fsync(report_file.fileno())
+
+    #
+    def close_reports(self):
+        """
+        Method to close the open report files.
+        """
+        for report_file in self.report_files.values():
+            report_file.close()
+        self.report_files = {}
+
+    #
+    def get_run_hash(self):
+        """
+        Method to get the hash of the parameters which affect the results of this run, which are the
+        config parameters, the layers of the topology, the trace saving and the profiling, which
+        changes the reports. A run can only be resumed with the same hash.
+        """
+        hash_items = list(self.conf.get_timing_conf_as_list())
+        hash_items += [str(self.save_trace), str(self.profile)]
+        for layer_id in range(self.num_layers):
+            hash_items += [str(x) for x in self.topo.get_layer_params(layer_id)]
+
+        return hashlib.sha256('|'.join(hash_items).encode()).hexdigest()
+
+    #
+    def start_reports(self):
+        """
+        Method to open the reports and the manifest before the layers are run. When resuming, the
+        layers completed by the previous run are loaded and the reports are appended to.
+        """
+        self.completed_layer_ids = []
+        self.resumed_report_items = {}
+        if not self.write_reports:
+            return
+
+        self.manifest_path = self.top_path + '/RUN_MANIFEST.json'
+        self.run_hash = self.get_run_hash()
+
+        if self.resume:
+            self.load_completed_layers()
+
+        if len(self.resumed_report_items) > 0:
+            self.open_reports(mode='a')
+            if self.verbose:
+                print('Resuming the run, ' + str(len(self.resumed_report_items))
+                      + ' layers out of ' + str(self.num_layers) + ' are already done')
+        else:
+            self.open_reports(mode='w')
+
+        self.write_manifest()
+
+    #
+    def write_manifest(self):
+        """
+        Method to write the manifest of the run, with the run hash and the ids of the completed
+        layers. The manifest is replaced atomically so that it is never partially written.
+        """
+        manifest = {'config_hash': self.run_hash,
+                    'completed_layers': self.completed_layer_ids}
+
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    #
+    def load_completed_layers(self):
+        """
+        Method to load the report items of the layers completed by a previous run from its reports.
+        The rows of the layers which are not in the manifest are dropped from the reports. If the
+        previous run cannot be resumed, the run starts from the first layer.
+        """
+        me = 'simulator.load_completed_layers(): '
+
+        if not os.path.isfile(self.manifest_path):
+            if self.verbose:
+                print('No previous run found, starting from the first layer')
+            return
+
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            print('WARNING: ' + me + 'The manifest is not readable, starting from the first layer')
+            return
+
+        if not manifest.get('config_hash') == self.run_hash:
+            print('WARNING: ' + me + 'The config or the topology changed since the previous run, '
+                  'starting from the first layer')
+            return
+
+        completed_layer_ids = set(manifest.get('completed_layers', []))
+
+        rows_per_report = {}
+        for report_kind, report_name in self.get_report_names().items():
+            report_path = self.top_path + '/' + report_name
+            if not os.path.isfile(report_path):
+                print('WARNING: ' + me + report_name + ' is missing, starting from the first layer')
+                return
+
+            rows = {}
+            with open(report_path, 'r') as f:
+                for line in f.readlines()[1:]:
+                    items = [x.strip() for x in line.strip().rstrip(',').split(',')]
+                    if not line.endswith('\n') or not items[0].isdigit():
+                        continue
+                    layer_id = int(items[0])
+                    if layer_id in completed_layer_ids and layer_id not in rows:
+                        rows[layer_id] = items[1:]
+            rows_per_report[report_kind] = rows
+
+        # Only the layers with rows in all the reports are kept
+        for rows in rows_per_report.values():
+            completed_layer_ids &= set(rows.keys())
+
+        resumed_report_items = {}
+        for layer_id in sorted(completed_layer_ids):
+            report_items = {}
+            for report_kind, rows in rows_per_report.items():
+                items = rows[layer_id]
+                if report_kind == 'sparse':
+                    items = items[1:]
+                report_items[report_kind] = [self.parse_report_value(x) for x in items]
+            resumed_report_items[layer_id] = report_items
+
+        # Rewrite the reports with only the rows of the completed layers
+        for report_kind, report_name in self.get_report_names().items():
+            with open(self.top_path + '/' + report_name, 'w') as f:
+                f.write(self.get_report_header(report_kind))
+                for layer_id in sorted(resumed_report_items):
+                    f.write(self.get_report_row(layer_id, resumed_report_items[layer_id],
+                                                report_kind))
+
+        self.resumed_report_items = resumed_report_items
+
+    #
+    @staticmethod
+    def parse_report_value(value_string):
+        """
+        Method to parse a value read back from a report, such that it is written out the same way.
+        """
+        try:
+            return int(value_string)
+        except ValueError:
+            pass
+        try:
+            return float(value_string)
+        except ValueError:
+            return value_string
+
+    #
+    def generate_reports(self):
+        """
+        Method to generate the report files for scalesim run if the runs are already completed. For
+        each layer, this method collects the report data gathered from the layer runs and then
+        prints them out into COMPUTE_REPORT.csv, BANDWIDTH_REPORT.csv, DETAILED_ACCESS_REPORT.csv
+        and SPARSE_REPORT.csv files. The reports are already written while running, so this is only
+        needed to write them again.
+        """
+        assert self.all_layer_run_done, 'Layer runs are not done yet'
+
+        self.open_reports(mode='w')
+        for lid in range(len(self.layer_report_items_list)):
+            self.write_layer_reports(lid, self.layer_report_items_list[lid])
+        self.close_reports()
 
     #
     def get_total_cycles(self):
@@ -242,8 +878,8 @@ class simulator:
         assert self.all_layer_run_done, 'Layer runs are not done yet'
 
         total_cycles = 0
-        for layer_obj in self.single_layer_sim_object_list:
-            cycles_this_layer = int(layer_obj.get_compute_report_items[0])
+        for report_items in self.layer_report_items_list:
+            cycles_this_layer = int(report_items['compute'][0])
             total_cycles += cycles_this_layer
 
         return total_cycles
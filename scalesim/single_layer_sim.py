@@ -4,6 +4,8 @@ the model and generates the data that goes inside the reports.
 """
 
 import os
+import time
+import tracemalloc
 from scalesim.compute.compression import compression as cp
 
 from scalesim.scale_config import scale_config as cfg
@@ -14,6 +16,14 @@ from scalesim.compute.systolic_compute_ws import systolic_compute_ws
 from scalesim.compute.systolic_compute_is import systolic_compute_is
 from scalesim.memory.double_buffered_scratchpad_mem import double_buffered_scratchpad as mem_dbsp
 
+
+# Phases of a layer run which are timed when profiling, in the order of the profile report. The
+# demand descriptors only describe the demand matrices, whose lines are made one fold at a time
+# during the memory service and timed as the demand generation.
+PROFILE_PHASES = ['Operand Matrix', 'Prefetch Matrix', 'Demand Descriptors', 'Demand Generation',
+                  'Memory Service', 'Start Stop Scan', 'Report Data', 'Trace Writing']
+
+
 class single_layer_sim:
     """
     Class which runs the simulation for a single layer and generates report data
@@ -34,6 +44,18 @@ class single_layer_sim:
 
         self.verbose = True
 
+        # Directory where the traces are spilled as they grow, if any
+        self.spill_dir = None
+
+        # Wall time and peak allocated bytes of each phase, recorded when profiling
+        self.profile = False
+        self.profile_items = {}
+        self.profile_phase_start = 0
+        self.profile_nested_start = 0
+        self.profile_nested_base_bytes = 0
+        self.profile_nested_time = 0
+        self.profile_outer_peak_bytes = 0
+
         self.sparsity_ratio_N = 1
         self.sparsity_ratio_M = 1
 
@@ -92,14 +114,16 @@ class single_layer_sim:
         self.memory_system_ready_flag = False
         self.runs_ready = False
         self.report_items_ready = False
+        self.memory_released = False
 
     #
     def set_params(self,
                    layer_id=0,
                    config_obj=cfg(), topology_obj=topo(),
-                   verbose=True):
+                   verbose=True, spill_dir=None):
         """
-        Method to set the run parameters for housekeeping.
+        Method to set the run parameters for housekeeping. If spill_dir is provided, the traces
+        are spilled to files in this directory as they grow.
         """
 
         self.layer_id = layer_id
@@ -122,6 +146,8 @@ class single_layer_sim:
         arr_dims =self.config.get_array_dims()
         self.num_mac_unit = arr_dims[0] * arr_dims[1]
         self.verbose=verbose
+        self.spill_dir = spill_dir
+        self.profile = self.config.get_profile()
 
         self.sparsity_ratio_N, self.sparsity_ratio_M = \
             self.topo.get_layer_sparsity_ratio(self.layer_id)
@@ -137,6 +163,15 @@ class single_layer_sim:
         self.memory_system = mem_sys_obj
         self.memory_system_ready_flag = True
 
+    # The operand matrices only depend on the layer, the offsets and the sparsity settings
+    # So they can be shared by the simulations of a layer on different architectures
+    def set_operand_matrix(self, op_mat_obj=opmat()):
+        """
+        Method to explicitely set the operand matrix object of this layer. It should be called
+        after set_params().
+        """
+        self.op_mat_obj = op_mat_obj
+
     #
     def calculate_filter_metadata_storage(self, filter_op_mat):
         """
@@ -165,18 +200,113 @@ class single_layer_sim:
             self.metadata_reads += metadata_storage
     # END of metadata calculation
 
+    #
+    def start_profile_phase(self):
+        """
+        Method to start recording the wall time and the allocated memory of a phase when profiling.
+        The allocations are traced with tracemalloc, which is started if it is not running.
+        """
+        if not self.profile:
+            return
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.clear_traces()
+        self.profile_nested_time = 0
+        self.profile_outer_peak_bytes = 0
+        self.profile_phase_start = time.perf_counter()
+
+    #
+    def end_profile_phase(self, phase):
+        """
+        Method to record the wall time and the peak bytes allocated since the start of a phase when
+        profiling. The time of the phases nested in it is not included.
+        """
+        if not self.profile:
+            return
+
+        wall_time = time.perf_counter() - self.profile_phase_start - self.profile_nested_time
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        self.record_profile_phase(phase, wall_time, max(self.profile_outer_peak_bytes, peak_bytes))
+
+    #
+    def start_nested_profile_phase(self):
+        """
+        Method to start recording a phase nested in the running phase when profiling, like the
+        generation of a demand fold while the memory service consumes the folds.
+        """
+        if not self.profile:
+            return
+
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        self.profile_outer_peak_bytes = max(self.profile_outer_peak_bytes, peak_bytes)
+        self.profile_nested_base_bytes = current_bytes
+        tracemalloc.reset_peak()
+        self.profile_nested_start = time.perf_counter()
+
+    #
+    def end_nested_profile_phase(self, phase):
+        """
+        Method to record the wall time of a nested phase and the peak bytes it allocated on top of
+        the ones held by the running phase, and to leave them out of the running phase.
+        """
+        if not self.profile:
+            return
+
+        wall_time = time.perf_counter() - self.profile_nested_start
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        self.profile_nested_time += wall_time
+        self.record_profile_phase(phase, wall_time, peak_bytes - self.profile_nested_base_bytes)
+
+    #
+    def record_profile_phase(self, phase, wall_time, peak_bytes):
+        """
+        Method to add the wall time of a phase to its total, and to keep its largest peak bytes.
+        """
+        prev_time, prev_peak_bytes = self.profile_items.get(phase, [0, 0])
+        self.profile_items[phase] = [prev_time + wall_time, max(prev_peak_bytes, peak_bytes)]
+
+    #
+    def get_profiled_demand_folds(self, demand_folds):
+        """
+        Method to get the generator of the demand folds to be serviced. When profiling, the
+        generation of each fold is recorded as the 'Demand Generation' phase.
+        """
+        if not self.profile:
+            return demand_folds
+
+        return self.iter_profiled_demand_folds(demand_folds)
+
+    #
+    def iter_profiled_demand_folds(self, demand_folds):
+        """
+        Method to generate the demand folds, recording the generation of each one as a phase nested
+        in the memory service.
+        """
+        fold_iter = iter(demand_folds)
+        while True:
+            self.start_nested_profile_phase()
+            fold = next(fold_iter, None)
+            self.end_nested_profile_phase('Demand Generation')
+            if fold is None:
+                return
+            yield fold
+
     #
     def run(self):
         """
         Method to run scalesim simulation for a single layer. This method first runs the compute
         part to generate operand, prefetch and demand matrices in order. After that, it runs the
-        memory simulation using the demand matrices.
+        memory simulation on the demand matrices, generated and serviced one fold at a time.
         """
         assert self.params_set_flag, 'Parameters are not set. Run set_params()'
 
         # 1. Setup and the get the demand from compute system
 
         # 1.1 Get the operand matrices
+        self.start_profile_phase()
         _, ifmap_op_mat = self.op_mat_obj.get_ifmap_matrix()
         _, filter_op_mat = self.op_mat_obj.get_filter_matrix()
         _, ofmap_op_mat = self.op_mat_obj.get_ofmap_matrix()
@@ -185,16 +315,18 @@ class single_layer_sim:
         self.calculate_filter_metadata_storage(filter_op_mat)
         self.num_compute = self.topo.get_layer_num_ofmap_px(self.layer_id) \
                            * self.topo.get_layer_window_size(self.layer_id)
+        self.end_profile_phase('Operand Matrix')
 
         # 1.3 Get the prefetch matrices for both operands
         if self.dataflow == 'ws':
+            ifmap_op_mat_original = self.op_mat_obj.get_ifmap_matrix_original()
             self.compute_system.set_params(config_obj=self.config,
                                            ifmap_op_mat=ifmap_op_mat,
                                            filter_op_mat=filter_op_mat,
                                            ofmap_op_mat=ofmap_op_mat,
                                            sparsity_ratio_N=self.sparsity_ratio_N,
                                            sparsity_ratio_M=self.sparsity_ratio_M,
-                                           ifmap_op_mat_original=self.op_mat_obj.ifmap_addr_matrix_original,
+                                           ifmap_op_mat_original=ifmap_op_mat_original,
                                            sparsity_filter_array=self.op_mat_obj.sparse_filter_array)
         else:
             self.compute_system.set_params(config_obj=self.config,
@@ -203,14 +335,20 @@ class single_layer_sim:
                                            ofmap_op_mat=ofmap_op_mat)
 
         # 1.4 Get the no compute demand matrices from for 2 operands and the output
+        self.start_profile_phase()
         ifmap_prefetch_mat, filter_prefetch_mat = self.compute_system.get_prefetch_matrices()
+        self.end_profile_phase('Prefetch Matrix')
+
+        self.start_profile_phase()
         ifmap_demand_mat, filter_demand_mat, ofmap_demand_mat = \
                                                     self.compute_system.get_demand_matrices()
+        self.end_profile_phase('Demand Descriptors')
 
         # 2. Setup the memory system and run the demands through it to find any memory bottleneck
         #    and generate traces
 
         # 2.1 Setup the memory system if it was not setup externally
+        self.start_profile_phase()
         if not self.memory_system_ready_flag:
             word_size = 1           # bytes, this can be incorporated in the config file
             active_buf_frac = 0.5   # This can be incorporated in the config as well
@@ -249,7 +387,8 @@ class single_layer_sim:
                     filter_backing_buf_bw=filter_backing_bw,
                     ofmap_backing_buf_bw=ofmap_backing_bw,
                     verbose=self.verbose,
-                    estimate_bandwidth_mode=estimate_bandwidth_mode
+                    estimate_bandwidth_mode=estimate_bandwidth_mode,
+                    spill_dir=self.spill_dir
             )
 
         # 2.2 Install the prefetch matrices to the read buffers to finish setup
@@ -258,18 +397,30 @@ class single_layer_sim:
                                                         ifmap_prefetch_mat=ifmap_prefetch_mat,
                                                         filter_prefetch_mat=filter_prefetch_mat
                                                              )
-        self.memory_system.service_memory_requests(ifmap_demand_mat,
-                                                    filter_demand_mat,
-                                                    ofmap_demand_mat)
+        # 2.3 Stream the demand to the memory system one fold at a time
+        demand_folds = self.get_profiled_demand_folds(self.compute_system.get_demand_folds())
+        self.memory_system.service_memory_folds(demand_folds,
+                                                ifmap_demand_mat,
+                                                filter_demand_mat,
+                                                ofmap_demand_mat,
+                                                update_activity=False)
+        self.end_profile_phase('Memory Service')
+
+        # 2.4 Scan the SRAM traces for their first and last active cycles
+        self.start_profile_phase()
+        self.memory_system.update_sram_activity()
+        self.end_profile_phase('Start Stop Scan')
 
         self.runs_ready = True
 
     # This will write the traces
     def save_traces(self, top_path):
         """
-        Method to save SRAM and DRAM traces for ifmap, filter and ofmap matrices.
+        Method to save SRAM and DRAM traces for ifmap, filter and ofmap matrices. Returns the paths
+        of the trace files written.
         """
         assert self.params_set_flag, 'Parameters are not set'
+        assert not self.memory_released, 'The traces were released already'
 
         dir_name = top_path + '/layer' + str(self.layer_id)
         if not os.path.isdir(dir_name):
@@ -284,12 +435,18 @@ class single_layer_sim:
         filter_dram_filename = dir_name + '/FILTER_DRAM_TRACE.csv'
         ofmap_dram_filename = dir_name +  '/OFMAP_DRAM_TRACE.csv'
 
+        self.start_profile_phase()
         self.memory_system.print_ifmap_sram_trace(ifmap_sram_filename)
         self.memory_system.print_ifmap_dram_trace(ifmap_dram_filename)
         self.memory_system.print_filter_sram_trace(filter_sram_filename)
         self.memory_system.print_filter_dram_trace(filter_dram_filename)
         self.memory_system.print_ofmap_sram_trace(ofmap_sram_filename)
         self.memory_system.print_ofmap_dram_trace(ofmap_dram_filename)
+        self.end_profile_phase('Trace Writing')
+
+        trace_paths = [ifmap_sram_filename, filter_sram_filename, ofmap_sram_filename,
+                       ifmap_dram_filename, filter_dram_filename, ofmap_dram_filename]
+        return trace_paths
 
     #
     def calc_report_data(self):
@@ -299,6 +456,8 @@ class single_layer_sim:
         """
         assert self.runs_ready, 'Runs are not done yet'
 
+        self.start_profile_phase()
+
         # Compute report
         self.total_cycles = self.memory_system.get_total_compute_cycles()
         self.stall_cycles = self.memory_system.get_stall_cycles()
@@ -344,8 +503,27 @@ class single_layer_sim:
         self.avg_ofmap_dram_bw = self.ofmap_dram_writes / \
                                 (self.ofmap_dram_stop_cycle - self.ofmap_dram_start_cycle + 1)
 
+        self.end_profile_phase('Report Data')
         self.report_items_ready = True
 
+    #
+    def release_memory(self):
+        """
+        Method to release the operand, demand and trace matrices of this layer once the report data
+        is calculated and the traces are saved, by dropping the objects which hold them. Only the
+        report data is kept.
+        """
+        assert self.runs_ready, 'Runs are not done yet'
+
+        if not self.report_items_ready:
+            self.calc_report_data()
+
+        self.op_mat_obj = None
+        self.compute_system = None
+        self.memory_system = None
+        self.memory_system_ready_flag = False
+        self.memory_released = True
+
     #
     def get_layer_id(self):
         """
@@ -418,3 +596,34 @@ class single_layer_sim:
         items += [self.avg_filter_metadata_sram_bw]
 
         return items
+
+    #
+    def get_profile_report_items(self):
+        """
+        Method to get the wall time in seconds and the peak allocated bytes of each phase of this
+        layer, followed by the total wall time. The phases which were not run are reported as 0.
+        """
+        items = []
+        total_time = 0
+        for phase in PROFILE_PHASES:
+            wall_time, peak_bytes = self.profile_items.get(phase, [0, 0])
+            items += [wall_time, peak_bytes]
+            total_time += wall_time
+        items += [total_time]
+
+        return items
+
+    #
+    def get_report_items(self):
+        """
+        Method to get the data for all the reports of this layer as a dictionary. This is light
+        enough to be sent across processes, unlike the simulation objects. The profile data is only
+        included when profiling, and should be collected after the traces are saved.
+        """
+        items = {'compute': self.get_compute_report_items(),
+                 'bandwidth': self.get_bandwidth_report_items(),
+                 'detail': self.get_detail_report_items(),
+                 'sparse': self.get_sparse_report_items()}
+        if self.profile:
+            items['profile'] = self.get_profile_report_items()
+        return items
@@ -0,0 +1,101 @@
+"""
+This file is the script for sweeping SCALE-Sim over a grid of design points with the given topology
+and base configuration files. It handles argument parsing and execution.
+"""
+
+import argparse
+
+from scalesim.scale_config import scale_config
+from scalesim.topology_utils import topologies
+from scalesim.design_sweep import design_sweep, parse_sweep_values
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-t', metavar='Topology file', type=str,
+                        default="../topologies/conv_nets/test.csv",
+                        help="Path to the topology file"
+                        )
+    parser.add_argument('-c', metavar='Config file', type=str,
+                        default="../configs/scale.cfg",
+                        help="Path to the base config file"
+                        )
+    parser.add_argument('-p', metavar='log dir', type=str,
+                        default="../test_runs",
+                        help="Path to log dir"
+                        )
+    parser.add_argument('-i', metavar='input type', type=str,
+                        default="conv",
+                        help="Type of input topology, gemm: MNK, conv: conv"
+                        )
+    parser.add_argument('-w', metavar='num workers', type=int,
+                        default=None,
+                        help="Number of worker processes to run the jobs, "
+                             "0 uses all the cores (overrides the config file)"
+                        )
+    parser.add_argument('-m', metavar='run mode', type=str,
+                        default=None, choices=['full', 'analytic'],
+                        help="full: simulate every layer, analytic: estimate the stall free layers "
+                             "in closed form (overrides the config file)"
+                        )
+    parser.add_argument('--array_height', metavar='values', type=str, default=None,
+                        help="Array heights, as a list '8,16,32' or a range 'start:stop:step'"
+                        )
+    parser.add_argument('--array_width', metavar='values', type=str, default=None,
+                        help="Array widths, as a list or a range"
+                        )
+    parser.add_argument('--ifmap_sram_kb', metavar='values', type=str, default=None,
+                        help="IFMAP SRAM sizes in kB, as a list or a range"
+                        )
+    parser.add_argument('--filter_sram_kb', metavar='values', type=str, default=None,
+                        help="Filter SRAM sizes in kB, as a list or a range"
+                        )
+    parser.add_argument('--ofmap_sram_kb', metavar='values', type=str, default=None,
+                        help="OFMAP SRAM sizes in kB, as a list or a range"
+                        )
+    parser.add_argument('--dataflow', metavar='values', type=str, default=None,
+                        help="Dataflows, as a list of os, ws and is"
+                        )
+    parser.add_argument('--bandwidth', metavar='values', type=str, default=None,
+                        help="DRAM bandwidths in words/cycle, as a list or a range. "
+                             "The design points run in USER bandwidth mode when provided"
+                        )
+
+    args = parser.parse_args()
+
+    GEMM_INPUT = False
+    if args.i == 'gemm':
+        GEMM_INPUT = True
+
+    config = scale_config()
+    config.read_conf_file(args.c)
+    config.set_topology_file(args.t)
+    if args.m is not None:
+        config.set_run_mode(args.m)
+
+    topo = topologies()
+    topo.load_arrays(topofile=args.t, mnk_inputs=GEMM_INPUT,
+                     batch_size=config.get_batch_size())
+
+    def get_values(values_string, value_type=int):
+        """
+        Function to parse the values of a knob if they were provided.
+        """
+        if values_string is None:
+            return None
+        return parse_sweep_values(values_string, value_type)
+
+    sweep = design_sweep()
+    sweep.set_params(config_obj=config,
+                     topo_obj=topo,
+                     array_heights=get_values(args.array_height),
+                     array_widths=get_values(args.array_width),
+                     ifmap_sram_sizes_kb=get_values(args.ifmap_sram_kb),
+                     filter_sram_sizes_kb=get_values(args.filter_sram_kb),
+                     ofmap_sram_sizes_kb=get_values(args.ofmap_sram_kb),
+                     dataflows=get_values(args.dataflow, str),
+                     bandwidths=get_values(args.bandwidth),
+                     top_path=args.p,
+                     verbosity=True,
+                     num_workers=args.w
+                     )
+    sweep.run()
@@ -59,21 +59,54 @@ class topologies(object):
         self.topo_load_flag = True
 
     #
-    def load_arrays(self, topofile='', mnk_inputs=False):
+    def load_arrays(self, topofile='', mnk_inputs=False, batch_size=1):
         """
         Method to read the topology file and collect names and dimensions of all the workload
-        layers.
+        layers. The batch size is used for the layers which do not have a batch size column.
         """
         if mnk_inputs:
-            self.load_arrays_gemm(topofile)
+            self.load_arrays_gemm(topofile, batch_size)
         else:
-            self.load_arrays_conv(topofile)
+            self.load_arrays_conv(topofile, batch_size)
 
     #
-    def load_arrays_gemm(self, topofile=''):
+    @staticmethod
+    def parse_optional_columns(columns, batch_size=1, layer_name=''):
+        """
+        Method to parse the optional columns of a layer, which are the sparsity ratio in the N:M
+        format followed by the batch size. Either can be left empty to use its default. Returns
+        the sparsity ratio as a list [N, M] and the batch size, with the defaults for the missing
+        columns. Any other non empty column is an error.
+        """
+        columns = [str(x).strip() for x in columns]
+        prefix = 'Layer ' + str(layer_name).strip() + ': '
+
+        sparsity_ratio = ['1', '1']
+        if len(columns) > 0 and not columns[0] == '':
+            assert ':' in columns[0], \
+                prefix + 'The column after the layer dimensions should be a sparsity ratio in ' \
+                + 'the N:M format, found \'' + columns[0] + '\''
+            sparsity_ratio = columns[0].split(':')
+
+        layer_batch_size = batch_size
+        if len(columns) > 1 and not columns[1] == '':
+            assert columns[1].isdigit(), \
+                prefix + 'The column after the sparsity ratio should be an integer batch size, ' \
+                + 'found \'' + columns[1] + '\''
+            layer_batch_size = int(columns[1])
+
+        extra_columns = [x for x in columns[2:] if not x == '']
+        assert len(extra_columns) == 0, \
+            prefix + 'Unexpected columns after the batch size: ' + ', '.join(extra_columns)
+
+        assert layer_batch_size > 0, prefix + 'The batch size should be positive'
+        return sparsity_ratio, layer_batch_size
+
+    #
+    def load_arrays_gemm(self, topofile='', batch_size=1):
         """
         Method to read the GEMM topology file and collect names and dimensions of all the workload
-        layers.
+        layers. The batch size is used for the layers which do not have a batch size column.
         """
 
         self.topo_file_name = topofile.split('/')[-1]
@@ -95,32 +128,16 @@ class topologies(object):
                 continue
             else:
                 elems = row.split(',')[:-1]
-                assert len(elems) > 3, 'There should be at least 4 entries per row'
-                layer_name = elems[0].strip()
-                m = elems[1].strip()
-                n = elems[2].strip()
-                k = elems[3].strip()
-                if len(elems) < 5:
-                    # If sparsity ratio is missing in the topology file, consider the default ratio
-                    elems.append("1:1")
-                sparsity_ratio = elems[4].strip().split(':')
-
-                # Entries: layer name, Ifmap h, ifmap w, filter h, filter w, num_ch, num_filt,
-                #          stride h, stride w, N in N:M, M in N:M
-                entries = [layer_name, m, k, 1, k, 1, n, 1, 1, sparsity_ratio[0], sparsity_ratio[1]]
-                # entries are later iterated from index 1. Index 0 is used to store layer name in
-                # convolution mode. So, to rectify assignment of M, N and K in GEMM mode, layer name
-                # has been added at index 0 of entries.
-                self.append_topo_arrays(layer_name=layer_name, elems=entries)
+                self.append_gemm_layer(elems, batch_size)
 
         self.num_layers = len(self.topo_arrays)
         self.topo_load_flag = True
 
     # Load the topology data from the file
-    def load_arrays_conv(self, topofile=''):
+    def load_arrays_conv(self, topofile='', batch_size=1):
         """
         Method to read the CONV topology file and collect names and dimensions of all the workload
-        layers.
+        layers. The batch size is used for the layers which do not have a batch size column.
         """
         first = True
         self.topo_file_name = topofile.split('/')[-1]
@@ -137,27 +154,99 @@ class topologies(object):
                 first = False
             else:
                 elems = row.split(',')[:-1]
+                self.append_conv_layer(elems, batch_size)
+
+        self.num_layers = len(self.topo_arrays)
+        self.topo_load_flag = True
+
+    #
+    def append_gemm_layer(self, elems, batch_size=1):
+        """
+        Method to add a GEMM layer from the columns of its row in the topology file. The batch size
+        is used if the layer does not have a batch size column.
+        """
+        assert len(elems) > 3, 'There should be at least 4 entries per row'
+        layer_name = str(elems[0]).strip()
+        m = str(elems[1]).strip()
+        n = str(elems[2]).strip()
+        k = str(elems[3]).strip()
+        # If sparsity ratio or batch size are missing in the topology file, consider the defaults
+        sparsity_ratio, layer_batch_size = self.parse_optional_columns(elems[4:], batch_size,
+                                                                    layer_name)
+
+        # Entries: layer name, Ifmap h, ifmap w, filter h, filter w, num_ch, num_filt,
+        #          stride h, stride w, N in N:M, M in N:M, batch size
+        entries = [layer_name, m, k, 1, k, 1, n, 1, 1, sparsity_ratio[0], sparsity_ratio[1],
+                   layer_batch_size]
+        # entries are later iterated from index 1. Index 0 is used to store layer name in
+        # convolution mode. So, to rectify assignment of M, N and K in GEMM mode, layer name
+        # has been added at index 0 of entries.
+        self.append_topo_arrays(layer_name=layer_name, elems=entries)
+
+    #
+    def append_conv_layer(self, elems, batch_size=1):
+        """
+        Method to add a convolution layer from the columns of its row in the topology file. Depth
+        wise layers are split into one layer per channel. The batch size is used if the layer does
+        not have a batch size column.
+        """
+        elems = [str(x) for x in elems]
+
+        # Add the same stride in the col direction automatically
+        elems = elems[0:8] + [elems[7]] + elems[8:]
 
-                # Add the same stride in the col direction automatically
-                elems = elems[0:8] + [elems[7]] + elems[8:]
-
-                # Parsing sparsity ratio
-                if len(elems) < 10:
-                    # If sparsity ratio is missing in the topology file, consider the default ratio
-                    elems.append("1:1")
-                sparsity_ratio = elems.pop().strip().split(':')
-                elems.append(sparsity_ratio[0])
-                elems.append(sparsity_ratio[1])
-
-                # depth-wise convolution
-                if 'DP' in elems[0].strip():
-                    for dp_layer in range(int(elems[5].strip())):
-                        layer_name = elems[0].strip() + "Channel_" + str(dp_layer)
-                        elems[5] = str(1)
-                        self.append_topo_arrays(layer_name, elems)
-                else:
-                    layer_name = elems[0].strip()
-                    self.append_topo_arrays(layer_name, elems)
+        # Parsing sparsity ratio and batch size
+        # If they are missing in the topology file, consider the defaults
+        sparsity_ratio, layer_batch_size = self.parse_optional_columns(elems[9:], batch_size,
+                                                                    elems[0])
+        elems = elems[:9] + sparsity_ratio + [layer_batch_size]
+
+        # depth-wise convolution
+        if 'DP' in elems[0].strip():
+            for dp_layer in range(int(elems[5].strip())):
+                layer_name = elems[0].strip() + "Channel_" + str(dp_layer)
+                elems[5] = str(1)
+                self.append_topo_arrays(layer_name, elems)
+        else:
+            layer_name = elems[0].strip()
+            self.append_topo_arrays(layer_name, elems)
+
+    #
+    def load_layer_dicts(self, layer_dicts, batch_size=1):
+        """
+        Method to collect the names and dimensions of the workload layers from a list of
+        dictionaries instead of a topology file. A convolution layer has the keys name,
+        ifmap_height, ifmap_width, filter_height, filter_width, channels, num_filters and strides,
+        while a GEMM layer has the keys name, M, N and K. Both can have the optional keys sparsity,
+        as an 'N:M' string, and batch_size.
+        """
+        self.topo_file_name = ''
+        self.current_topo_name = ''
+        self.topo_arrays = []
+        self.spatio_temp_dim_arrays = []
+        self.layers_calculated_hyperparams = []
+        self.topo_calc_hyper_param_flag = False
+        self.topo_calc_spatiotemp_params_flag = False
+
+        conv_keys = ['name', 'ifmap_height', 'ifmap_width', 'filter_height', 'filter_width',
+                     'channels', 'num_filters', 'strides']
+        gemm_keys = ['name', 'M', 'N', 'K']
+        for layer_id, layer_dict in enumerate(layer_dicts):
+            optional_columns = [str(layer_dict.get('sparsity', '')),
+                                str(layer_dict.get('batch_size', ''))]
+            if 'M' in layer_dict:
+                keys = gemm_keys
+            else:
+                keys = conv_keys
+            missing_keys = [x for x in keys if x not in layer_dict]
+            assert len(missing_keys) == 0, \
+                'Layer ' + str(layer_id) + ' is missing the keys ' + ', '.join(missing_keys)
+
+            elems = [layer_dict[x] for x in keys] + optional_columns
+            if keys == gemm_keys:
+                self.append_gemm_layer(elems, batch_size)
+            else:
+                self.append_conv_layer(elems, batch_size)
 
         self.num_layers = len(self.topo_arrays)
         self.topo_load_flag = True
@@ -284,7 +373,8 @@ class topologies(object):
             stride_w = array[8]
             ofmap_h = int(math.ceil((ifmap_h - filt_h + stride_h) / stride_h))
             ofmap_w = int(math.ceil((ifmap_w - filt_w + stride_w) / stride_w))
-            num_mac = ofmap_h * ofmap_w * filt_h * filt_w * num_ch * num_filt
+            batch_size = array[11] if len(array) > 11 else 1
+            num_mac = ofmap_h * ofmap_w * filt_h * filt_w * num_ch * num_filt * batch_size
             window_size = filt_h * filt_w * num_ch
             entry = [ofmap_h, ofmap_w, num_mac, window_size]
             self.layers_calculated_hyperparams.append(entry)
@@ -445,6 +535,20 @@ class topologies(object):
         layer_params = self.topo_arrays[layer_id]
         return layer_params[9:11]
 
+    #
+    def get_layer_batch_size(self, layer_id=0):
+        """
+        Method to get the batch size of the layer if available. If not, print an error message.
+        The layers loaded without a batch size have a batch of 1.
+        """
+        if not (self.topo_load_flag or self.num_layers - 1 < layer_id):
+            print("ERROR: topologies.get_layer_batch_size: Invalid layer id")
+
+        layer_params = self.topo_arrays[layer_id]
+        if len(layer_params) > 11:
+            return layer_params[11]
+        return 1
+
     #
     def get_layer_window_size(self, layer_id=0):
         """
@@ -461,8 +565,8 @@ class topologies(object):
     #
     def get_layer_num_ofmap_px(self, layer_id=0):
         """
-        Method to get the number of ofmap pixels of the layer if available. If not, print an error
-        message.
+        Method to get the number of ofmap pixels of the layer, over all the samples of the batch, if
+        available. If not, print an error message.
         """
         if not (self.topo_load_flag or self.num_layers - 1 < layer_id):
             print("ERROR: topologies.get_layer_num_filter: Invalid layer id")
@@ -470,7 +574,8 @@ class topologies(object):
             self.topo_calc_hyperparams()
         layer_calc_params = self.layers_calculated_hyperparams[layer_id]
         num_filters = self.get_layer_num_filters(layer_id)
-        num_ofmap_px = layer_calc_params[0] * layer_calc_params[1] * num_filters
+        batch_size = self.get_layer_batch_size(layer_id)
+        num_ofmap_px = layer_calc_params[0] * layer_calc_params[1] * num_filters * batch_size
         return num_ofmap_px
 
     #
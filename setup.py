@@ -1,4 +1,5 @@
 import pathlib
+import re
 from setuptools import setup, find_packages
 
 # The directory containing this file
@@ -7,9 +8,12 @@ HERE = pathlib.Path(__file__).parent
 # The text of the README file
 README = (HERE / "README.md").read_text()
 
+# The version is kept in the package only, read it without importing the package
+VERSION = re.search(r"__version__ = '([^']+)'", (HERE / "scalesim" / "__init__.py").read_text()).group(1)
+
 setup(
     name='scalesim',
-    version='2.0.2',
+    version=VERSION,
     description='Systolic CNN AcceLerator Simulator',
     long_description=README,
     long_description_content_type="text/markdown",
@@ -22,6 +26,7 @@ setup(
     packages=find_packages(),
     include_package_data=False,                                 # The include_package_data argument controls whether non-code files are copied when your package is installed
     install_requires=["numpy","configparser","absl-py", "tqdm", "pandas"],
+    extras_require={"jit": ["numba"]},
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Developers',
@@ -0,0 +1,96 @@
+"""
+Helpers shared by the Python tests of SCALE-Sim. The runs are small so that the whole suite takes
+a few minutes.
+"""
+
+import os
+
+import pytest
+
+from scalesim.scale_sim import simulate
+
+
+#
+def write_topology(path, header, rows):
+    """
+    Function to write a topology file from its header and rows of columns, with the trailing
+    comma of each row expected by the topology parser.
+    """
+    with open(path, 'w') as f:
+        f.write(', '.join(header) + ',\n')
+        for row in rows:
+            f.write(', '.join(str(x) for x in row) + ',\n')
+    return str(path)
+
+
+#
+def write_conv_topology(path, layers):
+    """
+    Function to write a convolution topology file from a list of layer rows.
+    """
+    header = ['Layer name', 'IFMAP Height', 'IFMAP Width', 'Filter Height', 'Filter Width',
+              'Channels', 'Num Filter', 'Strides', 'Sparsity', 'Batch']
+    return write_topology(path, header, layers)
+
+
+#
+def write_gemm_topology(path, layers):
+    """
+    Function to write a GEMM topology file from a list of layer rows.
+    """
+    return write_topology(path, ['Layer', 'M', 'N', 'K', 'Sparsity', 'Batch'], layers)
+
+
+#
+def small_config(run_name, dataflow='os', bandwidth_mode='USER', **keys):
+    """
+    Function to get the config of a small array with small buffers, so that the runs stall, as a
+    dictionary of config keys. The keys given as arguments are added to it.
+    """
+    config = {'run_name': run_name,
+              'ArrayHeight': 8,
+              'ArrayWidth': 8,
+              'IfmapSramSzkB': 1,
+              'FilterSramSzkB': 1,
+              'OfmapSramSzkB': 1,
+              'Bandwidth': 10,
+              'Dataflow': dataflow,
+              'InterfaceBandwidth': bandwidth_mode}
+    config.update(keys)
+    return config
+
+
+#
+def run_to_dir(config, topology, top_path, input_type_gemm=False, save_trace=True, **kwargs):
+    """
+    Function to run a simulation writing its reports and traces under top_path. Returns the
+    results and the directory of the run.
+    """
+    result = simulate(config, topology, top_path=str(top_path), save_trace=save_trace,
+                      input_type_gemm=input_type_gemm, **kwargs)
+    return result, os.path.join(str(top_path), config['run_name'])
+
+
+#
+def read_run_files(run_dir, skip=('RUN_MANIFEST.json',)):
+    """
+    Function to read all the files written by a run, as a dictionary from their path relative to
+    the run directory to their contents.
+    """
+    files = {}
+    for dir_path, _, file_names in os.walk(run_dir):
+        for file_name in file_names:
+            if file_name in skip:
+                continue
+            file_path = os.path.join(dir_path, file_name)
+            with open(file_path, 'rb') as f:
+                files[os.path.relpath(file_path, run_dir)] = f.read()
+    return files
+
+
+@pytest.fixture(params=['os', 'ws', 'is'])
+def dataflow(request):
+    """
+    Fixture running a test once per dataflow.
+    """
+    return request.param
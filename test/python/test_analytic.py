@@ -0,0 +1,71 @@
+"""
+Tests of the analytic run mode, which estimates the stall free layers in closed form.
+"""
+
+from scalesim import simulator
+from scalesim.scale_config import scale_config
+from scalesim.scale_sim import simulate
+from scalesim.topology_utils import topologies
+
+
+LAYERS = [{'name': 'Conv1', 'ifmap_height': 14, 'ifmap_width': 14, 'filter_height': 3,
+           'filter_width': 3, 'channels': 4, 'num_filters': 8, 'strides': 1},
+          {'name': 'Conv2', 'ifmap_height': 16, 'ifmap_width': 16, 'filter_height': 5,
+           'filter_width': 5, 'channels': 3, 'num_filters': 20, 'strides': 2},
+          {'name': 'GEMM', 'M': 30, 'N': 24, 'K': 40}]
+
+
+#
+def stall_free_config(dataflow):
+    """
+    Function to get the config of an array with buffers large enough for the layers to be stall
+    free.
+    """
+    return {'run_name': 'analytic', 'ArrayHeight': 8, 'ArrayWidth': 8,
+            'IfmapSramSzkB': 1024, 'FilterSramSzkB': 1024, 'OfmapSramSzkB': 1024,
+            'Bandwidth': 64, 'Dataflow': dataflow, 'InterfaceBandwidth': 'USER'}
+
+
+#
+def test_analytic_matches_full_simulation(dataflow, monkeypatch):
+    """
+    The analytic estimates of the stall free layers give the same compute and SRAM bandwidth
+    report items as the full simulation, without simulating the layers. The DRAM bandwidth items
+    which follow the SRAM ones are not estimated.
+    """
+    config = stall_free_config(dataflow)
+    full_result = simulate(config, LAYERS, num_workers=1, run_mode='full')
+
+    def fail_run(self):
+        raise AssertionError('Layer ' + str(self.layer_id) + ' was simulated')
+    monkeypatch.setattr(simulator.layer_sim, 'run', fail_run)
+    analytic_result = simulate(config, LAYERS, num_workers=1, run_mode='analytic')
+
+    assert analytic_result.get_total_cycles() == full_result.get_total_cycles()
+    for layer_id in range(len(LAYERS)):
+        analytic_items = analytic_result.get_report_items(layer_id)
+        full_items = full_result.get_report_items(layer_id)
+        assert analytic_items['compute'] == full_items['compute']
+        num_sram_items = len(analytic_items['bandwidth'])
+        assert analytic_items['bandwidth'] == full_items['bandwidth'][:num_sram_items]
+
+
+#
+def test_analytic_falls_back_on_stalls(dataflow):
+    """
+    The layers which may stall are not estimated, and are simulated in the analytic run mode.
+    """
+    config = dict(stall_free_config(dataflow), IfmapSramSzkB=1, FilterSramSzkB=1,
+                  OfmapSramSzkB=1, Bandwidth=1)
+    config_obj = scale_config()
+    config_obj.read_conf_dict(config)
+    topo_obj = topologies()
+    topo_obj.load_layer_dicts(LAYERS)
+    for layer_id in range(len(LAYERS)):
+        assert simulator.estimate_layer(layer_id, config_obj, topo_obj) is None
+
+    full_result = simulate(config_obj, topo_obj, num_workers=1, run_mode='full')
+    analytic_result = simulate(config_obj, topo_obj, num_workers=1, run_mode='analytic')
+    assert analytic_result.get_total_cycles() == full_result.get_total_cycles()
+    for layer_id in range(len(LAYERS)):
+        assert analytic_result.get_report_items(layer_id) == full_result.get_report_items(layer_id)
@@ -0,0 +1,188 @@
+"""
+Tests of the batch size of the layers: the batch column of the topology files, the BatchSize
+config key and the batched operand matrices.
+"""
+
+import numpy as np
+import pytest
+
+from scalesim.compute.operand_matrix import operand_matrix, batched_operand_matrix
+from scalesim.scale_config import scale_config
+from scalesim.topology_utils import topologies
+
+from conftest import (read_run_files, run_to_dir, small_config, write_conv_topology,
+                      write_gemm_topology)
+
+
+#
+def test_batched_gemm_matches_stacked_gemm(tmp_path, dataflow):
+    """
+    A GEMM layer with a batch of 4 is the GEMM layer with its M dimension 4 times as large: the
+    IFMAP and OFMAP rows of the samples are stacked. The reports and traces must be the same.
+    """
+    batched_topo = write_gemm_topology(tmp_path / 'batched.csv', [['GEMM', 10, 12, 20, '', 4]])
+    stacked_topo = write_gemm_topology(tmp_path / 'stacked.csv', [['GEMM', 40, 12, 20, '', '']])
+
+    batched_result, batched_dir = run_to_dir(small_config('gemm', dataflow), batched_topo,
+                                             tmp_path / 'batched', input_type_gemm=True)
+    stacked_result, stacked_dir = run_to_dir(small_config('gemm', dataflow), stacked_topo,
+                                             tmp_path / 'stacked', input_type_gemm=True)
+
+    assert batched_result.get_total_cycles() == stacked_result.get_total_cycles()
+    batched_files = read_run_files(batched_dir)
+    stacked_files = read_run_files(stacked_dir)
+    assert sorted(batched_files) == sorted(stacked_files)
+    for file_name, contents in stacked_files.items():
+        assert batched_files[file_name] == contents, file_name
+
+
+#
+def test_batch_size_config_key(tmp_path):
+    """
+    The BatchSize config key applies to the layers without a batch column, and gives the same
+    results as the batch column.
+    """
+    layer = ['Conv', 12, 12, 3, 3, 4, 8, 1]
+    column_topo = write_conv_topology(tmp_path / 'column.csv', [layer + ['', 3]])
+    default_topo = write_conv_topology(tmp_path / 'default.csv', [layer + ['', '']])
+
+    column_result, column_dir = run_to_dir(small_config('conv'), column_topo, tmp_path / 'column')
+    default_result, default_dir = run_to_dir(small_config('conv', BatchSize=3), default_topo,
+                                             tmp_path / 'default')
+
+    assert column_result.get_total_cycles() == default_result.get_total_cycles()
+    assert read_run_files(column_dir) == read_run_files(default_dir)
+
+
+#
+def test_batch_column_takes_precedence(tmp_path):
+    """
+    The batch column of a layer takes precedence over the BatchSize config key.
+    """
+    topo_path = write_conv_topology(tmp_path / 'topo.csv', [['Conv', 12, 12, 3, 3, 4, 8, 1, '', 2],
+                                                            ['Conv2', 12, 12, 3, 3, 4, 8, 1, '',
+                                                             '']])
+    topo_obj = topologies()
+    topo_obj.load_arrays(topofile=topo_path, batch_size=5)
+    assert topo_obj.get_layer_batch_size(0) == 2
+    assert topo_obj.get_layer_batch_size(1) == 5
+
+
+@pytest.mark.parametrize('columns, sparsity_ratio, batch_size', [
+    ([], ['1', '1'], 1),
+    (['', ''], ['1', '1'], 1),
+    (['2:4'], ['2', '4'], 1),
+    (['2:4', '8'], ['2', '4'], 8),
+    (['', '8'], ['1', '1'], 8),
+    ([' 1:1 ', ' 3 ', '', ''], ['1', '1'], 3),
+])
+def test_parse_optional_columns(columns, sparsity_ratio, batch_size):
+    """
+    The optional columns are the sparsity ratio and then the batch size, and both may be empty.
+    """
+    assert topologies.parse_optional_columns(columns) == (sparsity_ratio, batch_size)
+
+
+@pytest.mark.parametrize('columns', [
+    ['8'],
+    ['1:1', 'a'],
+    ['1:1', '2.5'],
+    ['1:1', '0'],
+    ['1:1', '4', '7'],
+    ['', '', 'x'],
+])
+def test_parse_optional_columns_errors(columns):
+    """
+    A batch size in the sparsity column, a batch size which is not a positive integer or a column
+    after the batch size are errors.
+    """
+    with pytest.raises(AssertionError):
+        topologies.parse_optional_columns(columns, layer_name='Conv')
+
+
+#
+def stacked_matrix(sample_np, batch_size, sample_size):
+    """
+    Function to build the operand matrix of a batch by stacking the offset sample matrices.
+    """
+    samples = []
+    for sample_id in range(batch_size):
+        sample = sample_np.copy()
+        sample[sample != -1] += sample_id * sample_size
+        samples.append(sample)
+    return np.concatenate(samples, axis=0)
+
+
+#
+def test_batched_operand_matrix_matches_stacked_matrix():
+    """
+    The views of a batched operand matrix hold the same addresses as the stacked matrix, for
+    slices, transposes, reversals and integer indices.
+    """
+    rng = np.random.default_rng(0)
+    sample_np = rng.integers(0, 1000, size=(7, 5)).astype(np.int64)
+    sample_np[rng.random(sample_np.shape) < 0.2] = -1
+    batched = batched_operand_matrix(sample_np, 3, 1000)
+    stacked = stacked_matrix(sample_np, 3, 1000)
+
+    assert batched.shape == stacked.shape
+    assert batched.size == stacked.size
+    assert len(batched) == len(stacked)
+    assert np.array_equal(np.asarray(batched), stacked)
+    assert np.array_equal(np.asarray(batched.T), stacked.T)
+    assert np.array_equal(np.asarray(batched[::-1]), stacked[::-1])
+    assert np.array_equal(np.asarray(batched.T[:, ::-1]), stacked.T[:, ::-1])
+    assert np.array_equal(np.array(batched, dtype=np.int32), stacked.astype(np.int32))
+    with pytest.raises(ValueError):
+        np.array(batched, copy=False)
+
+    for _ in range(200):
+        view, view_np = batched, stacked
+        if rng.random() < 0.5:
+            view, view_np = view.T, view_np.T
+        rows = sorted(rng.integers(0, view_np.shape[0] + 1, size=2))
+        cols = sorted(rng.integers(0, view_np.shape[1] + 1, size=2))
+        step = int(rng.choice([1, 2, -1]))
+        key = (slice(rows[0], rows[1], step) if step > 0 else slice(rows[1], rows[0], step),
+               slice(cols[0], cols[1]))
+        view, view_np = view[key], view_np[key]
+        assert view.shape == view_np.shape
+        assert np.array_equal(np.asarray(view), view_np)
+        if view_np.shape[0] > 0:
+            row_id = int(rng.integers(0, view_np.shape[0]))
+            assert np.array_equal(view[row_id], view_np[row_id])
+        if view_np.shape[1] > 0:
+            col_id = int(rng.integers(0, view_np.shape[1]))
+            assert np.array_equal(view[:, col_id], view_np[:, col_id])
+
+
+#
+def test_operand_matrix_stores_first_sample():
+    """
+    Only the IFMAP and OFMAP matrices of the first sample are stored for a batched layer, and the
+    batch matrices are the stacked sample matrices.
+    """
+    config_obj = scale_config()
+    config_obj.read_conf_dict({})
+    layer = {'name': 'Conv', 'ifmap_height': 10, 'ifmap_width': 10, 'filter_height': 3,
+             'filter_width': 3, 'channels': 2, 'num_filters': 4, 'strides': 1}
+
+    matrices = []
+    for batch_size in (1, 4):
+        topo_obj = topologies()
+        topo_obj.load_layer_dicts([dict(layer, batch_size=batch_size)])
+        op_mat = operand_matrix()
+        op_mat.set_params(config_obj=config_obj, topoutil_obj=topo_obj, layer_id=0)
+        op_mat.create_operand_matrices()
+        matrices.append(op_mat)
+
+    sample, batch = matrices
+    assert batch.ifmap_addr_matrix.shape == sample.ifmap_addr_matrix.shape
+    assert batch.ofmap_addr_matrix.shape == sample.ofmap_addr_matrix.shape
+
+    ifmap_np = stacked_matrix(sample.ifmap_addr_matrix, 4, sample.ifmap_sample_size)
+    ofmap_np = stacked_matrix(sample.ofmap_addr_matrix, 4, sample.ofmap_sample_size)
+    assert np.array_equal(np.asarray(batch.get_ifmap_matrix()[1]), ifmap_np)
+    assert np.array_equal(np.asarray(batch.get_filter_matrix()[1]),
+                          sample.get_filter_matrix()[1])
+    assert np.array_equal(np.asarray(batch.get_ofmap_matrix()[1]), ofmap_np)
@@ -0,0 +1,77 @@
+"""
+Tests of the bounded memory mode, which releases the matrices of each layer once it is reported.
+"""
+
+from scalesim import simulator as simulator_module
+from scalesim.scale_config import scale_config
+from scalesim.simulator import simulator
+from scalesim.topology_utils import topologies
+
+from conftest import read_run_files, run_to_dir, small_config, write_conv_topology
+
+
+LAYERS = [['Conv1', 14, 14, 3, 3, 4, 8, 1, '', ''],
+          ['Conv2', 12, 12, 3, 3, 8, 16, 1, '', ''],
+          ['Conv3', 14, 14, 3, 3, 4, 8, 1, '', '']]
+
+
+#
+def test_bounded_memory_gives_identical_files(tmp_path, dataflow):
+    """
+    A run in the bounded memory mode writes the same reports and traces as a regular run.
+    """
+    topo_path = write_conv_topology(tmp_path / 'topo.csv', LAYERS)
+
+    normal_result, normal_dir = run_to_dir(small_config('bounded', dataflow), topo_path,
+                                           tmp_path / 'normal', num_workers=1)
+    bounded_result, bounded_dir = run_to_dir(small_config('bounded', dataflow,
+                                                          BoundedMemory='true'),
+                                             topo_path, tmp_path / 'bounded', num_workers=1)
+
+    for layer_id in range(len(LAYERS)):
+        assert bounded_result.get_report_items(layer_id) == normal_result.get_report_items(layer_id)
+
+    normal_files = read_run_files(normal_dir)
+    bounded_files = read_run_files(bounded_dir)
+    assert sorted(bounded_files) == sorted(normal_files)
+    for file_name, contents in normal_files.items():
+        assert bounded_files[file_name] == contents, file_name
+
+
+#
+def test_bounded_memory_releases_layers(tmp_path, monkeypatch):
+    """
+    After a run in the bounded memory mode, the simulator keeps no layer object, and every
+    simulated layer has dropped its operand, demand and trace matrices.
+    """
+    layer_objects = []
+    original_run = simulator_module.layer_sim.run
+
+    def recording_run(self):
+        layer_objects.append(self)
+        original_run(self)
+    monkeypatch.setattr(simulator_module.layer_sim, 'run', recording_run)
+
+    config_obj = scale_config()
+    config_obj.read_conf_dict(small_config('bounded', BoundedMemory='true'))
+    topo_obj = topologies()
+    topo_obj.load_arrays(topofile=write_conv_topology(tmp_path / 'topo.csv', LAYERS))
+
+    runner = simulator()
+    runner.set_params(config_obj=config_obj,
+                      topo_obj=topo_obj,
+                      top_path=str(tmp_path / 'runs'),
+                      verbosity=False,
+                      num_workers=1)
+    runner.run()
+
+    assert runner.single_layer_sim_object_list == []
+
+    # The third layer is identical to the first one, so it is not simulated
+    assert [x.layer_id for x in layer_objects] == [0, 1]
+    for layer_obj in layer_objects:
+        assert layer_obj.memory_released
+        assert layer_obj.op_mat_obj is None
+        assert layer_obj.compute_system is None
+        assert layer_obj.memory_system is None
+        assert layer_obj.get_report_items() == runner.layer_report_items_list[layer_obj.layer_id]
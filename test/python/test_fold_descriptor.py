@@ -0,0 +1,205 @@
+"""
+Tests of the fold descriptors against the demand matrices built by concatenating padded and skewed
+folds, as the compute modules did before the folds were described without materializing them.
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+from scalesim.compute.fold_descriptor import fold_descriptor
+from scalesim.compute.systolic_compute_is import systolic_compute_is
+from scalesim.compute.systolic_compute_os import systolic_compute_os, skew_matrix
+from scalesim.compute.systolic_compute_ws import systolic_compute_ws
+from scalesim.scale_config import scale_config
+
+from conftest import small_config
+
+
+COMPUTE_CLASSES = {'os': systolic_compute_os, 'ws': systolic_compute_ws, 'is': systolic_compute_is}
+
+# Operand sizes N, K, M of the IFMAP (N x K), filter (K x M) and OFMAP (N x M) matrices, and the
+# array dimensions. They cover uneven folds, operands smaller than the array and single columns.
+SHAPES = [(20, 13, 11, 8, 8),
+          (3, 5, 2, 8, 8),
+          (17, 9, 1, 4, 6),
+          (1, 7, 5, 6, 4),
+          (9, 1, 9, 4, 4),
+          (12, 10, 7, 5, 1),
+          (7, 11, 6, 1, 5),
+          (16, 16, 16, 4, 4)]
+
+
+#
+def pad(matrix_np, num_rows, num_cols):
+    """
+    Function to pad a matrix with null requests (-1) at the bottom and on the right, up to the
+    given numbers of rows and columns.
+    """
+    out_np = np.full((num_rows, num_cols), -1, dtype=np.int64)
+    out_np[:matrix_np.shape[0], :matrix_np.shape[1]] = matrix_np
+    return out_np
+
+
+#
+def null_lines(num_lines, num_cols):
+    """
+    Function to get a matrix of null requests.
+    """
+    return np.full((num_lines, num_cols), -1, dtype=np.int64)
+
+
+#
+def reference_os_folds(ifmap, filter_np, ofmap, arr_row, arr_col):
+    """
+    Function to build the IFMAP, filter and OFMAP demand folds of the output stationary dataflow.
+    """
+    Sr, T = ifmap.shape
+    Sc = filter_np.shape[1]
+    folds = ([], [], [])
+    for fc in range(math.ceil(Sc / arr_col)):
+        for fr in range(math.ceil(Sr / arr_row)):
+            rows = slice(fr * arr_row, min(fr * arr_row + arr_row, Sr))
+            cols = slice(fc * arr_col, min(fc * arr_col + arr_col, Sc))
+
+            this_fold = np.concatenate((pad(ifmap.T[:, rows], T, arr_row),
+                                        null_lines(arr_col - 1, arr_row)))
+            folds[0].append(skew_matrix(this_fold))
+
+            this_fold = np.concatenate((pad(filter_np[:, cols], T, arr_col),
+                                        null_lines(arr_row - 1, arr_col)))
+            folds[1].append(skew_matrix(this_fold))
+
+            this_fold = np.flip(pad(ofmap[rows, cols], arr_row, arr_col), 0)
+            this_fold = np.concatenate((null_lines(T - 1, arr_col), this_fold))
+            folds[2].append(skew_matrix(this_fold))
+    return folds
+
+
+#
+def reference_ws_folds(ifmap, filter_np, ofmap, arr_row, arr_col):
+    """
+    Function to build the IFMAP, filter and OFMAP demand folds of the weight stationary dataflow.
+    """
+    T, Sr = ifmap.shape
+    Sc = filter_np.shape[1]
+    folds = ([], [], [])
+    for fc in range(math.ceil(Sc / arr_col)):
+        for fr in range(math.ceil(Sr / arr_row)):
+            rows = slice(fr * arr_row, min(fr * arr_row + arr_row, Sr))
+            cols = slice(fc * arr_col, min(fc * arr_col + arr_col, Sc))
+
+            this_fold = np.concatenate((null_lines(arr_row, arr_row),
+                                        pad(ifmap[:, rows], T, arr_row),
+                                        null_lines(arr_col - 1, arr_row)))
+            folds[0].append(skew_matrix(this_fold))
+
+            this_fold = np.flip(pad(filter_np[rows, cols], arr_row, arr_col), 0)
+            this_fold = np.concatenate((this_fold,
+                                        null_lines(arr_row + arr_col + T - 2, arr_col)))
+            folds[1].append(this_fold)
+
+            this_fold = np.concatenate((null_lines(2 * arr_row - 1, arr_col),
+                                        pad(ofmap[:, cols], T, arr_col)))
+            folds[2].append(skew_matrix(this_fold))
+    return folds
+
+
+#
+def reference_is_folds(ifmap, filter_np, ofmap, arr_row, arr_col):
+    """
+    Function to build the IFMAP, filter and OFMAP demand folds of the input stationary dataflow.
+    """
+    Sc, Sr = ifmap.shape
+    T = filter_np.shape[1]
+    folds = ([], [], [])
+    for fc in range(math.ceil(Sc / arr_col)):
+        for fr in range(math.ceil(Sr / arr_row)):
+            rows = slice(fr * arr_row, min(fr * arr_row + arr_row, Sr))
+            cols = slice(fc * arr_col, min(fc * arr_col + arr_col, Sc))
+
+            this_fold = np.flip(pad(ifmap.T[rows, cols], arr_row, arr_col), 0)
+            this_fold = np.concatenate((this_fold,
+                                        null_lines(arr_row + arr_col + T - 2, arr_col)))
+            folds[0].append(this_fold)
+
+            this_fold = np.concatenate((null_lines(arr_row, arr_row),
+                                        pad(filter_np[rows, :].T, T, arr_row),
+                                        null_lines(arr_col - 1, arr_row)))
+            folds[1].append(skew_matrix(this_fold))
+
+            this_fold = np.concatenate((null_lines(2 * arr_row - 1, arr_col),
+                                        pad(ofmap[cols, :].T, T, arr_col)))
+            folds[2].append(skew_matrix(this_fold))
+    return folds
+
+
+REFERENCE_FOLDS = {'os': reference_os_folds, 'ws': reference_ws_folds, 'is': reference_is_folds}
+
+
+#
+@pytest.mark.parametrize('shape', SHAPES, ids=[str(x) for x in SHAPES])
+def test_demand_folds_match_skewed_folds(dataflow, shape):
+    """
+    The lines of every fold described by the compute modules, and the whole demand matrices, are
+    the padded and skewed folds of the operand matrices concatenated.
+    """
+    N, K, M, arr_row, arr_col = shape
+    ifmap = np.arange(N * K, dtype=np.int32).reshape((N, K))
+    filter_np = 10000 + np.arange(K * M, dtype=np.int32).reshape((K, M))
+    ofmap = 20000 + np.arange(N * M, dtype=np.int32).reshape((N, M))
+
+    config_obj = scale_config()
+    config_obj.read_conf_dict(small_config('folds', dataflow,
+                                           ArrayHeight=arr_row, ArrayWidth=arr_col))
+    compute_system = COMPUTE_CLASSES[dataflow]()
+    compute_system.set_params(config_obj=config_obj,
+                              ifmap_op_mat=ifmap,
+                              filter_op_mat=filter_np,
+                              ofmap_op_mat=ofmap)
+
+    reference_folds = REFERENCE_FOLDS[dataflow](ifmap, filter_np, ofmap, arr_row, arr_col)
+    demand_matrices = compute_system.get_demand_matrices()
+
+    for demand_mat, folds in zip(demand_matrices, reference_folds):
+        assert demand_mat.get_num_folds() == len(folds)
+        for fold_id, reference in enumerate(folds):
+            fold = demand_mat.folds[fold_id]
+            assert fold.get_num_lines() == reference.shape[0]
+            np.testing.assert_array_equal(fold.get_matrix(), reference)
+
+            start_line, end_line = demand_mat.get_fold_line_range(fold_id)
+            np.testing.assert_array_equal(demand_mat[start_line:end_line], reference)
+
+        reference_matrix = np.concatenate(folds)
+        assert demand_mat.shape == reference_matrix.shape
+        np.testing.assert_array_equal(np.asarray(demand_mat), reference_matrix)
+        with pytest.raises(ValueError):
+            np.array(demand_mat, copy=False)
+
+    # The lines of the folds streamed together are the same
+    streamed = [np.concatenate(x) for x in zip(*compute_system.get_demand_folds())]
+    for lines_np, folds in zip(streamed, reference_folds):
+        np.testing.assert_array_equal(lines_np, np.concatenate(folds))
+
+
+#
+@pytest.mark.parametrize('skewed', [False, True])
+def test_fold_lines_in_any_range(skewed):
+    """
+    Any range of lines of a fold, on a flipped view of a narrower source, is the same slice of the
+    padded fold.
+    """
+    source_np = np.arange(7 * 3, dtype=np.int64).reshape((7, 3))[::-1]
+    fold = fold_descriptor(source_np, 5, num_lead_lines=2, num_trail_lines=4, skewed=skewed)
+
+    reference = np.concatenate((null_lines(2, 5), pad(source_np, 7, 5), null_lines(4, 5)))
+    if skewed:
+        reference = skew_matrix(reference)
+    assert fold.get_num_lines() == reference.shape[0]
+
+    for start_line in range(reference.shape[0] + 1):
+        for end_line in range(start_line, reference.shape[0] + 1):
+            np.testing.assert_array_equal(fold.get_lines(start_line, end_line),
+                                          reference[start_line:end_line])
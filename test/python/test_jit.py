@@ -0,0 +1,67 @@
+"""
+Tests of the selection of the compiled kernels with the SCALESIM_DISABLE_JIT environment variable.
+The runs are made in new processes, as the kernels are selected on import.
+"""
+
+import importlib.util
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import read_run_files, small_config, write_conv_topology
+
+
+RUN_SCRIPT = '''
+import sys
+from scalesim.memory import kernels
+from scalesim.scale_sim import simulate
+config, topo_path, top_path = eval(sys.argv[1]), sys.argv[2], sys.argv[3]
+for bandwidth_mode in ['USER', 'CALC']:
+    for dataflow in ['os', 'ws', 'is']:
+        run_config = dict(config, run_name=dataflow + '_' + bandwidth_mode, Dataflow=dataflow,
+                          InterfaceBandwidth=bandwidth_mode)
+        simulate(run_config, topo_path, top_path=top_path, save_trace=True, num_workers=1)
+print(kernels.JIT_ENABLED)
+'''
+
+
+#
+def run_with_jit_setting(disable_jit, topo_path, top_path):
+    """
+    Function to run the simulations of RUN_SCRIPT in a new process with SCALESIM_DISABLE_JIT set
+    to disable_jit. Returns whether the compiled kernels were used.
+    """
+    env = dict(os.environ, SCALESIM_DISABLE_JIT=disable_jit)
+    package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env['PYTHONPATH'] = os.pathsep.join([package_root, env.get('PYTHONPATH', '')])
+
+    output = subprocess.run([sys.executable, '-c', RUN_SCRIPT, repr(small_config('jit')),
+                             topo_path, str(top_path)],
+                            env=env, check=True, capture_output=True, text=True).stdout
+    return output.strip().splitlines()[-1] == 'True'
+
+
+#
+@pytest.mark.parametrize('disable_jit', ['0', '1'])
+def test_kernel_selection_gives_same_files(tmp_path, disable_jit):
+    """
+    The runs give the same reports and traces with the kernels selected by SCALESIM_DISABLE_JIT
+    as with the NumPy kernels. Without Numba, both use the NumPy kernels.
+    """
+    topo_path = write_conv_topology(tmp_path / 'topo.csv',
+                                    [['Conv1', 14, 14, 3, 3, 4, 8, 1, '', ''],
+                                     ['Conv2', 12, 12, 3, 3, 8, 16, 1, '', '']])
+
+    jit_enabled = run_with_jit_setting(disable_jit, topo_path, tmp_path / 'run')
+    run_with_jit_setting('1', topo_path, tmp_path / 'numpy')
+
+    numba_installed = importlib.util.find_spec('numba') is not None
+    assert jit_enabled == (numba_installed and disable_jit == '0')
+
+    numpy_files = read_run_files(tmp_path / 'numpy')
+    run_files = read_run_files(tmp_path / 'run')
+    assert sorted(run_files) == sorted(numpy_files)
+    for file_name, contents in numpy_files.items():
+        assert run_files[file_name] == contents, file_name
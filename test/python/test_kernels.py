@@ -0,0 +1,82 @@
+"""
+Tests of the kernels of the memory simulation: the loop versions, the NumPy versions and, when
+Numba is installed, the compiled versions must give the same results.
+"""
+
+import numpy as np
+import pytest
+
+from scalesim.memory import kernels
+
+
+WINDOW_HITS_KERNELS = [kernels.window_hits_loop, kernels.window_hits_numpy]
+FIRST_NEW_ADDRS_KERNELS = [kernels.first_new_addrs_loop, kernels.first_new_addrs_numpy]
+if kernels.numba is not None:
+    WINDOW_HITS_KERNELS.append(kernels.numba.njit(kernels.window_hits_loop))
+    FIRST_NEW_ADDRS_KERNELS.append(kernels.numba.njit(kernels.first_new_addrs_loop))
+
+
+#
+def random_read_buffer(rng, num_lines, max_addr):
+    """
+    Function to get the index of a read buffer with random addresses in each line: its sorted
+    distinct addresses and the sorted keys rank * num_lines + line_id of the lines.
+    """
+    line_addrs = [rng.choice(max_addr, size=int(rng.integers(0, min(6, max_addr) + 1)),
+                             replace=False)
+                  for _ in range(num_lines)]
+    index_addrs = np.unique(np.concatenate(line_addrs + [np.zeros(0, dtype=np.int64)]))
+    index_keys = []
+    for line_id, addrs in enumerate(line_addrs):
+        ranks = np.searchsorted(index_addrs, addrs)
+        index_keys += [int(x) * num_lines + line_id for x in ranks]
+    index_keys = np.unique(np.array(index_keys, dtype=np.int64))
+    return index_addrs.astype(np.int64), index_keys
+
+
+#
+def test_window_hits_kernels_agree():
+    """
+    The window_hits kernels agree on random read buffers and windows, including the wrapped
+    windows, the full windows and the empty buffers.
+    """
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        num_lines = int(rng.integers(1, 9))
+        max_addr = int(rng.integers(1, 40))
+        index_addrs, index_keys = random_read_buffer(rng, num_lines, max_addr)
+        requests = rng.integers(-1, max_addr + 5, size=int(rng.integers(0, 30))).astype(np.int64)
+        start_id = int(rng.integers(0, num_lines))
+        end_id = int(rng.integers(0, num_lines))
+
+        expected = kernels.window_hits_loop(requests, index_addrs, index_keys,
+                                            num_lines, start_id, end_id)
+        for kernel in WINDOW_HITS_KERNELS[1:]:
+            hits = kernel(requests, index_addrs, index_keys, num_lines, start_id, end_id)
+            assert np.array_equal(hits, expected)
+
+
+#
+@pytest.mark.parametrize('num_new_to_move', [-3, 0, 1, 2, 5, 50, 5000])
+def test_first_new_addrs_kernels_agree(num_new_to_move):
+    """
+    The first_new_addrs kernels agree on random address ids, for counts of new addresses which
+    are zero, negative or larger than the number of ids, and leave the last set ids unchanged.
+    """
+    rng = np.random.default_rng(num_new_to_move + 10)
+    for _ in range(100):
+        num_addrs = int(rng.integers(1, 3000))
+        addr_ids = rng.integers(0, num_addrs, size=int(rng.integers(0, 4000))).astype(np.int64)
+        last_set_ids = rng.integers(0, 10, size=num_addrs).astype(np.int64)
+        set_start_id = int(rng.integers(0, 11))
+
+        expected_set_ids = last_set_ids.copy()
+        expected_idx, expected_scanned = kernels.first_new_addrs_loop(
+            addr_ids, last_set_ids, set_start_id, num_new_to_move)
+        assert np.array_equal(last_set_ids, expected_set_ids)
+
+        for kernel in FIRST_NEW_ADDRS_KERNELS[1:]:
+            new_idx, num_scanned = kernel(addr_ids, last_set_ids, set_start_id, num_new_to_move)
+            assert np.array_equal(new_idx, expected_idx)
+            assert num_scanned == expected_scanned
+            assert np.array_equal(last_set_ids, expected_set_ids)
@@ -0,0 +1,104 @@
+"""
+Tests of the memoization of the layers identical to a previous layer of the topology.
+"""
+
+from scalesim import simulator as simulator_module
+from scalesim.scale_config import scale_config
+from scalesim.simulator import simulator
+from scalesim.topology_utils import topologies
+
+from conftest import read_run_files, small_config, write_conv_topology
+
+
+LAYERS = [['ConvA', 14, 14, 3, 3, 4, 8, 1, '', ''],
+          ['ConvB', 12, 12, 3, 3, 8, 16, 1, '', ''],
+          ['ConvA_again', 14, 14, 3, 3, 4, 8, 1, '', '']]
+
+
+#
+def count_layer_sims(monkeypatch):
+    """
+    Function to record the id of every layer for which a 'single_layer_sim' is constructed by the
+    simulator.
+    """
+    constructed_layer_ids = []
+    original_set_params = simulator_module.layer_sim.set_params
+
+    def recording_set_params(self, layer_id=0, **kwargs):
+        constructed_layer_ids.append(layer_id)
+        original_set_params(self, layer_id=layer_id, **kwargs)
+    monkeypatch.setattr(simulator_module.layer_sim, 'set_params', recording_set_params)
+
+    return constructed_layer_ids
+
+
+#
+def run_layers(tmp_path, run_dir, config, layers, memoize_layers=True):
+    """
+    Function to run the layers with a simulator writing the reports and traces under run_dir.
+    Returns the simulator and the directory of the run.
+    """
+    config_obj = scale_config()
+    config_obj.read_conf_dict(config)
+    topo_obj = topologies()
+    topo_obj.load_arrays(topofile=write_conv_topology(tmp_path / 'topo.csv', layers))
+
+    runner = simulator()
+    runner.set_params(config_obj=config_obj,
+                      topo_obj=topo_obj,
+                      top_path=str(tmp_path / run_dir),
+                      verbosity=False,
+                      num_workers=1,
+                      memoize_layers=memoize_layers)
+    runner.run()
+    return runner, runner.top_path
+
+
+#
+def test_identical_layer_gives_identical_files(tmp_path, dataflow, monkeypatch):
+    """
+    A layer identical to a previous one is not simulated, and its report rows and traces are the
+    same as when it is simulated.
+    """
+    config = small_config('memoize', dataflow)
+    baseline, baseline_dir = run_layers(tmp_path, 'baseline', config, LAYERS,
+                                        memoize_layers=False)
+
+    constructed_layer_ids = count_layer_sims(monkeypatch)
+    memoized, memoized_dir = run_layers(tmp_path, 'memoized', config, LAYERS)
+
+    assert memoized.source_layer_ids == [0, 1, 0]
+    assert constructed_layer_ids == [0, 1]
+
+    assert memoized.layer_report_items_list == baseline.layer_report_items_list
+    assert memoized.layer_report_items_list[2] == memoized.layer_report_items_list[0]
+
+    baseline_files = read_run_files(baseline_dir)
+    memoized_files = read_run_files(memoized_dir)
+    assert sorted(memoized_files) == sorted(baseline_files)
+    for file_name, contents in baseline_files.items():
+        assert memoized_files[file_name] == contents, file_name
+
+
+#
+def test_different_stride_or_sparsity_is_simulated(tmp_path, monkeypatch):
+    """
+    Layers which only differ from a previous one by their stride or their sparsity ratio are
+    simulated on their own.
+    """
+    layers = [['Conv', 14, 14, 3, 3, 4, 8, 1, '', ''],
+              ['Conv_stride', 14, 14, 3, 3, 4, 8, 2, '', ''],
+              ['Conv_sparse', 14, 14, 3, 3, 4, 8, 1, '2:4', ''],
+              ['Conv_sparse_again', 14, 14, 3, 3, 4, 8, 1, '2:4', '']]
+    config = small_config('memoize', 'ws', SparsitySupport='true')
+
+    constructed_layer_ids = count_layer_sims(monkeypatch)
+    runner, _ = run_layers(tmp_path, 'runs', config, layers)
+
+    assert runner.source_layer_ids == [0, 1, 2, 2]
+    assert constructed_layer_ids == [0, 1, 2]
+
+    report_items_list = runner.layer_report_items_list
+    assert not report_items_list[1] == report_items_list[0]
+    assert not report_items_list[2] == report_items_list[0]
+    assert report_items_list[3] == report_items_list[2]
@@ -0,0 +1,35 @@
+"""
+Tests of the runs with the layers simulated in a pool of worker processes.
+"""
+
+from conftest import read_run_files, run_to_dir, small_config, write_conv_topology
+
+
+LAYERS = [['Conv1', 14, 14, 3, 3, 4, 8, 1, '', ''],
+          ['Conv2', 12, 12, 3, 3, 8, 16, 1, '', ''],
+          ['Conv3', 14, 14, 3, 3, 4, 8, 1, '', ''],
+          ['Conv4', 10, 10, 1, 1, 16, 8, 1, '', ''],
+          ['Conv5', 12, 12, 5, 5, 3, 4, 2, '', '']]
+
+
+#
+def test_parallel_matches_serial(tmp_path, dataflow):
+    """
+    A run on several workers writes the same reports and traces as a run in a single process,
+    including for the layers identical to a previous one.
+    """
+    topo_path = write_conv_topology(tmp_path / 'topo.csv', LAYERS)
+    config = small_config('parallel', dataflow)
+
+    serial_result, serial_dir = run_to_dir(config, topo_path, tmp_path / 'serial', num_workers=1)
+    parallel_result, parallel_dir = run_to_dir(config, topo_path, tmp_path / 'parallel',
+                                               num_workers=3)
+
+    for layer_id in range(len(LAYERS)):
+        assert parallel_result.get_report_items(layer_id) == serial_result.get_report_items(layer_id)
+
+    serial_files = read_run_files(serial_dir)
+    parallel_files = read_run_files(parallel_dir)
+    assert sorted(parallel_files) == sorted(serial_files)
+    for file_name, contents in serial_files.items():
+        assert parallel_files[file_name] == contents, file_name
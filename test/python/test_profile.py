@@ -0,0 +1,35 @@
+"""
+Tests of the profile of the layer runs.
+"""
+
+from scalesim.single_layer_sim import PROFILE_PHASES
+from scalesim.scale_sim import simulate
+
+from conftest import small_config
+
+
+LAYERS = [{'name': 'Conv1', 'ifmap_height': 14, 'ifmap_width': 14, 'filter_height': 3,
+           'filter_width': 3, 'channels': 4, 'num_filters': 8, 'strides': 1}]
+
+
+#
+def test_profile_phases(dataflow):
+    """
+    Every phase of a simulated layer is timed, the demand generation apart from the memory
+    service, and the total time is the sum of the times of the phases. Profiling does not change
+    the results.
+    """
+    result = simulate(small_config('profile', dataflow), LAYERS, num_workers=1)
+    profile_result = simulate(small_config('profile', dataflow, Profile=True), LAYERS,
+                              num_workers=1)
+
+    report_items = dict(profile_result.get_report_items(0))
+    profile_items = report_items.pop('profile')
+    assert report_items == result.get_report_items(0)
+
+    assert len(profile_items) == 2 * len(PROFILE_PHASES) + 1
+    phase_times = dict(zip(PROFILE_PHASES, profile_items[0:-1:2]))
+    for phase in PROFILE_PHASES:
+        if not phase == 'Trace Writing':
+            assert phase_times[phase] > 0, phase
+    assert abs(sum(phase_times.values()) - profile_items[-1]) < 1e-9
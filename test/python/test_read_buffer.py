@@ -0,0 +1,88 @@
+"""
+Tests of the read buffer of the memory simulation with the user bandwidth.
+"""
+
+import numpy as np
+
+from scalesim.memory.read_buffer import read_buffer
+from scalesim.memory.read_port import read_port
+
+
+#
+def make_read_buffer(fetch_matrix, size, bandwidth, latency, active_buf_frac):
+    """
+    Function to set up a read buffer fetching from a fetch matrix.
+    """
+    backing_buffer = read_port()
+    backing_buffer.set_params(latency)
+    buf = read_buffer()
+    buf.set_params(backing_buffer, total_size_bytes=size, word_size=1,
+                   active_buf_frac=active_buf_frac, hit_latency=1, backing_buf_bw=bandwidth)
+    buf.set_fetch_matrix(fetch_matrix.copy())
+    return buf
+
+
+#
+def service_reads_line_by_line(buf, requests, cycles):
+    """
+    Function to service read requests one line and one prefetch at a time, as a reference for
+    read_buffer.service_reads().
+    """
+    if not buf.active_buf_full_flag:
+        buf.prefetch_active_buffer(start_cycle=cycles[0][0])
+
+    out_cycles = []
+    offset = buf.hit_latency
+    for cycle, request_line in zip(cycles, requests):
+        for _ in range(buf.get_num_line_prefetches(request_line)):
+            buf.new_prefetch()
+            potential_stall_cycles = buf.last_prefect_cycle - (cycle + offset)
+            offset += potential_stall_cycles
+            if potential_stall_cycles > 0:
+                offset += potential_stall_cycles
+        out_cycles.append(cycle + offset)
+    return np.asarray(out_cycles).reshape((-1, 1))
+
+
+#
+def test_service_reads_matches_line_by_line():
+    """
+    Servicing blocks of request lines with the prefetches made together gives the same serviced
+    cycles, traces and access counts as making the prefetches one at a time.
+    """
+    rng = np.random.default_rng(0)
+    num_multi_prefetch_lines = 0
+    for _ in range(150):
+        rows, cols = int(rng.integers(4, 40)), int(rng.integers(2, 12))
+        fetch_matrix = rng.permutation(2 * rows * cols)[:rows * cols].reshape((rows, cols))
+        params = (int(rng.integers(rows * cols // 4 + 4, rows * cols + 10)),
+                  int(rng.integers(1, 8)), int(rng.integers(0, 5)),
+                  float(rng.choice([0.5, 0.75, 0.9])))
+        buf = make_read_buffer(fetch_matrix, *params)
+        ref_buf = make_read_buffer(fetch_matrix, *params)
+        if buf.num_prefetch_buf_lines == 0:
+            continue
+
+        addrs = fetch_matrix.reshape(-1)
+        cycle = 0
+        for _ in range(int(rng.integers(1, 20))):
+            num_lines = int(rng.integers(1, 6))
+            steps = rng.integers(-3, 8, size=(num_lines, int(rng.integers(1, 6))))
+            requests = addrs[(int(rng.integers(0, addrs.shape[0])) + steps.cumsum(axis=0))
+                             % addrs.shape[0]]
+            requests[rng.random(requests.shape) < 0.2] = -1
+            cycles = (cycle + np.arange(num_lines)).reshape((-1, 1))
+            cycle += num_lines + int(rng.integers(1, 20))
+
+            if buf.active_buf_full_flag:
+                num_multi_prefetch_lines += \
+                    int(np.sum(buf.get_num_prefetches_per_line(requests) > 1))
+            out_cycles = buf.service_reads(requests.copy(), cycles)
+            ref_out_cycles = service_reads_line_by_line(ref_buf, requests.copy(), cycles)
+            assert np.array_equal(out_cycles, ref_out_cycles)
+
+        assert np.array_equal(buf.get_trace_matrix(), ref_buf.get_trace_matrix())
+        assert buf.get_num_accesses() == ref_buf.get_num_accesses()
+        assert np.array_equal(buf.fetch_matrix, ref_buf.fetch_matrix)
+
+    assert num_multi_prefetch_lines > 0
@@ -0,0 +1,129 @@
+"""
+Tests of the on-disk cache of layer results.
+"""
+
+import os
+
+from scalesim import simulator
+from scalesim.result_cache import result_cache
+
+from conftest import read_run_files, run_to_dir, small_config, write_conv_topology
+
+
+LAYERS = [['Conv1', 14, 14, 3, 3, 4, 8, 1, '', ''],
+          ['Conv2', 12, 12, 3, 3, 8, 16, 1, '', '']]
+
+
+#
+def test_warm_cache_gives_identical_files(tmp_path, dataflow, monkeypatch):
+    """
+    A run with a warm cache does not simulate any layer, and writes the same reports and traces
+    as the run which filled the cache.
+    """
+    topo_path = write_conv_topology(tmp_path / 'topo.csv', LAYERS)
+    config = small_config('cache', dataflow, ResultCacheDir=str(tmp_path / 'cache'))
+
+    cold_result, cold_dir = run_to_dir(config, topo_path, tmp_path / 'cold', num_workers=1)
+    assert len(os.listdir(tmp_path / 'cache')) == len(LAYERS)
+
+    def fail_run(self):
+        raise AssertionError('Layer ' + str(self.layer_id) + ' was simulated again')
+    monkeypatch.setattr(simulator.layer_sim, 'run', fail_run)
+
+    warm_result, warm_dir = run_to_dir(config, topo_path, tmp_path / 'warm', num_workers=1)
+
+    assert warm_result.get_total_cycles() == cold_result.get_total_cycles()
+    cold_files = read_run_files(cold_dir)
+    warm_files = read_run_files(warm_dir)
+    assert sorted(warm_files) == sorted(cold_files)
+    for file_name, contents in cold_files.items():
+        assert warm_files[file_name] == contents, file_name
+
+
+#
+def test_oversized_entry_is_not_stored(tmp_path):
+    """
+    An entry larger than the cache is not stored, and does not evict the other entries.
+    """
+    cache = result_cache()
+    cache.set_params(cache_dir=str(tmp_path / 'cache'), max_size_mb=1)
+
+    trace_path = tmp_path / 'TRACE.csv'
+    trace_path.write_bytes(os.urandom(2 * 1024 * 1024))
+
+    cache.store('small', {'cycles': 1})
+    cache.store('large', {'cycles': 2}, [str(trace_path)])
+
+    assert cache.lookup('small') == ({'cycles': 1}, [])
+    assert cache.lookup('large') is None
+    assert os.listdir(tmp_path / 'cache') == ['small']
+
+
+#
+def test_entry_in_flight_is_not_evicted(tmp_path):
+    """
+    The temporary directory of an entry being written by another run is neither counted nor
+    evicted.
+    """
+    cache = result_cache()
+    cache.set_params(cache_dir=str(tmp_path / 'cache'), max_size_mb=1)
+
+    tmp_dir = tmp_path / 'cache' / ('other.tmp' + str(os.getpid() + 1))
+    tmp_dir.mkdir()
+    (tmp_dir / 'report_items.pkl').write_bytes(os.urandom(2 * 1024 * 1024))
+
+    cache.store('small', {'cycles': 1})
+
+    assert sorted(os.listdir(tmp_path / 'cache')) == sorted(['small', tmp_dir.name])
+    assert cache.lookup('small') == ({'cycles': 1}, [])
+
+
+#
+def test_entries_scanned_only_over_limit(tmp_path, monkeypatch):
+    """
+    The entries are scanned once to estimate the size of the cache, and then only when a store
+    pushes the cache over its size limit, which evicts the least recently used entries.
+    """
+    cache = result_cache()
+    cache.set_params(cache_dir=str(tmp_path / 'cache'), max_size_mb=1)
+
+    num_scans = []
+    original_evict = result_cache.evict
+
+    def counting_evict(self):
+        num_scans.append(1)
+        original_evict(self)
+    monkeypatch.setattr(result_cache, 'evict', counting_evict)
+
+    for key in ['a', 'b', 'c']:
+        cache.store(key, {'cycles': key})
+    assert len(num_scans) == 1
+
+    trace_path = tmp_path / 'TRACE.csv'
+    trace_path.write_bytes(os.urandom(400 * 1024))
+    cache.store('d', {'cycles': 'd'}, [str(trace_path)])
+    cache.store('e', {'cycles': 'e'}, [str(trace_path)])
+    assert len(num_scans) == 1
+
+    # 'b' and then 'd' are the least recently used entries
+    for last_used, key in enumerate(['b', 'd', 'a', 'c', 'e']):
+        os.utime(tmp_path / 'cache' / key / 'report_items.pkl', (last_used, last_used))
+    cache.store('f', {'cycles': 'f'}, [str(trace_path)])
+    assert len(num_scans) == 2
+    assert sorted(os.listdir(tmp_path / 'cache')) == ['a', 'c', 'e', 'f']
+
+
+#
+def test_entry_evicted_during_lookup_is_a_miss(tmp_path, monkeypatch):
+    """
+    An entry removed by another run while it is being read is a miss.
+    """
+    cache = result_cache()
+    cache.set_params(cache_dir=str(tmp_path / 'cache'), max_size_mb=1)
+    cache.store('small', {'cycles': 1})
+
+    def evicted_utime(path, *args, **kwargs):
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(os, 'utime', evicted_utime)
+
+    assert cache.lookup('small') is None
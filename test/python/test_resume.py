@@ -0,0 +1,83 @@
+"""
+Tests of resuming a run which was interrupted, from the reports and the manifest on the disk.
+"""
+
+import os
+
+import pytest
+
+from scalesim import simulator
+from scalesim.scale_config import scale_config
+from scalesim.topology_utils import topologies
+
+from conftest import read_run_files, small_config, write_conv_topology
+
+
+LAYERS = [['Conv1', 14, 14, 3, 3, 4, 8, 1, '', ''],
+          ['Conv2', 12, 12, 3, 3, 8, 16, 1, '', ''],
+          ['Conv3', 10, 10, 3, 3, 16, 8, 1, '', '']]
+
+
+#
+def run_simulator(config, topo_path, top_path, resume=False):
+    """
+    Function to run the simulator on a topology file in a single process, writing the reports
+    and the traces under top_path.
+    """
+    config_obj = scale_config()
+    config_obj.read_conf_dict(config)
+    topo_obj = topologies()
+    topo_obj.load_arrays(topofile=topo_path)
+
+    sim = simulator.simulator()
+    sim.set_params(config_obj=config_obj, topo_obj=topo_obj, top_path=str(top_path),
+                   verbosity=False, save_trace=True, num_workers=1, resume=resume)
+    sim.run()
+    return os.path.join(str(top_path), config['run_name'])
+
+
+#
+def test_resume_after_truncation(tmp_path, monkeypatch):
+    """
+    A run interrupted while writing the reports of a layer is resumed from the last layer which
+    is fully reported, and gives the same reports and traces as a run which was not interrupted.
+    """
+    topo_path = write_conv_topology(tmp_path / 'topo.csv', LAYERS)
+    config = small_config('resume')
+    ref_dir = run_simulator(config, topo_path, tmp_path / 'ref')
+
+    # Interrupt the run while simulating the last layer
+    layer_run = simulator.layer_sim.run
+    simulated_layer_ids = []
+
+    def interrupted_run(self):
+        if self.layer_id == len(LAYERS) - 1:
+            raise KeyboardInterrupt
+        simulated_layer_ids.append(self.layer_id)
+        layer_run(self)
+    monkeypatch.setattr(simulator.layer_sim, 'run', interrupted_run)
+    with pytest.raises(KeyboardInterrupt):
+        run_simulator(config, topo_path, tmp_path / 'run')
+    assert simulated_layer_ids == [0, 1]
+
+    # The row of the second layer in a report is only partially written
+    run_dir = os.path.join(str(tmp_path / 'run'), config['run_name'])
+    report_path = os.path.join(run_dir, 'COMPUTE_REPORT.csv')
+    with open(report_path, 'r') as f:
+        report = f.read()
+    with open(report_path, 'w') as f:
+        f.write(report[:report.rstrip('\n').rfind('\n') + 5])
+
+    def counted_run(self):
+        simulated_layer_ids.append(self.layer_id)
+        layer_run(self)
+    monkeypatch.setattr(simulator.layer_sim, 'run', counted_run)
+    simulated_layer_ids.clear()
+    run_simulator(config, topo_path, tmp_path / 'run', resume=True)
+    assert simulated_layer_ids == [1, 2]
+
+    ref_files = read_run_files(ref_dir)
+    run_files = read_run_files(run_dir)
+    assert sorted(run_files) == sorted(ref_files)
+    for file_name, contents in ref_files.items():
+        assert run_files[file_name] == contents, file_name
@@ -0,0 +1,62 @@
+"""
+Tests of the in-memory simulate() API and of the tables of its results.
+"""
+
+import os
+
+import pytest
+
+from scalesim.scale_sim import simulate
+
+from conftest import small_config
+
+
+LAYERS = [{'name': 'Conv1', 'ifmap_height': 14, 'ifmap_width': 14, 'filter_height': 3,
+           'filter_width': 3, 'channels': 4, 'num_filters': 8, 'strides': 1},
+          {'name': 'GEMM', 'M': 20, 'N': 12, 'K': 10, 'batch_size': 2},
+          {'name': 'Conv2', 'ifmap_height': 12, 'ifmap_width': 12, 'filter_height': 3,
+           'filter_width': 3, 'channels': 8, 'num_filters': 16, 'strides': 2}]
+
+
+#
+@pytest.mark.parametrize('config', [small_config('memory', 'os'),
+                                    small_config('memory', 'ws', SparsitySupport='true')],
+                         ids=['dense', 'sparse'])
+def test_simulate_in_memory(tmp_path, monkeypatch, config):
+    """
+    A run from a config and a topology given as dictionaries writes nothing to the disk, and the
+    DataFrame and structured array of its results hold the report items of each layer.
+    """
+    monkeypatch.chdir(tmp_path)
+    result = simulate(config, LAYERS)
+
+    assert os.listdir(tmp_path) == []
+
+    assert result.get_num_layers() == len(LAYERS)
+    assert result.get_layer_names() == [x['name'] for x in LAYERS]
+
+    expected_columns = ['LayerID', 'Layer Name']
+    for columns in result.report_columns.values():
+        expected_columns += [x for x in columns if x not in expected_columns]
+    if config.get('SparsitySupport') == 'true':
+        assert 'sparse' in result.report_columns
+
+    dataframe = result.get_dataframe()
+    records = result.get_structured_array()
+    assert list(dataframe.columns) == expected_columns
+    assert list(records.dtype.names) == expected_columns
+    assert len(dataframe) == len(LAYERS)
+    assert len(records) == len(LAYERS)
+
+    for layer_id, layer in enumerate(LAYERS):
+        report_items = result.get_report_items(layer_id)
+        row = dataframe.iloc[layer_id]
+        record = records[layer_id]
+        assert row['LayerID'] == layer_id and record['LayerID'] == layer_id
+        assert row['Layer Name'] == layer['name'] and record['Layer Name'] == layer['name']
+
+        for report_kind, columns in result.report_columns.items():
+            assert len(columns) <= len(report_items[report_kind])
+            for column, value in zip(columns, report_items[report_kind]):
+                assert row[column] == value, column
+                assert record[column] == value, column
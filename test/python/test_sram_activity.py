@@ -0,0 +1,135 @@
+"""
+Tests of the start and stop cycles and the active lines of the SRAM traces, against a scan of the
+trace one line at a time.
+"""
+
+import numpy as np
+import pytest
+
+from scalesim.compute.fold_descriptor import fold_descriptor, virtual_demand_matrix
+from scalesim.memory.double_buffered_scratchpad_mem import double_buffered_scratchpad
+
+
+#
+def make_demand_mat(num_lines, num_cols, active_lines, seed):
+    """
+    Function to build a demand matrix with null requests (-1) everywhere but on the active lines,
+    which hold a few valid requests each.
+    """
+    rng = np.random.default_rng(seed)
+    demand_mat = np.full((num_lines, num_cols), -1, dtype=np.int64)
+    for line_id in active_lines:
+        num_requests = int(rng.integers(1, num_cols + 1))
+        cols = rng.choice(num_cols, size=num_requests, replace=False)
+        demand_mat[line_id, cols] = rng.integers(0, 1000, size=num_requests)
+    return demand_mat
+
+
+#
+def scan_trace(serviced_cycles, demand_mat):
+    """
+    Function to find the first and last active cycles and the number of active lines of a trace by
+    looking at every request, as the report generation did before.
+    """
+    start_cycle, stop_cycle, num_active_lines = None, None, 0
+    for line_id in range(demand_mat.shape[0]):
+        for addr in demand_mat[line_id]:
+            if not addr == -1:
+                if start_cycle is None:
+                    start_cycle = serviced_cycles[line_id][0]
+                stop_cycle = serviced_cycles[line_id][0]
+                num_active_lines += 1
+                break
+    return start_cycle, stop_cycle, num_active_lines
+
+
+# Active lines of the hand built traces of 40 lines, with runs of null lines at the start, in the
+# middle and at the end
+ACTIVE_LINES = {'ifmap': [5, 6, 7, 20, 21, 30],
+                'filter': [0, 1, 2, 3, 17, 39],
+                'ofmap': [12]}
+NUM_LINES = 40
+
+
+#
+def make_scratchpad(virtual):
+    """
+    Function to set up a scratchpad holding the hand built SRAM traces, as after servicing the
+    demand matrices. The demand matrices are virtual demand matrices if virtual is set.
+    """
+    memory_system = double_buffered_scratchpad()
+    demand_mats = {}
+    for operand_id, operand in enumerate(['ifmap', 'filter', 'ofmap']):
+        num_cols = 4 + operand_id
+        demand_mat = make_demand_mat(NUM_LINES, num_cols, ACTIVE_LINES[operand], operand_id)
+        demand_mats[operand] = demand_mat
+
+        # The serviced cycles grow by a few stalls here and there
+        serviced_cycles = np.cumsum(1 + (np.arange(NUM_LINES) % 7 == 3) * 4).reshape((-1, 1))
+        setattr(memory_system, operand + '_serviced_cycles', serviced_cycles + 100 * operand_id)
+
+        if virtual:
+            virtual_mat = virtual_demand_matrix(num_cols, dtype=np.int64, chunk_elems=16)
+            virtual_mat.append_fold(fold_descriptor(demand_mat[:15], num_cols))
+            virtual_mat.append_fold(fold_descriptor(demand_mat[15:], num_cols))
+            demand_mat = virtual_mat
+        setattr(memory_system, operand + '_demand_mat', demand_mat)
+
+    memory_system.traces_valid = True
+    return memory_system, demand_mats
+
+
+#
+@pytest.mark.parametrize('virtual', [False, True], ids=['numpy', 'virtual'])
+def test_sram_activity_matches_scan(virtual):
+    """
+    The start and stop cycles and the numbers of active lines of the SRAMs are the ones found by
+    scanning the traces, whether or not the demand matrices are materialized.
+    """
+    memory_system, demand_mats = make_scratchpad(virtual)
+    memory_system.update_sram_activity()
+    summary = memory_system.get_sram_activity_summary()
+
+    start_stop_getters = {'ifmap': memory_system.get_ifmap_sram_start_stop_cycles,
+                          'filter': memory_system.get_filter_sram_start_stop_cycles,
+                          'ofmap': memory_system.get_ofmap_sram_start_stop_cycles}
+    for operand, demand_mat in demand_mats.items():
+        serviced_cycles = getattr(memory_system, operand + '_serviced_cycles')
+        start_cycle, stop_cycle, num_active_lines = scan_trace(serviced_cycles, demand_mat)
+        assert num_active_lines == len(ACTIVE_LINES[operand])
+
+        assert start_stop_getters[operand]() == (start_cycle, stop_cycle)
+        assert summary[operand] == {'first_active_cycle': start_cycle,
+                                    'last_active_cycle': stop_cycle,
+                                    'num_active_lines': num_active_lines}
+
+
+#
+@pytest.mark.parametrize('chunk_lines', [1, 3, 7, 16, 40, 1000])
+def test_trace_activity_across_chunks(chunk_lines):
+    """
+    The activity found by checking the demand lines a chunk at a time does not depend on the size
+    of the chunks.
+    """
+    demand_mat = make_demand_mat(NUM_LINES, 5, [2, 9, 10, 11, 25, 33], 7)
+    serviced_cycles = (3 * np.arange(NUM_LINES) + 11).reshape((-1, 1))
+
+    activity = double_buffered_scratchpad.get_trace_activity(serviced_cycles, demand_mat,
+                                                             chunk_lines=chunk_lines)
+    assert activity == scan_trace(serviced_cycles, demand_mat)
+
+
+#
+def test_null_trace_keeps_start_stop_cycles():
+    """
+    An SRAM without any valid request keeps its start and stop cycles, and has no active line.
+    """
+    memory_system, _ = make_scratchpad(False)
+    memory_system.ofmap_demand_mat = np.full((NUM_LINES, 6), -1, dtype=np.int64)
+    memory_system.update_sram_activity()
+
+    assert double_buffered_scratchpad.get_trace_activity(memory_system.ofmap_serviced_cycles,
+                                                         memory_system.ofmap_demand_mat) \
+        == (None, None, 0)
+    assert memory_system.get_ofmap_sram_start_stop_cycles() == (0, 0)
+    assert memory_system.get_sram_activity_summary()['ofmap']['num_active_lines'] == 0
@@ -0,0 +1,157 @@
+"""
+Tests of the design space sweep: the consolidated report, the deduplication of the jobs and the
+parsing of the swept values.
+"""
+
+import os
+
+import pytest
+
+from scalesim import design_sweep as sweep_module
+from scalesim.design_sweep import design_sweep, parse_sweep_values
+from scalesim.scale_config import scale_config
+from scalesim.scale_sim import simulate
+from scalesim.topology_utils import topologies
+
+from conftest import small_config, write_conv_topology
+
+
+LAYERS = [['Conv1', 14, 14, 3, 3, 4, 8, 1, '', ''],
+          ['Conv2', 12, 12, 3, 3, 8, 16, 1, '', '']]
+
+
+#
+def run_sweep(tmp_path, layers, num_workers=1, **knob_values):
+    """
+    Function to run a sweep of the given knob values over a small base config, writing its report
+    under tmp_path. Returns the sweep object and the path of the report.
+    """
+    topo_path = write_conv_topology(tmp_path / 'topo.csv', layers)
+    config_obj = scale_config()
+    config_obj.read_conf_dict(small_config('sweep'))
+    topo_obj = topologies()
+    topo_obj.load_arrays(topofile=topo_path)
+
+    sweep = design_sweep()
+    sweep.set_params(config_obj=config_obj,
+                     topo_obj=topo_obj,
+                     top_path=str(tmp_path / 'runs'),
+                     verbosity=False,
+                     num_workers=num_workers,
+                     **knob_values)
+    sweep.run()
+    return sweep, os.path.join(str(tmp_path / 'runs'), 'sweep', 'SWEEP_REPORT.csv')
+
+
+#
+def read_sweep_report(report_path):
+    """
+    Function to read the rows of SWEEP_REPORT.csv as lists of stripped fields, without the header.
+    """
+    with open(report_path, 'r') as f:
+        lines = f.readlines()
+    return [[x.strip() for x in line.rstrip().rstrip(',').split(',')] for line in lines[1:]]
+
+
+#
+@pytest.mark.parametrize('num_workers', [1, 2])
+def test_sweep_rows_match_simulate(tmp_path, num_workers):
+    """
+    The rows of every design point in the sweep report hold the results of a direct simulation of
+    the layers with the knob values of that point.
+    """
+    sweep, report_path = run_sweep(tmp_path, LAYERS, num_workers=num_workers,
+                                   array_heights=[4, 8],
+                                   ofmap_sram_sizes_kb=[1, 4],
+                                   dataflows=['os', 'ws', 'is'],
+                                   bandwidths=[10])
+    assert sweep.get_num_design_points() == 12
+
+    rows = read_sweep_report(report_path)
+    assert len(rows) == 12 * len(LAYERS)
+
+    for point_id, point in enumerate(sweep.design_points):
+        arr_h, arr_w, ifmap_kb, filter_kb, ofmap_kb, dataflow, bandwidth = point
+        config = small_config('direct', dataflow,
+                              ArrayHeight=arr_h, ArrayWidth=arr_w,
+                              IfmapSramSzkB=ifmap_kb, FilterSramSzkB=filter_kb,
+                              OfmapSramSzkB=ofmap_kb, Bandwidth=bandwidth)
+        result = simulate(config, write_conv_topology(tmp_path / 'direct.csv', LAYERS))
+
+        for layer_id in range(len(LAYERS)):
+            report_items = result.get_report_items(layer_id)
+            assert sweep.get_report_items(point_id)[layer_id] == report_items
+
+            expected_row = [str(point_id)] + [str(x) for x in point] + [str(layer_id)]
+            expected_row += [str(x) for x in report_items['compute']]
+            expected_row += [str(x) for x in report_items['bandwidth']]
+            assert rows[point_id * len(LAYERS) + layer_id] == expected_row
+
+
+#
+def test_sweep_runs_each_fingerprint_once(tmp_path, monkeypatch):
+    """
+    A sweep with a repeated design point and a repeated layer runs every distinct job once, and
+    builds the operand matrices once per layer. The repeated jobs reuse the results.
+    """
+    run_counts = {}
+    original_run = sweep_module.layer_sim.run
+
+    def counting_run(self):
+        fingerprint = sweep_module.get_layer_fingerprint(self.layer_id, self.config,
+                                                         self.topo)
+        run_counts[fingerprint] = run_counts.get(fingerprint, 0) + 1
+        original_run(self)
+    monkeypatch.setattr(sweep_module.layer_sim, 'run', counting_run)
+
+    operand_matrix_counts = []
+    original_create = sweep_module.opmat.create_operand_matrices
+
+    def counting_create(self):
+        operand_matrix_counts.append(self.layer_id)
+        return original_create(self)
+    monkeypatch.setattr(sweep_module.opmat, 'create_operand_matrices', counting_create)
+
+    layers = LAYERS + [['Conv1_again'] + LAYERS[0][1:]]
+    sweep, report_path = run_sweep(tmp_path, layers, array_heights=[4, 8, 8])
+
+    # Two distinct array heights for two distinct layers
+    assert len(run_counts) == 4
+    assert all(x == 1 for x in run_counts.values())
+    assert operand_matrix_counts == [0, 1]
+
+    for point_id in range(sweep.get_num_design_points()):
+        report_items_list = sweep.get_report_items(point_id)
+        assert report_items_list[2] == report_items_list[0]
+    assert sweep.get_report_items(2) == sweep.get_report_items(1)
+
+    rows = read_sweep_report(report_path)
+    assert len(rows) == 3 * len(layers)
+    assert rows[2 * len(layers):] == [[str(2)] + x[1:] for x in rows[len(layers):2 * len(layers)]]
+
+
+#
+@pytest.mark.parametrize('values_string, value_type, values', [
+    ('8:64:8', int, [8, 16, 24, 32, 40, 48, 56, 64]),
+    (' 4 : 10 : 3 ', int, [4, 7, 10]),
+    ('8:8:1', int, [8]),
+    ('8,16,32', int, [8, 16, 32]),
+    (' 8, 16 ,', int, [8, 16]),
+    ('32', int, [32]),
+    ('os, ws,is', str, ['os', 'ws', 'is']),
+])
+def test_parse_sweep_values(values_string, value_type, values):
+    """
+    The swept values are given as an inclusive range 'start:stop:step' or a comma separated list.
+    """
+    assert parse_sweep_values(values_string, value_type) == values
+
+
+#
+@pytest.mark.parametrize('values_string', ['8:64', '8:64:0'])
+def test_parse_sweep_values_invalid_range(values_string):
+    """
+    A range without a step or with a step which is not positive is rejected.
+    """
+    with pytest.raises(AssertionError):
+        parse_sweep_values(values_string)
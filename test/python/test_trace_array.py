@@ -0,0 +1,265 @@
+"""
+Tests of the chunked storage of the buffer traces against the arrays built by np.concatenate.
+"""
+
+import gc
+import os
+
+import numpy as np
+import pytest
+
+from scalesim.memory.trace_array import trace_array
+
+from conftest import read_run_files, run_to_dir, small_config, write_conv_topology
+
+
+# Numbers of rows of the appended blocks, smaller and larger than the chunks of 8 rows
+BLOCK_ROWS = [1, 3, 7, 8, 2, 17, 4, 1, 9, 5]
+CHUNK_ROWS = 8
+
+
+#
+def make_blocks(widths):
+    """
+    Function to make the blocks of rows to append, with the given width for each block. The values
+    are distinct so that a misplaced row is detected.
+    """
+    blocks = []
+    start = 0
+    for num_rows, width in zip(BLOCK_ROWS, widths):
+        blocks.append(np.arange(start, start + num_rows * width).reshape((num_rows, width)))
+        start += num_rows * width
+    return blocks
+
+
+#
+def make_reference(blocks, pad_value=None):
+    """
+    Function to concatenate the blocks, padding the narrower ones with pad_value.
+    """
+    num_cols = max(x.shape[1] for x in blocks)
+    padded = []
+    for block in blocks:
+        pad = np.full((block.shape[0], num_cols - block.shape[1]), pad_value)
+        padded.append(np.concatenate((block, pad), axis=1) if pad.shape[1] > 0 else block)
+    return np.concatenate(padded, axis=0)
+
+
+#
+@pytest.fixture(params=[False, True], ids=['memory', 'spill'])
+def spill_dir(request, tmp_path):
+    """
+    Fixture running a test with the chunks kept in memory and with the chunks spilled to the disk.
+    """
+    if not request.param:
+        return None
+    path = tmp_path / 'spill'
+    path.mkdir()
+    return str(path)
+
+
+#
+def fill_trace(blocks, spill_dir, pad_value=None):
+    """
+    Function to append the blocks to a new trace with small chunks.
+    """
+    trace = trace_array(pad_value=pad_value, chunk_rows=CHUNK_ROWS, spill_dir=spill_dir)
+    for block in blocks:
+        trace.append(block)
+    return trace
+
+
+#
+@pytest.mark.parametrize('widths, pad_value', [
+    ([4] * len(BLOCK_ROWS), None),
+    ([4, 2, 6, 6, 1, 3, 6, 2, 5, 4], -1),
+])
+def test_get_array_matches_concatenate(widths, pad_value, spill_dir):
+    """
+    The complete trace is the concatenation of the appended rows, padded to the widest row. It
+    stays the same after it replaced the chunks and after more rows are appended.
+    """
+    blocks = make_blocks(widths)
+    trace = fill_trace(blocks[:-2], spill_dir, pad_value)
+
+    assert trace.get_num_rows() == sum(BLOCK_ROWS[:-2])
+    np.testing.assert_array_equal(trace.get_array(), make_reference(blocks[:-2], pad_value))
+    np.testing.assert_array_equal(trace.get_array(), make_reference(blocks[:-2], pad_value))
+
+    for block in blocks[-2:]:
+        trace.append(block)
+
+    reference = make_reference(blocks, pad_value)
+    assert trace.get_num_rows() == reference.shape[0]
+    array = trace.get_array()
+    assert array.dtype == reference.dtype
+    np.testing.assert_array_equal(array, reference)
+
+
+#
+def test_different_widths_without_pad_value():
+    """
+    Rows of different widths are rejected when no pad value is given.
+    """
+    trace = trace_array()
+    trace.append(np.zeros((2, 3)))
+    with pytest.raises(AssertionError):
+        trace.append(np.zeros((2, 4)))
+
+
+#
+def test_get_rows_across_chunks(spill_dir):
+    """
+    Any range of rows, including those across the chunk boundaries and past the ends of the trace,
+    is the same slice of the concatenated rows.
+    """
+    blocks = make_blocks([3] * len(BLOCK_ROWS))
+    reference = make_reference(blocks)
+    trace = fill_trace(blocks, spill_dir)
+    num_rows = reference.shape[0]
+
+    for start_row in range(-2, num_rows + 2):
+        for end_row in range(start_row, num_rows + 3):
+            rows = trace.get_rows(start_row, end_row)
+            expected = reference[max(start_row, 0):max(end_row, 0)]
+            assert rows.shape == (expected.shape[0], 3)
+            np.testing.assert_array_equal(rows, expected)
+
+    # The same ranges from the complete array
+    trace.get_array()
+    for start_row in range(0, num_rows, 5):
+        np.testing.assert_array_equal(trace.get_rows(start_row, start_row + 11),
+                                      reference[start_row:start_row + 11])
+
+
+#
+@pytest.mark.parametrize('widths, pad_value', [
+    ([2] * len(BLOCK_ROWS), None),
+    ([2, 5, 1, 3, 3, 4, 2, 5, 1, 2], 0),
+])
+def test_savetxt_matches_numpy(tmp_path, widths, pad_value, spill_dir):
+    """
+    The trace written one chunk at a time is the file np.savetxt() writes for the concatenated rows.
+    """
+    blocks = make_blocks(widths)
+    trace = fill_trace(blocks, spill_dir, pad_value)
+
+    trace.savetxt(str(tmp_path / 'trace.csv'), fmt='%s', delimiter=',')
+    np.savetxt(str(tmp_path / 'reference.csv'), make_reference(blocks, pad_value),
+               fmt='%s', delimiter=',')
+
+    assert (tmp_path / 'trace.csv').read_bytes() == (tmp_path / 'reference.csv').read_bytes()
+
+
+#
+def test_spilled_files_are_removed(tmp_path):
+    """
+    The full chunks are spilled to files, which are removed by clear() and when the trace is
+    deleted.
+    """
+    spill_path = tmp_path / 'spill'
+    spill_path.mkdir()
+    blocks = make_blocks([3] * len(BLOCK_ROWS))
+
+    trace = fill_trace(blocks, str(spill_path))
+    assert len(os.listdir(spill_path)) > 0
+    trace.clear()
+    assert os.listdir(spill_path) == []
+    assert trace.get_num_rows() == 0
+
+    trace = fill_trace(blocks, str(spill_path))
+    np.testing.assert_array_equal(trace.get_array(), make_reference(blocks))
+    assert len(os.listdir(spill_path)) > 0
+    del trace
+    gc.collect()
+    assert os.listdir(spill_path) == []
+
+
+#
+def test_indexing_matches_concatenate(spill_dir):
+    """
+    The trace is indexed as the concatenated rows, by single rows and by ranges of rows.
+    """
+    blocks = make_blocks([3] * len(BLOCK_ROWS))
+    reference = make_reference(blocks)
+    trace = fill_trace(blocks, spill_dir)
+
+    assert trace.shape == reference.shape
+    assert len(trace) == reference.shape[0]
+    for row_id in [0, 7, 8, 30, -1, -reference.shape[0]]:
+        np.testing.assert_array_equal(trace[row_id], reference[row_id])
+    np.testing.assert_array_equal(trace[5:27], reference[5:27])
+    np.testing.assert_array_equal(trace[-9:], reference[-9:])
+
+
+#
+def test_spilled_array_is_not_kept(tmp_path):
+    """
+    The complete array of a spilled trace is built when asked for, but the trace stays in spilled
+    chunks.
+    """
+    blocks = make_blocks([3] * len(BLOCK_ROWS))
+    trace = fill_trace(blocks, str(tmp_path))
+
+    np.testing.assert_array_equal(trace.get_array(), make_reference(blocks))
+    assert trace.array is None
+    assert any(isinstance(x, str) for x in trace.chunks)
+
+
+LAYERS = [['Conv1', 14, 14, 3, 3, 4, 8, 1, '', ''],
+          ['Conv2', 12, 12, 3, 3, 8, 16, 1, '', '']]
+
+
+#
+@pytest.fixture(params=['USER', 'CALC'])
+def bandwidth_mode(request):
+    """
+    Fixture running a test with the read buffers of both bandwidth modes.
+    """
+    return request.param
+
+
+#
+@pytest.mark.parametrize('bounded_memory', ['false', 'true'])
+def test_spilled_run_gives_identical_files(tmp_path, dataflow, bandwidth_mode, bounded_memory,
+                                           monkeypatch):
+    """
+    A run spilling its traces to the disk writes the same reports and traces as a regular run,
+    and does not leave the spilled files behind.
+    """
+    original_init = trace_array.__init__
+    original_merge = trace_array.merge_pending
+    num_spilled_chunks = []
+
+    def small_chunks_init(self, pad_value=None, chunk_rows=2 ** 16, spill_dir=None):
+        if spill_dir is not None:
+            chunk_rows = 16
+        original_init(self, pad_value=pad_value, chunk_rows=chunk_rows, spill_dir=spill_dir)
+
+    def counting_merge(self):
+        num_chunks = len(self.chunks)
+        original_merge(self)
+        num_spilled_chunks.extend(x for x in self.chunks[num_chunks:] if isinstance(x, str))
+    monkeypatch.setattr(trace_array, '__init__', small_chunks_init)
+    monkeypatch.setattr(trace_array, 'merge_pending', counting_merge)
+
+    topo_path = write_conv_topology(tmp_path / 'topo.csv', LAYERS)
+    normal_result, normal_dir = run_to_dir(small_config('spill', dataflow, bandwidth_mode),
+                                           topo_path, tmp_path / 'normal', num_workers=1)
+    assert len(num_spilled_chunks) == 0
+
+    spill_config = small_config('spill', dataflow, bandwidth_mode,
+                                SpillTraces='true', BoundedMemory=bounded_memory)
+    spill_result, spill_dir = run_to_dir(spill_config, topo_path, tmp_path / 'spilled',
+                                         num_workers=1)
+    gc.collect()
+    assert len(num_spilled_chunks) > 0
+
+    assert spill_result.get_total_cycles() == normal_result.get_total_cycles()
+    normal_files = read_run_files(normal_dir)
+    spill_files = read_run_files(spill_dir)
+    assert sorted(spill_files) == sorted(normal_files)
+    for file_name, contents in normal_files.items():
+        assert spill_files[file_name] == contents, file_name
+    assert not os.path.isdir(os.path.join(spill_dir, 'trace_spill')) \
+        or os.listdir(os.path.join(spill_dir, 'trace_spill')) == []